@@ -1,24 +1,172 @@
-from django.contrib import admin
-from .models import Habit, Progress
+import json
+from datetime import timedelta
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import Habit, HabitStats, Pause, Progress
+from .stats import compute_habit_stats
+from .status import get_pauses_cache_key
+from .versions import bump_habits_versions
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts large changelists from the Postgres planner's
+    row estimate instead of an exact `COUNT(*)`, which scans every row.
+
+    Results the planner estimates at fewer than EXACT_COUNT_LIMIT rows are
+    counted exactly, since that's cheap, so small filtered lists stay exact.
+    Other databases always count exactly.
+    """
+
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        # psycopg2 decodes the json column, other drivers may not
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate < self.EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+
+class PauseInline(admin.TabularInline):
+    model = Pause
+    extra = 0
+    fields = ['start', 'end']
 
 
 @admin.register(Habit)
 class HabitAdmin(admin.ModelAdmin):
-    # Displayed columns
+    # Displayed columns, with their users fetched in the same query
     list_display = ['id', 'user', 'name', 'slug', 'description']
-    # Column filters
-    list_filter = ['user']
+    list_select_related = ['user']
+    # Search rather than list every user in the sidebar
+    search_fields = ['name', 'slug', 'user__username']
     # Editable fields
     fields = ['id', 'user', 'name', 'slug', 'description']
+    autocomplete_fields = ['user']
     # Prepopulate slug field based on name
     prepopulated_fields = {'slug': ('name',)}
     # Order habits by user then name by default
     ordering = ['user', 'name']
+    inlines = [PauseInline]
+    # Estimated counts, without the extra count of the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['pause_habits', 'resume_habits']
+
+    @admin.action(description='Pause selected habits from today')
+    def pause_habits(self, request, queryset):
+        """
+        Pauses the selected habits that aren't paused today with a single
+        bulk insert of open-ended pauses.
+        """
+
+        today = timezone.localdate()
+        paused = Pause.objects.filter(
+            Q(end__isnull=True) | Q(end__gte=today),
+            start__lte=today
+        ).values('habit_id')
+        habits = list(queryset.exclude(id__in=paused).only('id', 'user_id'))
+        Pause.objects.bulk_create(Pause(habit=habit, start=today) for habit in habits)
+        self.pauses_changed(habits)
+        self.message_user(request, f'Paused {len(habits)} habits.', messages.SUCCESS)
+
+    @admin.action(description='Resume selected habits from today')
+    def resume_habits(self, request, queryset):
+        """
+        Ends the open-ended pauses of the selected habits yesterday with a
+        single update, and drops those starting today or later, like
+        `Habit.resume()`.
+        """
+
+        today = timezone.localdate()
+        pauses = Pause.objects.filter(habit__in=queryset, end__isnull=True)
+        habits = list(Habit.objects.filter(id__in=pauses.values('habit_id')).only('id', 'user_id'))
+        with transaction.atomic():
+            pauses.filter(start__gte=today).delete()
+            pauses.update(end=today - timedelta(days=1))
+        self.pauses_changed(habits)
+        self.message_user(request, f'Resumed {len(habits)} habits.', messages.SUCCESS)
+
+    def pauses_changed(self, habits):
+        """
+        Does what the pause signals would, which bulk writes don't send.
+        """
+
+        cache.delete_many([get_pauses_cache_key(habit.id) for habit in habits])
+        bump_habits_versions(habits)
 
 
 @admin.register(Progress)
 class ProgressAdmin(admin.ModelAdmin):
-    # Displayed columns
+    # Displayed columns, with their habits fetched in the same query
     list_display = ['id', 'habit', 'date', 'completed']
-    # Column filters
-    list_filter = ['habit', 'date', 'completed']
+    list_select_related = ['habit']
+    # Column filters. Habits are searched for, rather than listed
+    # in the sidebar, and dates are navigated by year, month and day.
+    list_filter = ['completed']
+    date_hierarchy = 'date'
+    search_fields = ['=habit__slug', '=habit__user__username']
+    search_help_text = 'Exact habit slug or username.'
+    autocomplete_fields = ['habit']
+    # Latest first, from the (date, habit) index
+    ordering = ['-date', 'habit_id']
+    # Estimated counts, without the extra count of the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_completed', 'mark_not_completed']
+
+    @admin.action(description='Mark selected days completed')
+    def mark_completed(self, request, queryset):
+        self.set_completed(request, queryset, True)
+
+    @admin.action(description='Mark selected days not completed')
+    def mark_not_completed(self, request, queryset):
+        self.set_completed(request, queryset, False)
+
+    def set_completed(self, request, queryset, completed):
+        """
+        Sets the completion status of the selected days, e.g. a date range
+        picked with the date hierarchy, with a single UPDATE of the rows that
+        change, then rebuilds the affected habits' stats from their history
+        (a query per habit, not per row).
+        """
+
+        queryset = queryset.exclude(completed=completed).order_by()
+        habits = list(
+            Habit.objects.filter(id__in=queryset.values('habit_id'))
+            .select_related('stats')
+        )
+        with transaction.atomic():
+            updated = queryset.update(completed=completed)
+            stats = [
+                compute_habit_stats(habit, tracked_since=habit.stats.tracked_since)
+                for habit in habits
+                # Habits without stats build them on their next read
+                if hasattr(habit, 'stats')
+            ]
+            HabitStats.objects.bulk_update(
+                stats,
+                ['completed_days', 'longest_streak', 'run_lengths',
+                 'streak_start', 'streak_end', 'recent_mask', 'recent_end']
+            )
+        # Bulk writes don't send model signals
+        bump_habits_versions(habits)
+        self.message_user(request, f'Updated {updated} days.', messages.SUCCESS)
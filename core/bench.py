@@ -0,0 +1,156 @@
+import io
+import random
+import time
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .calendars import HabitHTMLCalendar
+from .models import Habit, HabitStats, Progress
+from .stats import compute_habit_stats
+from .storage import BitmapProgressStore, get_progress_store
+
+
+# Committed query budgets, per view, for one request with a cold cache
+# (the in-process habit cache stays warm, as it is during toggle bursts).
+# A view going over its budget fails `manage.py bench` and the test suite.
+# Counts include transaction control statements (BEGIN, SAVEPOINT, ...),
+# and the pause intervals query, which is served by the cache once warm.
+QUERY_BUDGETS = {
+    'homepage': 6,
+    'toggleboard': 6,
+    'habit': 5,
+    'toggle_habit': 4,
+    'toggle_habit_post': 15,
+    'calendar': 2,
+}
+
+
+def seed(users=10, habits=9, days=365, completion_rate=0.6, seed=0, prefix='bench-user'):
+    """
+    Seeds `users` x `habits` x `days` Progress rows with bulk inserts,
+    ending today, and returns the first user.
+
+    - Completions are random, with a fixed seed so runs are comparable.
+    - The first user's HabitStats are built, as they would be in production.
+    """
+
+    rng = random.Random(seed)
+    today = date.today()
+
+    User.objects.bulk_create(
+        User(username=f'{prefix}-{i}') for i in range(users)
+    )
+    bench_users = User.objects.filter(username__startswith=f'{prefix}-')
+    Habit.objects.bulk_create(
+        Habit(user=user,
+              slug=f'{user.username}-habit-{i}',
+              name=f'Habit {i}',
+              weekly_rate=rng.randint(1, 7))
+        for user in bench_users
+        for i in range(habits)
+    )
+
+    # Insert Progress rows in batches, so memory stays flat for large seeds
+    batch = []
+    for habit_id in Habit.objects.filter(user__in=bench_users).values_list('id', flat=True):
+        for offset in range(days):
+            batch.append(Progress(habit_id=habit_id,
+                                  date=today - timedelta(days=offset),
+                                  completed=rng.random() < completion_rate))
+            if len(batch) >= 10000:
+                Progress.objects.bulk_create(batch)
+                batch = []
+    Progress.objects.bulk_create(batch)
+
+    if isinstance(get_progress_store(), BitmapProgressStore):
+        call_command('backfill_progress_years', stdout=io.StringIO())
+
+    user = bench_users.order_by('id').first()
+    HabitStats.objects.bulk_create(
+        compute_habit_stats(habit) for habit in Habit.objects.filter(user=user)
+    )
+    return user
+
+
+def measure(function, repeat):
+    """
+    Calls `function` `repeat` times with a cold cache, and returns the
+    query count of the first call and the median wall time in milliseconds.
+    """
+
+    timings = []
+    queries = None
+    for i in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        if queries is None:
+            queries = len(context.captured_queries)
+    timings.sort()
+    return {'queries': queries, 'time_ms': round(timings[len(timings) // 2], 3)}
+
+
+def run_benchmarks(user, repeat=20):
+    """
+    Times the hot views through the test client as `user`, and calendar
+    rendering on its own. Returns a mapping of benchmark name to its
+    query count and median wall time.
+    """
+
+    client = Client()
+    client.force_login(user)
+    habit = Habit.objects.filter(user=user).order_by('id').first()
+    today = date.today()
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+
+    def post(url):
+        response = client.post(url)
+        assert response.status_code == 200, (url, response.status_code)
+
+    toggle_url = reverse('core:toggle_habit', args=[habit.slug, today])
+    benchmarks = {
+        'homepage': lambda: get(reverse('core:homepage')),
+        'toggleboard': lambda: get(reverse('core:toggleboard')),
+        'habit': lambda: get(reverse('core:habit', args=[habit.slug])),
+        'toggle_habit': lambda: get(toggle_url),
+        'toggle_habit_post': lambda: post(toggle_url),
+        'calendar': lambda: HabitHTMLCalendar(habit).formatmonth(today.year, today.month),
+    }
+
+    # Warm up connections, templates and the session before measuring
+    for function in benchmarks.values():
+        function()
+
+    return {name: measure(function, repeat) for name, function in benchmarks.items()}
+
+
+def check_results(results, baseline=None, tolerance=0.25):
+    """
+    Returns a list of failures: benchmarks over their query budget, or whose
+    wall time regressed by more than `tolerance` against the baseline.
+    """
+
+    failures = []
+    for name, result in results.items():
+        budget = QUERY_BUDGETS.get(name)
+        if budget is not None and result['queries'] > budget:
+            failures.append(f'{name}: {result["queries"]} queries, budget is {budget}')
+
+        if baseline and name in baseline:
+            limit = baseline[name]['time_ms'] * (1 + tolerance)
+            if result['time_ms'] > limit:
+                failures.append(
+                    f'{name}: {result["time_ms"]:.2f} ms, baseline is '
+                    f'{baseline[name]["time_ms"]:.2f} ms (+{tolerance:.0%} allowed)'
+                )
+    return failures
@@ -1,5 +1,13 @@
 import calendar
-from datetime import date
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils import timezone
+from .status import STATUS_COLOR_MAP, StatusEngine, week_start
+from .storage import get_progress_store
+from .timing import timed
+from .versions import aget_habit_version, aget_user_version, get_habit_version, get_user_version
 
 
 class CustomHTMLCalendar(calendar.HTMLCalendar):
@@ -9,8 +17,12 @@ class CustomHTMLCalendar(calendar.HTMLCalendar):
     A custom HTML calendar class subclassed by all other custom HTML calendars.
 
     - Highlights today's date.
+    - Caches rendered months (see `get_cache_key()`).
     """
 
+    # Prefix of the fragment cache keys for this calendar class
+    cache_prefix = 'calendar'
+
     def __init__(self):
         super().__init__()
         self.today = date.today()
@@ -21,12 +33,100 @@ class CustomHTMLCalendar(calendar.HTMLCalendar):
         store the values for the year and month in the calendar instance,
         so that they're accesseible to the other formatting methods below.
 
-        Then call the parent class's `formatmonth()` method to generate
-        the HTML table calendar as usual.
+        Then return the cached HTML table calendar for the month,
+        or call `rendermonth()` to generate it and cache it.
         """
         self.year, self.month = year, month
+
+        key = self.get_cache_key(year, month, withyear)
+        html_calendar = cache.get(key)
+        if html_calendar is None:
+            with timed('calendar'):
+                html_calendar = self.rendermonth(year, month, withyear)
+            cache.set(key, html_calendar, self.get_cache_timeout(year, month))
+        return html_calendar
+
+    async def aformatmonth(self, year, month, withyear=True):
+        """
+        Async version of `formatmonth()`, safe to call from async views.
+
+        Uses the cache's async API, and loads the month's data with the
+        async ORM in `aprepare()` so that `rendermonth()` runs from memory.
+        """
+        self.year, self.month = year, month
+
+        key = self.get_cache_key(year, month, withyear,
+                                 await self.aget_cache_key_parts())
+        html_calendar = await cache.aget(key)
+        if html_calendar is None:
+            with timed('calendar'):
+                await self.aprepare(year, month)
+                html_calendar = self.rendermonth(year, month, withyear)
+            await cache.aset(key, html_calendar, self.get_cache_timeout(year, month))
+        return html_calendar
+
+    async def aprepare(self, year, month):
+        """
+        Loads any data `rendermonth()` needs with the async ORM.
+        Plain calendars don't need any.
+        """
+
+        pass
+
+    def rendermonth(self, year, month, withyear=True):
+        """
+        Calls the parent class's `formatmonth()` method to generate
+        the HTML table calendar as usual.
+        """
+
         return super().formatmonth(year, month, withyear)
 
+    def get_cache_key_parts(self):
+        """
+        Returns the values that identify the data rendered by this calendar,
+        in addition to the month. Subclasses extend this with the user, habit
+        and version of the data they render.
+        """
+
+        return []
+
+    async def aget_cache_key_parts(self):
+        """
+        Async version of `get_cache_key_parts()`.
+        """
+
+        return self.get_cache_key_parts()
+
+    def get_cache_key(self, year, month, withyear=True, parts=None):
+        """
+        Returns the fragment cache key for a month.
+
+        The current month's key also includes today's date, since the
+        "today" highlight (and whether a day counts as missed) moves at
+        midnight. Every other month renders the same way until its data
+        changes, which changes its version.
+        """
+
+        if parts is None:
+            parts = self.get_cache_key_parts()
+        parts = [self.cache_prefix, *parts, year, month, int(withyear)]
+        if (year, month) == (self.today.year, self.today.month):
+            parts.append(self.today.isoformat())
+        return ':'.join(str(part) for part in parts)
+
+    def get_cache_timeout(self, year, month):
+        """
+        Returns the number of seconds to cache a month for: until midnight
+        for the current month, `CALENDAR_CACHE_TIMEOUT` for every other month.
+        """
+
+        if (year, month) == (self.today.year, self.today.month):
+            midnight = timezone.make_aware(
+                datetime.combine(self.today + timedelta(days=1), time.min)
+            )
+            return max(int((midnight - timezone.now()).total_seconds()), 1)
+        return getattr(settings, 'CALENDAR_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
     def formatmonthname(self, year, month, withyear=True):
         """
         Overrides the parent class's `formatmonthname()` method in order to
@@ -61,6 +161,130 @@ class CustomHTMLCalendar(calendar.HTMLCalendar):
             return f'<td class="{self.cssclasses[weekday]}">{day}</td>'
 
 
+class MasterHTMLCalendar(CustomHTMLCalendar):
+    """
+    Master calendar
+
+    A custom HTML calendar class that reflects the user's overall progress
+    over time, across all of their habits, on the homepage.
+
+    - Days up to today are shaded by the fraction of the user's habits
+      completed on them, from `heat-0` (none) to `heat-{HEAT_LEVELS}` (all).
+      Habits paused on a day don't count towards it, whether or not they
+      were completed.
+    - The month's completions come from a single aggregate query of each
+      habit's weekly masks (see `ProgressStore.get_week_masks()`), so
+      rendering costs the same number of queries however many habits
+      the user has.
+    """
+
+    cache_prefix = 'master'
+
+    # Number of shades of completed days
+    HEAT_LEVELS = 4
+
+    def __init__(self, user, habits, engine=None):
+        super().__init__()
+        self.user = user
+        self.habits = habits
+        self.engine = engine
+        self.weeks = None
+
+    def get_cache_key_parts(self):
+        """
+        Cached months are keyed by the user and the user's version, which is
+        bumped on every write to their habits, pauses and progress.
+        """
+
+        return [self.user.id, get_user_version(self.user.id)]
+
+    async def aget_cache_key_parts(self):
+        return [self.user.id, await aget_user_version(self.user.id)]
+
+    def get_engine(self):
+        """
+        Returns the StatusEngine passed in, or one over the user's habits,
+        used for their pauses.
+        """
+
+        if self.engine is None:
+            self.engine = StatusEngine(self.habits, self.today)
+        return self.engine
+
+    def get_month_range(self, year, month):
+        """
+        Returns the Monday of the month's first week, and the month's
+        last day, the range of the month's weekly masks.
+        """
+
+        return (week_start(date(year, month, 1)),
+                date(year, month, calendar.monthrange(year, month)[1]))
+
+    async def aprepare(self, year, month):
+        """
+        Loads the month's weekly masks and the habits' pauses
+        with the async ORM.
+        """
+
+        self.weeks = await get_progress_store().aget_week_masks(
+            [habit.id for habit in self.habits],
+            *self.get_month_range(year, month)
+        )
+        await self.get_engine().aload_pauses()
+
+    def rendermonth(self, year, month, withyear=True):
+        """
+        Loads the habits' completions for the month with a single aggregate
+        query (unless `aprepare()` did), before formatting it. `formatday()`
+        then only does dictionary lookups.
+        """
+
+        if self.weeks is None:
+            self.weeks = get_progress_store().get_week_masks(
+                [habit.id for habit in self.habits],
+                *self.get_month_range(year, month)
+            )
+
+        return super().rendermonth(year, month, withyear)
+
+    def get_heat_level(self, completed, total):
+        """
+        Returns the shade of a day with `completed` of `total` habits
+        completed, rounded up so any completion shows.
+        """
+
+        if not total:
+            return 0
+        return -(-min(completed, total) * self.HEAT_LEVELS // total)
+
+    def formatday(self, day, weekday):
+        """
+        Overrides the parent class's `formatday()` method in order to
+        shade days up to today by the fraction of habits completed.
+        """
+
+        day_cell = super().formatday(day, weekday)
+
+        this_date = date(self.year, self.month, day) if day else None
+        if this_date is None or this_date > self.today:
+            return day_cell
+
+        engine = self.get_engine()
+        monday = week_start(this_date)
+        unpaused = [habit for habit in self.habits if not engine.is_paused(habit.id, this_date)]
+        total = len(unpaused)
+        completed = sum(
+            self.weeks.get((habit.id, monday), 0) >> this_date.weekday() & 1
+            for habit in unpaused
+        )
+        level = self.get_heat_level(completed, total)
+        return day_cell.replace(
+            '">',
+            f' heat-{level}" title="{completed} of {total} habits completed">',
+            1
+        )
+
+
 class HabitHTMLCalendar(CustomHTMLCalendar):
     """
     Habit calendar
@@ -72,6 +296,72 @@ class HabitHTMLCalendar(CustomHTMLCalendar):
       to update the habit's completion status for that date.
     """
 
+    def __init__(self, habit, engine=None):
+        super().__init__()
+        self.habit = habit
+        self.engine = engine
+
+    def get_cache_key_parts(self):
+        """
+        Cached months are keyed by the habit's user, the habit, and the
+        habit's version, which is bumped on every write to its progress.
+        The weekly rate is keyed too: the habit may come from this process's
+        habit cache (see `core.resolver`), which can still hold the previous
+        rate for a while after another process changed it and bumped
+        the version.
+        """
+
+        return [self.habit.user_id, self.habit.id, self.habit.weekly_rate,
+                get_habit_version(self.habit.id)]
+
+    async def aget_cache_key_parts(self):
+        return [self.habit.user_id, self.habit.id, self.habit.weekly_rate,
+                await aget_habit_version(self.habit.id)]
+
+    def get_engine(self, year, month):
+        """
+        Returns the StatusEngine passed in, or one covering every day
+        visible in the month.
+        """
+
+        if self.engine is None:
+            weeks = self.monthdatescalendar(year, month)
+            self.engine = StatusEngine([self.habit], weeks[0][0], weeks[-1][-1])
+        return self.engine
+
+    async def aprepare(self, year, month):
+        """
+        Loads the month's completions with the async ORM.
+        """
+
+        await self.get_engine(year, month).aload()
+
+    def rendermonth(self, year, month, withyear=True):
+        """
+        Loads the completion statuses for every day visible in the month,
+        including padding days from neighboring months, before formatting it.
+
+        - The habit's completions for the visible weeks are fetched with a
+          single `StatusEngine` query (unless an engine covering them was
+          passed in), then resolved into a date-keyed map of colors, counting
+          each week's completions once.
+        - `formatday()` then only does dictionary lookups, so rendering costs
+          the same number of queries whichever month is shown.
+        """
+
+        weeks = self.monthdatescalendar(year, month)
+        statuses = self.get_engine(year, month).get_statuses(
+            self.habit,
+            [day for week in weeks for day in week]
+        )
+        self.colors = {
+            day: STATUS_COLOR_MAP.get(status, 'gray')
+            for day, status in statuses.items()
+        }
+        self.toggler_template = get_template('core/habit_toggler.html')
+
+        return super().rendermonth(year, month, withyear)
+
     def formatday(self, day, weekday):
         """
         Overrides the parent class's `formatday()` method in order to
@@ -83,9 +373,15 @@ class HabitHTMLCalendar(CustomHTMLCalendar):
         # to maintain the highlighting of today's date
         day_cell = super().formatday(day, weekday)
 
-        # TODO:
-        # Implement logic for determining completion status
-        # Modify day_cell to include bg color attribute based on completion
-        # Add HTML for toggler inside <td>
+        if day == 0:
+            return day_cell
 
-        return day_cell
+        # Look up the day's color in the preloaded map
+        # and render a toggler for it inside the <td>
+        this_date = date(self.year, self.month, day)
+        toggler = self.toggler_template.render({
+            'habit': self.habit,
+            'progress': {'date': this_date, 'color': self.colors[this_date]},
+            'label': day,
+        })
+        return day_cell.replace(f'>{day}</td>', f'>{toggler}</td>', 1)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.utils.module_loading import import_string
+
+# Cache backends whose entries are only visible to the process that set them
+PROCESS_LOCAL_CACHES = ['django.core.cache.backends.locmem.LocMemCache']
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Checks that the default cache is shared by every process.
+
+    Cached fragments, snapshots and ETags are invalidated by bumping version
+    counters in the cache (see `core.versions`). With a per-process cache,
+    a write served by one worker leaves the others serving stale pages.
+    """
+
+    backend = import_string(settings.CACHES['default']['BACKEND'])
+    if any(issubclass(backend, import_string(path)) for path in PROCESS_LOCAL_CACHES):
+        return [Error(
+            'The default cache is local to each process, so cached pages '
+            'are never invalidated in other worker processes.',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, e.g. '
+                 'django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379.',
+            id='core.E001',
+        )]
+    return []
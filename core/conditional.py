@@ -0,0 +1,116 @@
+import hashlib
+from datetime import date, datetime, time
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def get_page_state(request, version, modified, *parts):
+    """
+    Returns the (ETag, Last-Modified timestamp) of a page rendered from data
+    at `version`, last changed at `modified`, or None if it can't be
+    validated.
+
+    Besides the version and any other `parts`, the ETag covers what every
+    page depends on: the user, the URL, whether the request is an htmx one
+    (partial or full page), today's date, since statuses move at midnight,
+    and the CSRF cookie, since pages embed a CSRF token. Clients without
+    a CSRF cookie yet get None, as their page would carry a new token.
+    """
+
+    csrf_secret = request.META.get('CSRF_COOKIE')
+    if not csrf_secret:
+        return None
+
+    today = date.today()
+    key = repr((
+        request.user.id,
+        request.get_full_path(),
+        bool(request.htmx),
+        today.isoformat(),
+        csrf_secret,
+        version,
+        *parts,
+    ))
+    etag = f'W/"{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()}"'
+
+    # Pages also change at midnight, whatever their data
+    midnight = timezone.make_aware(datetime.combine(today, time.min))
+    return etag, int(max(modified, midnight.timestamp()))
+
+
+def get_cache_control(request):
+    """
+    Returns the Cache-Control directives of a month page.
+
+    Months in the past are cached for `PAST_MONTH_MAX_AGE` seconds, so
+    history navigation can reuse them. The current month is always
+    revalidated, which is a 304 when nothing changed.
+    """
+
+    today = date.today()
+    try:
+        month = (int(request.GET.get('year', today.year)),
+                 int(request.GET.get('month', today.month)))
+    except ValueError:
+        month = (today.year, today.month)
+    if month < (today.year, today.month):
+        return {'private': True, 'max_age': getattr(settings, 'PAST_MONTH_MAX_AGE', 300)}
+    return {'private': True, 'no_cache': True}
+
+
+def conditional_page(get_state):
+    """
+    Decorator for conditional GETs of month pages (homepage, habit page).
+
+    `get_state(request, *args, **kwargs)` returns the page's
+    `get_page_state()`, or None, and is async for async views. When the
+    request's `If-None-Match` or `If-Modified-Since` still matches, returns
+    a 304 without running the view. Otherwise runs it, and adds the ETag,
+    Last-Modified and Cache-Control headers to its response.
+    """
+
+    def get_response(request, state):
+        if state is None:
+            return None
+        etag, last_modified = state
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def process_response(request, response, state):
+        patch_vary_headers(response, ['HX-Request'])
+        if response.status_code not in (200, 304):
+            return response
+        patch_cache_control(response, **get_cache_control(request))
+        if state is not None:
+            etag, last_modified = state
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                state = await get_state(request, *args, **kwargs)
+                response = get_response(request, state)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return process_response(request, response, state)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(request, *args, **kwargs)
+                state = get_state(request, *args, **kwargs)
+                response = get_response(request, state)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return process_response(request, response, state)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,10 @@
+from .events import streams_events
+
+
+def events(request):
+    """
+    Adds `live_updates`, whether pages should open the user's event stream
+    (see `core.views.events`).
+    """
+
+    return {'live_updates': streams_events(request)}
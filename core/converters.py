@@ -0,0 +1,16 @@
+from datetime import date
+
+
+class DateConverter:
+    """
+    A path converter that matches ISO formatted dates (YYYY-MM-DD)
+    and converts them to `datetime.date` objects.
+    """
+
+    regex = r'\d{4}-\d{2}-\d{2}'
+
+    def to_python(self, value):
+        return date.fromisoformat(value)
+
+    def to_url(self, value):
+        return value.isoformat() if isinstance(value, date) else value
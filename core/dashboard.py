@@ -0,0 +1,105 @@
+from datetime import date, datetime, time, timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from .calendars import MasterHTMLCalendar
+from .models import Habit
+from .status import StatusEngine
+from .versions import aget_user_version, get_user_version, get_user_version_key
+
+
+def get_cache_keys(user_id, year, month, today):
+    """
+    Returns the cache keys of a user's version counter and of their
+    dashboard snapshot for a month. Snapshots are per day, since statuses
+    (and the calendar's "today" highlight) move at midnight.
+    """
+
+    return (
+        get_user_version_key(user_id),
+        f'dashboard:{user_id}:{year}:{month}:{today.isoformat()}',
+    )
+
+
+def get_cache_timeout(today):
+    """
+    Returns the number of seconds until midnight, after which
+    today's snapshots are never read again.
+    """
+
+    midnight = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+    return max(int((midnight - timezone.now()).total_seconds()), 1)
+
+
+def build_dashboard(habits, engine, html_calendar, today):
+    """
+    Returns a dashboard snapshot: the user's habits, today's status of each
+    habit, and the month's calendar HTML.
+    """
+
+    return {
+        'habits': habits,
+        'progress': [
+            {
+                'habit': habit,
+                'date': today,
+                'completed': engine.is_completed(habit.id, today),
+                'color': engine.get_color(habit, today),
+            }
+            for habit in habits
+        ],
+        'html_calendar': html_calendar,
+    }
+
+
+def get_dashboard(user, year, month):
+    """
+    Returns the user's dashboard snapshot for a month, from the cache
+    when it's still current.
+
+    Snapshots are stored with the user's version, which is bumped on every
+    write to their habits or progress, so a cached snapshot is current if
+    its version matches. The version and snapshot are read together in
+    a single cache round trip.
+    """
+
+    today = date.today()
+    version_key, key = get_cache_keys(user.id, year, month, today)
+    cached = cache.get_many([version_key, key])
+    version = cached.get(version_key)
+    if version is None:
+        version = get_user_version(user.id)
+    snapshot = cached.get(key)
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot['dashboard']
+
+    habits = list(Habit.objects.filter(user=user))
+    # Resolve today's statuses for every habit with a single query
+    engine = StatusEngine(habits, today)
+    html_calendar = MasterHTMLCalendar(user, habits, engine).formatmonth(year, month)
+    dashboard = build_dashboard(habits, engine, html_calendar, today)
+    cache.set(key, {'version': version, 'dashboard': dashboard}, get_cache_timeout(today))
+    return dashboard
+
+
+async def aget_dashboard(user, year, month):
+    """
+    Async version of `get_dashboard()`, using the async ORM and cache API.
+    """
+
+    today = date.today()
+    version_key, key = get_cache_keys(user.id, year, month, today)
+    cached = await cache.aget_many([version_key, key])
+    version = cached.get(version_key)
+    if version is None:
+        version = await aget_user_version(user.id)
+    snapshot = cached.get(key)
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot['dashboard']
+
+    habits = [habit async for habit in Habit.objects.filter(user=user)]
+    engine = StatusEngine(habits, today)
+    await engine.aload()
+    html_calendar = await MasterHTMLCalendar(user, habits, engine).aformatmonth(year, month)
+    dashboard = build_dashboard(habits, engine, html_calendar, today)
+    await cache.aset(key, {'version': version, 'dashboard': dashboard}, get_cache_timeout(today))
+    return dashboard
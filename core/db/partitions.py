@@ -0,0 +1,119 @@
+from datetime import date
+from django.db import connection, transaction
+from ..models import Progress
+
+
+# Partitioned table, and its partition for dates without a yearly partition
+TABLE = Progress._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def get_partition_name(year):
+    """
+    Returns the name of the Progress partition holding a year.
+    """
+
+    return f'{TABLE}_y{year}'
+
+
+def is_partitioned():
+    """
+    Returns True if the Progress table is partitioned (Postgres only).
+    """
+
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def get_partitions():
+    """
+    Returns the names of the yearly Progress partitions, by year.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.oid = to_regclass(%s)',
+            [TABLE]
+        )
+        names = [name for name, in cursor.fetchall()]
+    prefix = get_partition_name('')
+    return {
+        int(name[len(prefix):]): name
+        for name in names
+        if name.startswith(prefix) and name[len(prefix):].isdigit()
+    }
+
+
+def create_partition(year):
+    """
+    Creates the Progress partition of a year.
+
+    Rows of the year already caught by the default partition (e.g. imported
+    history) are moved into it, since a partition can't be attached while
+    the default partition holds rows of its range.
+    """
+
+    quote = connection.ops.quote_name
+    name = get_partition_name(year)
+    bounds = [date(year, 1, 1), date(year + 1, 1, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} '
+            f'WHERE date >= %s AND date < %s RETURNING *) '
+            f'INSERT INTO {quote(name)} SELECT * FROM moved',
+            bounds
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+            bounds
+        )
+    return name
+
+
+def detach_partition(year):
+    """
+    Detaches the Progress partition of a year, keeping its rows in a table
+    of the same name, e.g. to dump it before dropping it.
+    """
+
+    quote = connection.ops.quote_name
+    name = get_partition_name(year)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}')
+    return name
+
+
+def drop_partition(year):
+    """
+    Drops the partition table of a year, attached or detached, if any.
+    """
+
+    quote = connection.ops.quote_name
+    name = get_partition_name(year)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {quote(name)}')
+    return name
+
+
+def delete_rows(year):
+    """
+    Deletes the Progress rows of a year in a single statement, without
+    loading them for the delete signals, and returns their number. Once the
+    year's partition is detached, that's the rows of the default partition.
+    """
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(TABLE)} WHERE date >= %s AND date < %s',
+            [date(year, 1, 1), date(year + 1, 1, 1)]
+        )
+        return cursor.rowcount
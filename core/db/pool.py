@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import deque
+from django.db import OperationalError
+
+
+# Transaction statuses of psycopg2 and psycopg connections (`conn.info`)
+STATUS_IDLE = 0
+STATUS_UNKNOWN = 4
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no connection becomes available within the pool's timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Connection pool
+
+    A thread-safe pool of open database connections, shared by every thread
+    (and, under ASGI, every sync_to_async worker) of a process.
+
+    - Keeps at least `min_size` connections open, and opens at most
+      `max_size`. Once they're all in use, checkouts wait up to `timeout`
+      seconds for one to be returned.
+    - Connections idle for more than `idle_timeout` seconds are closed,
+      down to `min_size`.
+    - With `health_checks`, idle connections are pinged before being handed
+      out, and replaced if the ping fails.
+    - Connections are returned rolled back, or discarded if they're broken.
+    - `stats_hook`, if set, is called after every checkout with the pool's
+      `stats()` and the checkout's wait time in seconds.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, idle_timeout=300,
+                 health_checks=True, timeout=30, stats_hook=None):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1.')
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_checks = health_checks
+        self.timeout = timeout
+        self.stats_hook = stats_hook
+
+        self.condition = threading.Condition()
+        # Idle connections with the time they were returned, most recent last
+        self.idle = deque()
+        self.size = 0
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'timeouts': 0,
+            'opened': 0,
+            'closed': 0,
+        }
+
+        for i in range(min_size):
+            self.size += 1
+            self.counters['opened'] += 1
+            self.idle.append((self.connect(), time.monotonic()))
+
+    def getconn(self):
+        """
+        Checks a connection out of the pool, opening a new one if none is
+        idle and the pool isn't full, or waiting for one otherwise.
+        """
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self.condition:
+                self.close_expired()
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No database connection available within {self.timeout}s '
+                            f'(pool of {self.max_size}).'
+                        )
+                    waited = True
+                    self.condition.wait(remaining)
+                if self.idle:
+                    conn, returned = self.idle.pop()
+                else:
+                    # Reserve a slot, and connect outside of the lock
+                    conn = None
+                    self.size += 1
+
+            if conn is None:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    self.release_slot()
+                    raise
+                with self.condition:
+                    self.counters['opened'] += 1
+            elif not self.is_healthy(conn):
+                self.discard(conn)
+                continue
+            break
+
+        wait_time = time.monotonic() - started
+        with self.condition:
+            self.counters['checkouts'] += 1
+            if waited:
+                self.counters['waits'] += 1
+            self.counters['wait_time'] += wait_time
+            self.counters['max_wait_time'] = max(self.counters['max_wait_time'], wait_time)
+        if self.stats_hook is not None:
+            self.stats_hook(self.stats(), wait_time)
+        return conn
+
+    def putconn(self, conn):
+        """
+        Returns a checked out connection to the pool, rolling back any
+        transaction left open, or discards it if it's broken.
+        """
+
+        try:
+            if conn.closed or conn.info.transaction_status == STATUS_UNKNOWN:
+                raise OperationalError
+            if conn.info.transaction_status != STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+
+        with self.condition:
+            self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    def is_healthy(self, conn):
+        """
+        Returns whether an idle connection can be handed out.
+        """
+
+        if conn.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if conn.info.transaction_status != STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def discard(self, conn):
+        """
+        Closes a connection and frees its slot in the pool.
+        """
+
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.counters['closed'] += 1
+        self.release_slot()
+
+    def release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close_expired(self):
+        """
+        Closes connections idle for longer than `idle_timeout`, keeping at
+        least `min_size` connections open. Must be called with the lock held.
+        """
+
+        now = time.monotonic()
+        # The least recently returned connections are first
+        while self.idle and self.size > self.min_size and now - self.idle[0][1] > self.idle_timeout:
+            conn, returned = self.idle.popleft()
+            self.size -= 1
+            self.counters['closed'] += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close(self):
+        """
+        Closes every idle connection.
+        """
+
+        with self.condition:
+            while self.idle:
+                conn, returned = self.idle.pop()
+                self.size -= 1
+                self.counters['closed'] += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def stats(self):
+        """
+        Returns the pool's current size and usage, and its cumulative counters.
+        `saturation` is the fraction of `max_size` connections in use.
+        """
+
+        with self.condition:
+            in_use = self.size - len(self.idle)
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'saturation': in_use / self.max_size,
+                **self.counters,
+            }
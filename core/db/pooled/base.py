@@ -0,0 +1,93 @@
+import os
+import threading
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.module_loading import import_string
+from ..pool import ConnectionPool
+from .creation import DatabaseCreation
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Pooled PostgreSQL backend
+
+    The PostgreSQL backend, except that connections are checked out of
+    a process-wide `ConnectionPool` per database alias instead of being
+    opened, and returned to it instead of being closed. Requests (WSGI) and
+    sync_to_async workers (ASGI) then skip the TCP and auth handshake.
+
+    Configured by the `POOL` key of the database's settings:
+
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 20,
+            'IDLE_TIMEOUT': 300,  # seconds
+            'HEALTH_CHECKS': True,
+            'TIMEOUT': 30,  # seconds to wait for a free connection
+            'STATS_HOOK': 'core.timing.record_pool_stats',
+        }
+    """
+
+    creation_class = DatabaseCreation
+
+    # Pools by alias and connection parameters, created on first use
+    # in each process
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def get_pool(self, conn_params):
+        """
+        Returns this database's pool, creating it on first use. Pools are
+        never shared across forked processes, nor across databases (e.g. once
+        the test runner points the alias at the test database).
+        """
+
+        key = (self.alias, os.getpid(), repr(sorted(conn_params.items())))
+        pool = self.pools.get(key)
+        if pool is None:
+            with self.pools_lock:
+                pool = self.pools.get(key)
+                if pool is None:
+                    options = self.settings_dict.get('POOL', {})
+                    stats_hook = options.get('STATS_HOOK')
+                    if isinstance(stats_hook, str):
+                        stats_hook = import_string(stats_hook)
+                    alias = self.alias
+                    # Physical connections are set up once, as usual
+                    connect = super().get_new_connection
+                    pool = self.pools[key] = ConnectionPool(
+                        lambda: connect(conn_params),
+                        min_size=options.get('MIN_SIZE', 0),
+                        max_size=options.get('MAX_SIZE', 10),
+                        idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                        health_checks=options.get('HEALTH_CHECKS', True),
+                        timeout=options.get('TIMEOUT', 30),
+                        stats_hook=stats_hook and (
+                            lambda stats, wait_time: stats_hook(alias, stats, wait_time)
+                        ),
+                    )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        # Set by the parent class when connecting, for every connection
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = IsolationLevel(
+            options.get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        self.pool = self.get_pool(conn_params)
+        return self.pool.getconn()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
+
+    def close_pools(self):
+        """
+        Closes the idle connections of every pool of this alias,
+        and forgets the pools.
+        """
+
+        with self.pools_lock:
+            for key in [key for key in self.pools if key[0] == self.alias]:
+                self.pools.pop(key).close()
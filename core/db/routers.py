@@ -0,0 +1,185 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from ..versions import get_modified_key, get_user_version_key
+
+
+# Whether reads in the current context must go to the primary
+_use_primary = ContextVar('use_primary', default=False)
+
+# Cookie pinning a browser to the primary after it wrote
+PIN_COOKIE = 'db_primary'
+
+
+def get_replicas():
+    """
+    Returns the aliases of the read replicas (the `DATABASE_REPLICAS`
+    setting), which may be empty.
+    """
+
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def use_primary():
+    """
+    Sends the reads made within the block to the primary.
+    """
+
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def primary(view):
+    """
+    View decorator sending all of the view's reads to the primary,
+    for views that write, or render what was just written.
+    """
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with use_primary():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with use_primary():
+                return view(request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """
+    Primary/replica router
+
+    Sends every write to the primary (`default`), and reads to a random
+    replica from `DATABASE_REPLICAS`, unless the current request is pinned
+    to the primary (see `ReplicaRoutingMiddleware`, `use_primary()` and
+    `primary()`). Without replicas, everything goes to the primary.
+
+    Replicas mirror the primary, so migrations only run on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or _use_primary.get():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and its replicas hold the same data
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Replica routing middleware
+
+    Decides, for each request, whether its reads may go to a replica or must
+    go to the primary, so users always read their own writes:
+
+    - Unsafe requests (POST, etc.) read from the primary, and pin the
+      browser to the primary for `REPLICA_PIN_SECONDS` with a cookie,
+      so the renders following a write (and the session, after logging in)
+      are never read from a lagging replica.
+    - Requests from users whose data changed in the last
+      `REPLICA_PIN_SECONDS`, from any browser or device, read from the
+      primary too, so nothing stale gets cached under their new version.
+      The time of the last change is recorded with their version (see
+      `core.versions`), at the cost of one cache read.
+
+    Must come after the authentication middleware. Without replicas,
+    the middleware does nothing.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+
+        pinned = self.is_pinned(request)
+        token = _use_primary.set(pinned)
+        try:
+            # The session and user are read from the primary if pinned
+            if not pinned and request.user.is_authenticated:
+                modified = cache.get(self.get_modified_key(request.user.id))
+                _use_primary.set(self.is_recently_modified(modified))
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+
+        pinned = self.is_pinned(request)
+        token = _use_primary.set(pinned)
+        try:
+            # The session and user are read from the primary if pinned
+            user = await request.auser()
+            if not pinned and user.is_authenticated:
+                modified = await cache.aget(self.get_modified_key(user.id))
+                _use_primary.set(self.is_recently_modified(modified))
+            response = await self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.pin(request, response)
+
+    def get_modified_key(self, user_id):
+        return get_modified_key(get_user_version_key(user_id))
+
+    def is_pinned(self, request):
+        """
+        Returns True if the request writes, or its browser wrote recently.
+        """
+
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+
+    def is_recently_modified(self, modified):
+        return modified is not None and time.time() - modified < settings.REPLICA_PIN_SECONDS
+
+    def pin(self, request, response):
+        """
+        Pins the browser to the primary after an unsafe request.
+        """
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(PIN_COOKIE,
+                                '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                secure=settings.SESSION_COOKIE_SECURE,
+                                httponly=True,
+                                samesite='Lax')
+        return response
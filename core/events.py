@@ -0,0 +1,172 @@
+import asyncio
+from abc import ABC, abstractmethod
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+from .models import Progress
+from .status import StatusEngine, week_start
+
+
+class Broker(ABC):
+    """
+    Event broker
+
+    Delivers events to every open event stream of a user.
+    Brokers are pluggable via the `EVENTS_BROKER` setting, e.g. to fan events
+    out across worker processes. Every broker provides:
+
+    - `publish()` - Sends an event to all of a user's subscribers.
+      May be called from any thread.
+    - `subscribe()` - An async iterator over a user's events, yielding None
+      whenever `keepalive` seconds pass without one.
+    - `has_subscribers()` - Whether publishing to a user may reach anyone,
+      so that publishers can skip rendering events nobody will receive.
+    """
+
+    @abstractmethod
+    def publish(self, user_id, event, data):
+        pass
+
+    @abstractmethod
+    async def subscribe(self, user_id, keepalive=None):
+        yield
+
+    def has_subscribers(self, user_id):
+        return True
+
+
+class LocalBroker(Broker):
+    """
+    Local broker
+
+    An in-process pub/sub broker (the default). Only reaches streams served
+    by the same process, so it suits single-process ASGI deployments.
+
+    - Each open stream costs one small bounded queue, and waits on it without
+      holding a thread.
+    - Events published to a full queue are dropped for that stream.
+    """
+
+    # Maximum number of undelivered events per stream
+    QUEUE_SIZE = 16
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def publish(self, user_id, event, data):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self.put, queue, (event, data))
+
+    def put(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def subscribe(self, user_id, keepalive=None):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.QUEUE_SIZE))
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self.lock:
+                self.subscribers[user_id].discard(subscriber)
+                if not self.subscribers[user_id]:
+                    del self.subscribers[user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self.subscribers
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Returns the process-wide broker configured by the `EVENTS_BROKER` setting,
+    defaulting to `LocalBroker`.
+    """
+
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker'))()
+    return _broker
+
+
+def streams_events(request):
+    """
+    Returns True if event streams can be served to the request: under ASGI,
+    or with async views enabled (which implies it). Under WSGI, Django reads
+    an async stream to its end before sending anything, so a stream would
+    hold a worker thread forever and never deliver an event.
+    """
+
+    return settings.ASYNC_VIEWS or isinstance(request, ASGIRequest)
+
+
+def format_event(event, data):
+    """
+    Formats an event as a server-sent event message.
+    """
+
+    lines = ''.join(f'data: {line}\n' for line in data.splitlines() if line.strip())
+    return f'event: {event}\n{lines}\n'
+
+
+def publish_toggles(user_id, cells, whole_weeks=True):
+    """
+    Publishes the togglers affected by completion changes to every open
+    event stream of the user, once the current transaction commits.
+
+    `cells` is a list of (habit, date) pairs that were toggled. Reaching or
+    missing a weekly rate changes the color of the whole week, so by default
+    every day of each toggled week is sent. Callers that know exactly which
+    cells changed color pass them all with `whole_weeks=False`, and only
+    those are sent. Each cell is sent both as a toggleboard toggler and as
+    a calendar cell, as out-of-band fragments.
+    """
+
+    broker = get_broker()
+    if not cells or not broker.has_subscribers(user_id):
+        return
+
+    habits = {habit.id: habit for habit, day in cells}
+    if whole_weeks:
+        days = {
+            (habit.id, week_start(day) + timedelta(days=weekday))
+            for habit, day in cells
+            for weekday in range(7)
+        }
+    else:
+        days = {(habit.id, day) for habit, day in cells}
+    engine = StatusEngine(habits.values(),
+                          min(day for habit_id, day in days),
+                          max(day for habit_id, day in days))
+
+    togglers = []
+    for habit_id, day in sorted(days):
+        progress = Progress(habit=habits[habit_id],
+                            date=day,
+                            completed=engine.is_completed(habit_id, day))
+        engine.bind([progress])
+        for label in ['', day.day]:
+            togglers.append({
+                'habit': habits[habit_id],
+                'progress': progress,
+                'label': label,
+            })
+
+    data = render_to_string('core/habit_togglers.html', {'togglers': togglers})
+    transaction.on_commit(lambda: broker.publish(user_id, 'toggle', data))
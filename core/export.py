@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from .models import Habit
+from .storage import get_progress_store
+
+
+# Export formats, with their content types and file extensions
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'json': ('application/json', 'json'),
+}
+
+# Fields of every exported progress record, in order
+FIELDS = ['user', 'habit', 'name', 'date', 'completed']
+
+
+def iter_records(users, store=None, chunk_size=2000):
+    """
+    Yields the progress history of the given users' habits as dicts of
+    FIELDS, ordered by habit and date.
+
+    Only the habits are held in memory. Progress is read from a chunked
+    server-side cursor, and the query only runs once the first record
+    is requested.
+    """
+
+    store = store or get_progress_store()
+    habits = {
+        habit.id: habit
+        for habit in Habit.objects.filter(user__in=users).select_related('user').order_by('id')
+    }
+    for habit_id, day, completed in store.iter_progress(list(habits), chunk_size):
+        habit = habits[habit_id]
+        yield {
+            'user': habit.user.username,
+            'habit': habit.slug,
+            'name': habit.name,
+            'date': day.isoformat(),
+            'completed': completed,
+        }
+
+
+def iter_csv(records):
+    """
+    Yields a CSV header row, then one row per record.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writeheader()
+    yield flush()
+    for record in records:
+        writer.writerow(record)
+        yield flush()
+
+
+def iter_jsonl(records):
+    """
+    Yields one JSON object per line per record.
+    """
+
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def iter_json(records):
+    """
+    Yields a single JSON array of records, one element at a time.
+    """
+
+    yield '['
+    separator = '\n'
+    for record in records:
+        yield separator + json.dumps(record)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def iter_export(users, format, store=None, chunk_size=2000):
+    """
+    Yields the users' progress history in an export format (see FORMATS),
+    in chunks of about `chunk_size` records, so that responses and files
+    are written in a few large writes rather than one per record.
+    """
+
+    serializers = {'csv': iter_csv, 'jsonl': iter_jsonl, 'json': iter_json}
+    lines = serializers[format](iter_records(users, store, chunk_size))
+    # The first chunk (e.g. a CSV header) is sent before the query runs
+    yield next(lines)
+    while chunk := ''.join(islice(lines, chunk_size)):
+        yield chunk
+
+
+async def aiter_export(users, format, store=None, chunk_size=2000):
+    """
+    Async version of `iter_export()`, for streaming from async views.
+
+    The export runs in the sync_to_async thread, one chunk at a time,
+    so that its server-side cursor always stays in the same thread, and
+    responses never buffer the whole export in memory.
+    """
+
+    chunks = iter_export(users, format, store, chunk_size)
+    next_chunk = sync_to_async(lambda: next(chunks, None))
+    while (chunk := await next_chunk()) is not None:
+        yield chunk
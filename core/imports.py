@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.utils.text import slugify
+from .models import Habit, HabitStats, Progress
+from .stats import compute_habit_stats
+from .storage import RowProgressStore, TieredProgressStore, get_archived_before, get_progress_store
+from .versions import bump_habits_versions
+
+
+# Import formats, the same as the export formats
+FORMATS = ['csv', 'jsonl', 'json']
+
+# Values accepted as completed, case-insensitively
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1'}
+
+
+class ImportFormatError(ValueError):
+    """
+    Raised for malformed import files, with the record number.
+    """
+
+
+def iter_csv(text):
+    """
+    Yields the rows of a CSV file with a header row, as dicts.
+    """
+
+    yield from csv.DictReader(text)
+
+
+def iter_jsonl(text):
+    """
+    Yields the objects of a JSON Lines file.
+    """
+
+    for line in text:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json(text, read_size=65536):
+    """
+    Yields the elements of a JSON array one at a time, reading the file
+    in blocks of `read_size` characters rather than loading it whole.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+
+    while True:
+        # Skip whitespace and separators between elements
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                break
+            block = text.read(read_size)
+            if not block:
+                return
+            buffer, position = buffer[position:] + block, 0
+
+        if not started:
+            if buffer[position] != '[':
+                raise json.JSONDecodeError('Expected a JSON array', buffer, position)
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        # Decode the next element, reading more until it's complete
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                block = text.read(read_size)
+                if not block:
+                    raise
+                buffer, position = buffer[position:] + block, 0
+        yield element
+        position = end
+
+
+def parse_record(record):
+    """
+    Returns the (habit slug, habit name, date, completed) of a record with
+    `habit`, `date` and `completed` fields, and an optional `name` field.
+    """
+
+    completed = record['completed']
+    if isinstance(completed, str):
+        completed = completed.strip().lower() in TRUE_VALUES
+    slug = slugify(record['habit'])
+    if not slug:
+        raise ValueError('blank habit')
+    return slug, record.get('name') or slug, date.fromisoformat(record['date']), bool(completed)
+
+
+def iter_import_records(text, format):
+    """
+    Yields the parsed records of an import file (a text stream) in one
+    of FORMATS, raising ImportFormatError on the first malformed one.
+    """
+
+    parsers = {'csv': iter_csv, 'jsonl': iter_jsonl, 'json': iter_json}
+    number = 0
+    try:
+        for number, record in enumerate(parsers[format](text), 1):
+            try:
+                parsed = parse_record(record)
+            except (AttributeError, KeyError, TypeError, ValueError) as exc:
+                raise ImportFormatError(f'Record {number}: invalid {exc!r}.') from exc
+            yield parsed
+    except (csv.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ImportFormatError(f'Record {number + 1}: {exc}.') from exc
+
+
+def copy_progress(rows):
+    """
+    Upserts (habit id, date, completed) rows into Progress with Postgres
+    `COPY` into a temporary table, then a single INSERT ... ON CONFLICT.
+    """
+
+    data = io.StringIO()
+    csv.writer(data).writerows(rows)
+    data.seek(0)
+
+    table = Progress._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE core_progress_import '
+            '(habit_id bigint, date date, completed boolean) ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY core_progress_import (habit_id, date, completed) FROM STDIN WITH (FORMAT csv)',
+            data
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (habit_id, date, completed) '
+            f'SELECT habit_id, date, completed FROM core_progress_import '
+            f'ON CONFLICT (habit_id, date) DO UPDATE SET completed = EXCLUDED.completed'
+        )
+
+
+def import_progress(user, text, format, batch_size=10000, store=None):
+    """
+    Imports a progress history file (a text stream) for a user, as
+    exported by `core.export`: one record per habit per day, with `habit`
+    (slug), `name`, `date` and `completed` fields.
+
+    - Parses the file as a stream, and writes it in batches of `batch_size`
+      records, so memory stays flat whatever its size.
+    - Creates habits missing from the user's habits on first sight.
+    - Writes with Postgres `COPY` when the row store is used on Postgres
+      with psycopg2, and with the store's bulk upsert otherwise, and for
+      the archived years of the tiered store, which live in bitmasks.
+    - Upserts on (habit, date), so re-importing a file changes nothing.
+    - Rebuilds the stats of every imported habit once done, or once it
+      stops on a malformed record, since the batches before it are kept.
+
+    A generator, yielding a progress report after each batch and at the end:
+    a dict of the number of records and habits imported so far, the elapsed
+    seconds and the records per second.
+    """
+
+    store = store or get_progress_store()
+    use_copy = (
+        connection.vendor == 'postgresql'
+        and not is_psycopg3
+        and isinstance(store, RowProgressStore)
+    )
+    archived_before = get_archived_before() if isinstance(store, TieredProgressStore) else None
+    habits = {habit.slug: habit for habit in Habit.objects.filter(user=user)}
+    imported = {}
+    started = time.perf_counter()
+    records = 0
+
+    def report():
+        elapsed = time.perf_counter() - started
+        return {
+            'records': records,
+            'habits': len(imported),
+            'elapsed': elapsed,
+            'rate': records / elapsed if elapsed else 0,
+        }
+
+    def write(batch):
+        changes = [(habit, day, completed) for (habit, day), completed in batch.items()]
+        if not use_copy:
+            store.set_many(changes)
+            return
+        # Archived years are only read from their masks, never from rows
+        archived = [change for change in changes
+                    if archived_before is not None and change[1].year < archived_before]
+        if archived:
+            store.set_many(archived)
+        copy_progress((habit.id, day, completed) for habit, day, completed in changes
+                      if archived_before is None or day.year >= archived_before)
+
+    # Later records for the same (habit, date) win, within and across batches
+    batch = {}
+    try:
+        for slug, name, day, completed in iter_import_records(text, format):
+            habit = habits.get(slug)
+            if habit is None:
+                habit = habits[slug] = Habit.objects.create(user=user, slug=slug, name=name)
+            imported[habit.id] = habit
+            batch[(habit, day)] = completed
+            records += 1
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = {}
+                yield report()
+        if batch:
+            write(batch)
+    finally:
+        # Batches written before a malformed record are kept, so their
+        # habits are brought up to date too. Bulk writes don't send model
+        # signals, and stats are rebuilt from scratch.
+        stats = HabitStats.objects.in_bulk(list(imported))
+        for habit_id, habit in imported.items():
+            current = stats.get(habit_id)
+            compute_habit_stats(
+                habit,
+                store,
+                tracked_since=current.tracked_since if current else None
+            ).save()
+        bump_habits_versions(imported.values())
+    yield report()
+
+
+def format_report(report):
+    """
+    Formats an import progress report as a line of text.
+    """
+
+    return (
+        f'{report["records"]} records, {report["habits"]} habits, '
+        f'{report["elapsed"]:.1f}s, {report["rate"]:.0f} records/s'
+    )
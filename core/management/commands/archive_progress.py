@@ -0,0 +1,119 @@
+import time
+from datetime import date
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.db.partitions import delete_rows, detach_partition, drop_partition, get_partitions, is_partitioned
+from core.models import Progress, ProgressArchive, ProgressYear
+from core.storage import (ARCHIVED_BEFORE_CACHE_KEY, ARCHIVED_BEFORE_TIMEOUT, TieredProgressStore,
+                          day_of_year, get_progress_store)
+
+
+class Command(BaseCommand):
+    """
+    Archive progress command.
+
+    Archives every year of progress before `--before`, oldest first:
+
+    - Each year's completed Progress rows are converted into ProgressYear
+      bitmasks (46 bytes per habit-year), and the year is recorded as a
+      ProgressArchive, after which `TieredProgressStore` reads it from the
+      masks.
+    - The command then waits for every process to see the new archive
+      boundary (ARCHIVED_BEFORE_TIMEOUT seconds), and detaches the years'
+      Progress partitions, keeping their rows in standalone tables.
+    - With `--drop`, the detached tables, and any rows of the years left in
+      the Progress table (default partition, or unpartitioned table), are
+      deleted. Without it, nothing is deleted, and a later run with `--drop`
+      finishes the job.
+
+    Requires `PROGRESS_STORE = 'core.storage.TieredProgressStore'`, so the
+    views keep reading archived years. Re-running it is safe.
+
+    Usage:
+        python manage.py archive_progress --before 2024 [--drop]
+    """
+
+    help = 'Archives old years of Progress rows into ProgressYear bitmasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=int, required=True,
+                            help='First year to keep unarchived.')
+        parser.add_argument('--drop', action='store_true',
+                            help='Delete the archived rows and partitions.')
+        parser.add_argument('--no-wait', action='store_true',
+                            help='Don\'t wait for the processes to see the new archive boundary.')
+
+    def handle(self, *args, **options):
+        before = options['before']
+        if not isinstance(get_progress_store(), TieredProgressStore):
+            raise CommandError('Archived years are only read by PROGRESS_STORE = '
+                               '"core.storage.TieredProgressStore".')
+        if before > date.today().year:
+            raise CommandError('The current year can\'t be archived.')
+
+        oldest = Progress.objects.order_by('date').values_list('date', flat=True).first()
+        archived = set(ProgressArchive.objects.values_list('year', flat=True))
+        partitioned = is_partitioned()
+        partitions = get_partitions() if partitioned else {}
+        # Archive every year, even empty ones, so archived years stay contiguous
+        first_year = min([before, *partitions, *([oldest.year] if oldest else [])])
+        years = range(first_year, before)
+
+        count = 0
+        for year in years:
+            if year not in archived:
+                masks = self.archive(year)
+                self.stdout.write(f'{year}: {masks} habit masks')
+                count += 1
+
+        # Processes cache the archive boundary, and read the rows until then
+        if count and not options['no_wait']:
+            self.stdout.write(f'Waiting {ARCHIVED_BEFORE_TIMEOUT}s for the new archive boundary.')
+            time.sleep(ARCHIVED_BEFORE_TIMEOUT)
+
+        for year in years:
+            if year in partitions:
+                detach_partition(year)
+                self.stdout.write(f'{year}: detached {partitions[year]}')
+            if options['drop']:
+                if partitioned:
+                    drop_partition(year)
+                deleted = delete_rows(year)
+                self.stdout.write(f'{year}: dropped, {deleted} rows deleted')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} years.'))
+
+    def archive(self, year):
+        """
+        Writes the ProgressYear masks of a year's Progress rows and records
+        the year as archived, then returns the number of masks.
+        """
+
+        rows = Progress.objects.filter(
+            date__range=(date(year, 1, 1), date(year, 12, 31)),
+            completed=True
+        ).values_list('habit_id', 'date').iterator(chunk_size=10000)
+        masks = {}
+        for habit_id, day in rows:
+            masks[habit_id] = masks.get(habit_id, 0) | 1 << day_of_year(day)
+
+        with transaction.atomic():
+            # Replace any stale masks, e.g. from an earlier backfill
+            ProgressYear.objects.filter(year=year).exclude(habit_id__in=list(masks)).delete()
+            progress_years = []
+            for habit_id, bits in masks.items():
+                progress_year = ProgressYear(habit_id=habit_id, year=year)
+                progress_year.bits = bits
+                progress_years.append(progress_year)
+            ProgressYear.objects.bulk_create(
+                progress_years,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['habit', 'year'],
+                update_fields=['mask']
+            )
+            ProgressArchive.objects.create(year=year)
+
+        cache.delete(ARCHIVED_BEFORE_CACHE_KEY)
+        return len(masks)
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Progress, ProgressYear
+from core.storage import day_of_year
+
+
+class Command(BaseCommand):
+    """
+    Backfill progress years command.
+
+    Converts existing Progress rows into ProgressYear bitmasks for use with
+    `BitmapProgressStore`. Completed rows are streamed in (habit, date) order,
+    so only one habit-year mask is held in memory at a time.
+
+    Existing ProgressYear rows for the converted habit-years are overwritten,
+    so the command can be re-run safely.
+
+    Usage:
+        python manage.py backfill_progress_years [--batch-size 1000]
+    """
+
+    help = 'Converts Progress rows into ProgressYear completion bitmasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of ProgressYear rows per insert.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        total = 0
+
+        rows = (
+            Progress.objects
+            .filter(completed=True)
+            .order_by('habit_id', 'date')
+            .values_list('habit_id', 'date')
+            .iterator(chunk_size=10000)
+        )
+
+        with transaction.atomic():
+            current = None
+            for habit_id, day in rows:
+                # Start a new mask whenever the habit or year changes
+                if current is None or (current.habit_id, current.year) != (habit_id, day.year):
+                    current = ProgressYear(habit_id=habit_id, year=day.year)
+                    current.bits = 0
+                    batch.append(current)
+                current.bits |= 1 << day_of_year(day)
+
+                # Write full batches, keeping the mask being built in memory
+                if len(batch) > batch_size:
+                    total += self.write(batch[:-1])
+                    batch = batch[-1:]
+
+            total += self.write(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {total} habit-year masks.'
+        ))
+
+    def write(self, batch):
+        """
+        Upserts a batch of ProgressYear rows and returns the batch size.
+        """
+
+        ProgressYear.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['habit', 'year'],
+            update_fields=['mask']
+        )
+        return len(batch)
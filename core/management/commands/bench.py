@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner, setup_test_environment, teardown_test_environment
+from core.bench import QUERY_BUDGETS, check_results, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    """
+    Bench command.
+
+    Seeds a throwaway test database with synthetic users, habits and daily
+    Progress rows, then times the homepage, toggleboard, habit and
+    toggle_habit views through the test client, and calendar rendering on
+    its own. Reports the query count and median wall time of each, with
+    a cold cache.
+
+    Fails when a view goes over its query budget (`core.bench.QUERY_BUDGETS`).
+    Wall times are only compared when a baseline JSON file exists: none is
+    committed, since they depend on the machine and database, so record one
+    locally with `--update-baseline` before making changes, and later runs
+    fail when a view's wall time regresses by more than `--tolerance`.
+
+    Usage:
+        python manage.py bench [--users 10] [--habits 9] [--days 365] \\
+            [--repeat 20] [--baseline bench_baseline.json] \\
+            [--tolerance 0.25] [--update-baseline]
+    """
+
+    help = 'Benchmarks the hot views against query budgets, and a local baseline if any.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--habits', type=int, default=9,
+                            help='Number of habits per user.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Number of days of Progress per habit.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Number of timed runs per benchmark.')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'bench_baseline.json'),
+                            help='Path of the baseline JSON file, if recorded.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed wall time regression against the baseline, '
+                                 'as a fraction.')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the results as the new baseline.')
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        baseline = None
+        if baseline_path.exists() and not options['update_baseline']:
+            baseline = json.loads(baseline_path.read_text())
+
+        # Seed a test database, so the real one is never touched
+        setup_test_environment()
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            user = seed(options['users'], options['habits'], options['days'])
+            results = run_benchmarks(user, options['repeat'])
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+        self.stdout.write(f'{"benchmark":<20}{"queries":>10}{"budget":>10}{"ms":>10}{"baseline":>10}')
+        for name, result in results.items():
+            base = baseline[name]['time_ms'] if baseline and name in baseline else None
+            self.stdout.write(
+                f'{name:<20}{result["queries"]:>10}{QUERY_BUDGETS.get(name, "-"):>10}'
+                f'{result["time_ms"]:>10.2f}{"-" if base is None else f"{base:.2f}":>10}'
+            )
+
+        if options['update_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f'Baseline written to {baseline_path}.')
+        elif baseline is None:
+            self.stdout.write(f'No baseline at {baseline_path}, only query budgets are checked.')
+
+        failures = check_results(results, baseline, options['tolerance'])
+        if failures:
+            raise CommandError('Benchmark failed:\n' + '\n'.join(failures))
@@ -0,0 +1,193 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    """
+    Bench deployments command.
+
+    Compares requests/sec and p99 latency of the WSGI and ASGI deployments
+    at a fixed concurrency. Each deployment runs in its own process, with its
+    own entry point (habittracker.wsgi / habittracker.asgi), so the ASGI run
+    serves the async views. Requests are driven in-process, straight into the
+    application callables, so the numbers exclude any web server overhead.
+
+    - WSGI requests are issued from a pool of `--concurrency` threads.
+    - ASGI requests are issued as `--concurrency` concurrent tasks
+      on one event loop.
+
+    Usage:
+        python manage.py bench_deployments --username alice \\
+            [--path /] [--path /habits/wake-up-early/] \\
+            [--concurrency 32] [--requests 2000]
+    """
+
+    help = 'Compares requests/sec and p99 latency between WSGI and ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='User whose session the requests are made with.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable). Defaults to /.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Number of requests per path and deployment.')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'],
+                            help='Run a single deployment and print JSON results '
+                                 '(used internally).')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/']
+
+        if options['mode']:
+            results = self.run_mode(options['mode'], paths, options)
+            self.stdout.write(json.dumps(results))
+            return
+
+        # Run each deployment in a fresh process with its own entry point
+        rows = []
+        for mode in ['wsgi', 'asgi']:
+            env = dict(os.environ, ASYNC_VIEWS='True' if mode == 'asgi' else '')
+            command = [
+                sys.executable, sys.argv[0], 'bench_deployments',
+                '--mode', mode,
+                '--username', options['username'],
+                '--concurrency', str(options['concurrency']),
+                '--requests', str(options['requests']),
+            ]
+            for path in paths:
+                command += ['--path', path]
+            process = subprocess.run(command, env=env, capture_output=True, text=True)
+            if process.returncode:
+                raise CommandError(process.stderr)
+            for path, result in json.loads(process.stdout.strip().splitlines()[-1]).items():
+                rows.append((mode, path, result))
+
+        self.stdout.write(f'{"mode":<6}{"path":<40}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+        for mode, path, result in rows:
+            self.stdout.write(
+                f'{mode:<6}{path:<40}{result["rps"]:>10.1f}'
+                f'{result["p50"]:>10.2f}{result["p99"]:>10.2f}'
+            )
+
+    def get_session_cookie(self, username):
+        """
+        Creates a logged-in session for the user and returns its cookie.
+        """
+
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'User "{username}" does not exist.')
+
+        session = import_string(settings.SESSION_ENGINE + '.SessionStore')()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def run_mode(self, mode, paths, options):
+        """
+        Benchmarks every path against one deployment, returning a mapping of
+        path to requests/sec and latency percentiles.
+        """
+
+        cookie = self.get_session_cookie(options['username'])
+        run = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+        results = {}
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for path in paths:
+                # Warm up caches and connections before measuring
+                run(path, cookie, options['concurrency'], options['concurrency'])
+                started = time.perf_counter()
+                latencies = run(path, cookie, options['requests'], options['concurrency'])
+                elapsed = time.perf_counter() - started
+
+                latencies.sort()
+                results[path] = {
+                    'rps': len(latencies) / elapsed,
+                    'p50': latencies[len(latencies) // 2] * 1000,
+                    'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+                }
+        return results
+
+    def run_wsgi(self, path, cookie, requests, concurrency):
+        from habittracker.wsgi import application
+
+        path, _, query_string = path.partition('?')
+
+        def request(_):
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query_string,
+                'SERVER_NAME': 'testserver',
+                'SERVER_PORT': '80',
+                'HTTP_HOST': 'testserver',
+                'HTTP_COOKIE': cookie,
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr,
+            }
+            started = time.perf_counter()
+            response = application(environ, lambda status, headers: None)
+            for chunk in response:
+                pass
+            response.close()
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, range(requests)))
+
+    def run_asgi(self, path, cookie, requests, concurrency):
+        from habittracker.asgi import application
+
+        path, _, query_string = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': query_string.encode(),
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'server': ('testserver', 80),
+        }
+
+        async def send(message):
+            pass
+
+        async def request(semaphore):
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                # Send the (empty) body, then never disconnect
+                if messages:
+                    return messages.pop()
+                await asyncio.Future()
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(dict(scope), receive, send)
+                return time.perf_counter() - started
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(request(semaphore) for _ in range(requests)))
+
+        return list(asyncio.run(main()))
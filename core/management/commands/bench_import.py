@@ -0,0 +1,71 @@
+import csv
+import random
+import tempfile
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import get_runner, setup_test_environment, teardown_test_environment
+from core.imports import format_report, import_progress
+
+
+class Command(BaseCommand):
+    """
+    Bench import command.
+
+    Writes a synthetic CSV history of `--rows` records (`--days` days per
+    habit, ending today), then imports it twice into a throwaway test
+    database, reporting records/sec: once into an empty database, and once
+    more to measure an idempotent re-import, where every record conflicts.
+
+    Usage:
+        python manage.py bench_import [--rows 1000000] [--days 3650] \\
+            [--batch-size 10000]
+    """
+
+    help = 'Benchmarks bulk imports of progress history, in records/sec.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=3650,
+                            help='Number of days per habit.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as file:
+            self.write_history(file, options['rows'], options['days'])
+            file.flush()
+            self.stdout.write(f'Wrote {options["rows"]} records to {file.name}.')
+
+            # Import into a test database, so the real one is never touched
+            setup_test_environment()
+            runner = get_runner(settings)(verbosity=0, interactive=False)
+            databases = runner.setup_databases()
+            try:
+                user = User.objects.create(username='bench-import')
+                for run in ['import', 're-import']:
+                    with open(file.name, newline='') as text:
+                        for report in import_progress(user, text, 'csv', options['batch_size']):
+                            pass
+                    self.stdout.write(f'{run}: {format_report(report)}')
+            finally:
+                runner.teardown_databases(databases)
+                teardown_test_environment()
+
+    def write_history(self, file, rows, days):
+        """
+        Writes `rows` random records, `days` consecutive days per habit.
+        """
+
+        rng = random.Random(0)
+        today = date.today()
+        writer = csv.writer(file)
+        writer.writerow(['habit', 'name', 'date', 'completed'])
+        for row in range(rows):
+            habit, offset = divmod(row, days)
+            writer.writerow([
+                f'bench-import-habit-{habit}',
+                f'Habit {habit}',
+                (today - timedelta(days=offset)).isoformat(),
+                rng.random() < 0.6,
+            ])
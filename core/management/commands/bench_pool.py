@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Bench pool command.
+
+    Compares per-request latency with and without connection pooling,
+    against the configured database (a local Postgres). Each simulated
+    request connects, runs a small habit query, and closes its connection,
+    the way Django does around every request:
+
+    - direct - `django.db.backends.postgresql`, opening a new connection
+      (TCP and auth handshake) per request.
+    - pooled - `core.db.pooled`, checking connections out of the pool.
+
+    Requests are issued from a pool of `--concurrency` threads, each with its
+    own database wrapper, as under WSGI workers or ASGI's sync_to_async.
+
+    Usage:
+        python manage.py bench_pool [--concurrency 8] [--requests 2000] \\
+            [--max-size 20]
+    """
+
+    help = 'Compares request latency with and without connection pooling.'
+
+    ENGINES = {
+        'direct': 'django.db.backends.postgresql',
+        'pooled': 'core.db.pooled',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--max-size', type=int, default=20,
+                            help='Maximum size of the pool.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"mode":<8}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+        for mode, engine in self.ENGINES.items():
+            settings_dict = copy.deepcopy(connections[DEFAULT_DB_ALIAS].settings_dict)
+            settings_dict['ENGINE'] = engine
+            settings_dict['CONN_MAX_AGE'] = 0
+            settings_dict['POOL'] = {
+                **settings_dict.get('POOL', {}),
+                'MAX_SIZE': options['max_size'],
+                'STATS_HOOK': None,
+            }
+            backend = load_backend(engine)
+            local = threading.local()
+
+            def request(_):
+                if not hasattr(local, 'connection'):
+                    local.connection = backend.DatabaseWrapper(settings_dict, f'bench-{mode}')
+                connection = local.connection
+                started = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT id, slug, weekly_rate FROM core_habit LIMIT 10')
+                    cursor.fetchall()
+                connection.close()
+                return time.perf_counter() - started
+
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                # Warm up (and fill the pool) before measuring
+                list(executor.map(request, range(options['concurrency'])))
+                started = time.perf_counter()
+                latencies = list(executor.map(request, range(options['requests'])))
+                elapsed = time.perf_counter() - started
+
+            latencies.sort()
+            self.stdout.write(
+                f'{mode:<8}{len(latencies) / elapsed:>10.1f}'
+                f'{latencies[len(latencies) // 2] * 1000:>10.2f}'
+                f'{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:>10.2f}'
+            )
+
+            if mode == 'pooled':
+                pools = [pool for key, pool in backend.DatabaseWrapper.pools.items()
+                         if key[0] == f'bench-{mode}']
+                for pool in pools:
+                    stats = pool.stats()
+                    self.stdout.write(
+                        f'pool: {stats["opened"]} opened, {stats["waits"]} waits, '
+                        f'max wait {stats["max_wait_time"] * 1000:.2f} ms'
+                    )
+                    pool.close()
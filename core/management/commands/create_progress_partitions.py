@@ -0,0 +1,41 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core.db.partitions import create_partition, get_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    """
+    Create progress partitions command.
+
+    Creates the yearly partitions of the Progress table (see
+    `core.db.partitions`) for this year and the `--years` following ones,
+    skipping those that exist, so it can run from a daily or monthly cron.
+    Rows written before their year's partition exists land in the default
+    partition, and are moved into it when it's created.
+
+    Postgres only.
+
+    Usage:
+        python manage.py create_progress_partitions [--years 2]
+    """
+
+    help = 'Creates the yearly Progress partitions ahead of time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=2,
+                            help='Number of years to create partitions for, after this one.')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('The Progress table is not partitioned (Postgres only).')
+
+        existing = get_partitions()
+        this_year = date.today().year
+        created = []
+        for year in range(this_year, this_year + options['years'] + 1):
+            if year not in existing:
+                created.append(create_partition(year))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(created)} partitions{": " if created else ""}{", ".join(created)}.'
+        ))
@@ -0,0 +1,57 @@
+import io
+import sys
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.imports import FORMATS, ImportFormatError, format_report, import_progress
+
+
+class Command(BaseCommand):
+    """
+    Import progress command.
+
+    Imports a user's progress history from a CSV, JSON Lines or JSON file,
+    as written by `export_progress`, e.g. from another tracker. The file is
+    parsed as a stream and written in batches with bulk upserts (`COPY` on
+    Postgres), and progress is reported after every batch. Re-importing
+    a file is a no-op.
+
+    Usage:
+        python manage.py import_progress history.csv --username alice \\
+            [--format csv|jsonl|json] [--batch-size 10000]
+
+    The format defaults to the file's extension. Use `-` to read stdin.
+    """
+
+    help = "Bulk imports a user's progress history from a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin.')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Defaults to the file's extension.")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of records written at a time.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist.')
+
+        format = options['format'] or Path(options['path']).suffix.lstrip('.')
+        if format not in FORMATS:
+            raise CommandError(f'Unknown import format "{format}", use --format.')
+
+        if options['path'] == '-':
+            text = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            text = open(options['path'], encoding='utf-8-sig', newline='')
+
+        with text:
+            try:
+                for report in import_progress(user, text, format, options['batch_size']):
+                    self.stdout.write(format_report(report))
+            except ImportFormatError as exc:
+                raise CommandError(str(exc))
+
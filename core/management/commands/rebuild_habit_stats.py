@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Habit, HabitStats
+from core.stats import compute_habit_stats
+from core.storage import get_progress_store
+
+
+class Command(BaseCommand):
+    """
+    Rebuild habit stats command.
+
+    Recomputes every habit's HabitStats from its full completion history,
+    reports any habit whose incrementally maintained values don't match the
+    recomputed ones, then saves the recomputed values.
+
+    Usage:
+        python manage.py rebuild_habit_stats [--check]
+
+    With `--check`, nothing is saved and the command fails on any mismatch.
+    """
+
+    help = 'Rebuilds HabitStats from scratch and checks them against the stored values.'
+
+    # Values compared between the stored and the recomputed stats
+    FIELDS = ['completed_days', 'longest_streak', 'run_lengths',
+              'current_streak', 'completion_rate']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare, and fail if any habit mismatches.')
+
+    def handle(self, *args, **options):
+        store = get_progress_store()
+        stored = HabitStats.objects.in_bulk()
+        mismatches = 0
+
+        for habit in Habit.objects.iterator():
+            current = stored.get(habit.id)
+            rebuilt = compute_habit_stats(
+                habit,
+                store,
+                tracked_since=current.tracked_since if current else None
+            )
+
+            # Compare the incrementally maintained values to the recompute
+            if current is not None:
+                for field in self.FIELDS:
+                    expected = getattr(rebuilt, field)
+                    actual = getattr(current, field)
+                    if expected != actual:
+                        mismatches += 1
+                        self.stderr.write(
+                            f'{habit.slug}: {field} is {actual!r}, expected {expected!r}'
+                        )
+
+            if not options['check']:
+                rebuilt.save()
+
+        if options['check'] and mismatches:
+            raise CommandError(f'{mismatches} mismatched habit stats.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {Habit.objects.count()} habits, {mismatches} mismatches.'
+        ))
@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import urllib.request
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Third-party scripts served from `static/vendor/`, as (URL, file name,
+# Subresource Integrity hash). Pinned versions; bump them here.
+VENDOR_ASSETS = [
+    ('https://unpkg.com/htmx.org@1.9.10/dist/htmx.min.js', 'htmx.min.js',
+     'sha384-D1Kt99CQMDuVetoL1lrYwg5t+9QdHe7NLX/SoJYkXDFfX37iInKRy5xLSi8nO7UC'),
+    ('https://unpkg.com/htmx.org@1.9.10/dist/ext/sse.js', 'htmx-sse.js',
+     'sha384-jlVlI/i5K5APUIz8cxowC1/FsCEZgsrg126wue89Np9N75pQdAzqkYYP+jsUi43W'),
+]
+
+
+class Command(BaseCommand):
+    """
+    Vendor static command.
+
+    Downloads the pinned versions of the third-party scripts the templates
+    load (htmx and its SSE extension) into `static/vendor/`, so they're
+    served, hashed and compressed with the app's own static files rather
+    than fetched from a CDN. Checks each download against its
+    Subresource Integrity hash when one is pinned, and prints the hash of
+    every file, to pin new versions.
+
+    Run it when bumping a version, and commit the files. `_base.html` loads
+    them with `{% static 'vendor/...' %}`.
+
+    Usage:
+        python manage.py vendor_static [--output static/vendor]
+    """
+
+    help = 'Downloads the pinned third-party scripts into static/vendor/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(Path(settings.BASE_DIR) / 'static' / 'vendor'))
+
+    def handle(self, *args, **options):
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+
+        for url, filename, integrity in VENDOR_ASSETS:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+            digest = 'sha384-' + base64.b64encode(hashlib.sha384(content).digest()).decode()
+            if integrity and digest != integrity:
+                raise CommandError(f'{url} does not match its integrity hash: {digest}.')
+            (output / filename).write_bytes(content)
+            self.stdout.write(f'{filename} {len(content)} bytes {digest}')
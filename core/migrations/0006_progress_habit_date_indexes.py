@@ -0,0 +1,63 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:07
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_progress(apps, schema_editor):
+    """
+    Keeps a single Progress row per (habit, date) before the unique
+    constraint is added, preferring a completed row over an incomplete one.
+    """
+
+    Progress = apps.get_model('core', 'Progress')
+    duplicates = (
+        Progress.objects
+        .values('habit_id', 'date')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        rows = Progress.objects.filter(
+            habit_id=duplicate['habit_id'],
+            date=duplicate['date']
+        ).order_by('-completed', 'id')
+        Progress.objects.filter(
+            pk__in=list(rows.values_list('pk', flat=True)[1:])
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_habit_weekly_rate_progress_color'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='progress',
+            name='color',
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='paused',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='progress',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(remove_duplicate_progress,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='progress',
+            index=models.Index(fields=['date', 'habit'], include=('completed',), name='core_progress_date_habit_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='progress',
+            constraint=models.UniqueConstraint(fields=('habit', 'date'), include=('completed',), name='core_progress_habit_date_uniq'),
+        ),
+    ]
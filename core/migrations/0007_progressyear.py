@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_progress_habit_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressYear',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.SmallIntegerField()),
+                ('mask', models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.habit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='progressyear',
+            constraint=models.UniqueConstraint(fields=('habit', 'year'), name='core_progressyear_habit_year_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_progressyear'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.habit')),
+                ('tracked_since', models.DateField(default=django.utils.timezone.localdate)),
+                ('completed_days', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('run_lengths', models.JSONField(default=dict)),
+                ('streak_start', models.DateField(blank=True, null=True)),
+                ('streak_end', models.DateField(blank=True, null=True)),
+                ('recent_mask', models.BigIntegerField(default=0)),
+                ('recent_end', models.DateField(blank=True, null=True)),
+            ],
+        ),
+    ]
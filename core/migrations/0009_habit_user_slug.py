@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_habitstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='habit',
+            name='slug',
+            field=models.SlugField(db_index=False, max_length=250),
+        ),
+        migrations.AddConstraint(
+            model_name='habit',
+            constraint=models.UniqueConstraint(fields=('user', 'slug'), name='core_habit_user_slug_uniq'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def pause_paused_habits(apps, schema_editor):
+    """
+    Replaces the `paused` flag of paused habits with an open-ended pause
+    since they started being tracked, which is how they were shown.
+    """
+
+    Habit = apps.get_model('core', 'Habit')
+    HabitStats = apps.get_model('core', 'HabitStats')
+    Pause = apps.get_model('core', 'Pause')
+    tracked_since = dict(HabitStats.objects.values_list('habit_id', 'tracked_since'))
+    Pause.objects.bulk_create(
+        Pause(habit_id=habit_id, start=tracked_since.get(habit_id, django.utils.timezone.localdate()))
+        for habit_id in Habit.objects.filter(paused=True).values_list('id', flat=True)
+    )
+
+
+def unpause_habits(apps, schema_editor):
+    Habit = apps.get_model('core', 'Habit')
+    Habit.objects.filter(pauses__end__isnull=True).update(paused=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_habit_user_slug'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pause',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField(default=django.utils.timezone.localdate)),
+                ('end', models.DateField(blank=True, null=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pauses', to='core.habit')),
+            ],
+            options={
+                'ordering': ['habit', 'start'],
+                'indexes': [models.Index(fields=['habit', 'start'], name='core_pause_habit_start_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pause',
+            constraint=models.CheckConstraint(check=models.Q(('end__isnull', True), ('end__gte', models.F('start')), _connector='OR'), name='core_pause_end_after_start'),
+        ),
+        migrations.RunPython(pause_paused_habits, unpause_habits),
+        migrations.RemoveField(
+            model_name='habit',
+            name='paused',
+        ),
+    ]
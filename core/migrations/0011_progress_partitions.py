@@ -0,0 +1,104 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:55
+
+import datetime
+from django.db import migrations, models
+
+
+# Postgres only: Progress becomes a table partitioned by year of `date`, with
+# one partition per year from the oldest row to next year, and a default
+# partition for anything else. Rows are copied over in the migration's
+# transaction. The primary key becomes (id, date), since unique constraints
+# must include the partition key.
+PARTITION_SQL = """
+ALTER TABLE core_progress RENAME TO core_progress_unpartitioned;
+ALTER INDEX core_progress_pkey RENAME TO core_progress_unpartitioned_pkey;
+ALTER INDEX core_progress_habit_date_uniq RENAME TO core_progress_unpartitioned_habit_date_uniq;
+ALTER INDEX core_progress_date_habit_idx RENAME TO core_progress_unpartitioned_date_habit_idx;
+ALTER SEQUENCE IF EXISTS core_progress_id_seq RENAME TO core_progress_unpartitioned_id_seq;
+CREATE SEQUENCE core_progress_id_seq;
+CREATE TABLE core_progress (
+    id bigint NOT NULL DEFAULT nextval('core_progress_id_seq'),
+    date date NOT NULL,
+    completed boolean NOT NULL,
+    habit_id bigint NOT NULL,
+    CONSTRAINT core_progress_pkey PRIMARY KEY (id, date),
+    CONSTRAINT core_progress_habit_date_uniq UNIQUE (habit_id, date) INCLUDE (completed),
+    CONSTRAINT core_progress_habit_id_fk_core_habit_id FOREIGN KEY (habit_id)
+        REFERENCES core_habit (id) DEFERRABLE INITIALLY DEFERRED
+) PARTITION BY RANGE (date);
+ALTER SEQUENCE core_progress_id_seq OWNED BY core_progress.id;
+CREATE INDEX core_progress_date_habit_idx ON core_progress (date, habit_id) INCLUDE (completed);
+{partitions}
+CREATE TABLE core_progress_default PARTITION OF core_progress DEFAULT;
+INSERT INTO core_progress (id, date, completed, habit_id)
+    SELECT id, date, completed, habit_id FROM core_progress_unpartitioned;
+SELECT setval('core_progress_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM core_progress;
+DROP TABLE core_progress_unpartitioned;
+"""
+
+PARTITION_OF_SQL = """
+CREATE TABLE core_progress_y{year} PARTITION OF core_progress
+    FOR VALUES FROM ('{year}-01-01') TO ('{next_year}-01-01');
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE core_progress RENAME TO core_progress_partitioned;
+ALTER INDEX core_progress_pkey RENAME TO core_progress_partitioned_pkey;
+ALTER INDEX core_progress_habit_date_uniq RENAME TO core_progress_partitioned_habit_date_uniq;
+ALTER INDEX core_progress_date_habit_idx RENAME TO core_progress_partitioned_date_habit_idx;
+ALTER SEQUENCE core_progress_id_seq RENAME TO core_progress_partitioned_id_seq;
+CREATE TABLE core_progress (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    date date NOT NULL,
+    completed boolean NOT NULL,
+    habit_id bigint NOT NULL,
+    CONSTRAINT core_progress_habit_date_uniq UNIQUE (habit_id, date) INCLUDE (completed),
+    CONSTRAINT core_progress_habit_id_fk_core_habit_id FOREIGN KEY (habit_id)
+        REFERENCES core_habit (id) DEFERRABLE INITIALLY DEFERRED
+);
+CREATE INDEX core_progress_date_habit_idx ON core_progress (date, habit_id) INCLUDE (completed);
+INSERT INTO core_progress (id, date, completed, habit_id)
+    SELECT id, date, completed, habit_id FROM core_progress_partitioned;
+SELECT setval(pg_get_serial_sequence('core_progress', 'id'), COALESCE(MAX(id), 0) + 1, false)
+    FROM core_progress;
+DROP TABLE core_progress_partitioned;
+"""
+
+
+def partition_progress(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Progress = apps.get_model('core', 'Progress')
+    oldest = Progress.objects.using(schema_editor.connection.alias).order_by('date').first()
+    this_year = datetime.date.today().year
+    first_year = min(oldest.date.year, this_year) if oldest else this_year
+    partitions = ''.join(
+        PARTITION_OF_SQL.format(year=year, next_year=year + 1)
+        for year in range(first_year, this_year + 2)
+    )
+    schema_editor.execute(PARTITION_SQL.format(partitions=partitions))
+
+
+def unpartition_progress(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(UNPARTITION_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_pause'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.SmallIntegerField(unique=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(partition_progress, unpartition_progress),
+    ]
@@ -1,7 +1,9 @@
-from datetime import timedelta, timezone
+from datetime import timedelta
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
 
 
 class Profile(models.Model):
@@ -28,50 +30,138 @@ class Habit(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              related_name='habits')
+    # Unique per user (see Meta), served by the (user, slug) index
     slug = models.SlugField(max_length=250,
-                            unique=True)
+                            db_index=False)
     name = models.CharField(max_length=250)
     description = models.TextField(blank=True)
     # Target number of times/week. 7 = everyday, 1 = once a week.
     weekly_rate = models.IntegerField(blank=True, default=7)
-    # Tracking can be paused for individual habits
-    paused = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'slug'],
+                                    name='core_habit_user_slug_uniq'),
+        ]
 
     def save(self, *args, **kwargs):
         """
         Overrides the default save method in order to
-        initialize a Progress object when a new Habit is created.
+        initialize Progress and HabitStats objects when a new Habit is created.
         """
 
         # Determine if the save method is being called on
         # a new instance of Habit that hasn’t been saved before
         is_new = self._state.adding
 
+        # Derive a slug from the name, unique among the user's habits
+        if not self.slug:
+            self.slug = self.get_unique_slug()
+
         # Then save the habit instance
         super().save(*args, **kwargs)
 
-        # If the habit is a new one, initialize an instance of Progress for it
+        # If the habit is a new one, initialize instances of Progress
+        # and HabitStats for it
         if is_new:
-            Progress.objects.create(habit=self, date=timezone.now().date())
+            Progress.objects.create(habit=self, date=timezone.localdate())
+            HabitStats.objects.create(habit=self,
+                                      tracked_since=timezone.localdate())
+
+    def get_unique_slug(self):
+        """
+        Returns a slug derived from the habit's name that none of the user's
+        other habits uses, e.g. `read`, then `read-2`, `read-3`...
+        """
+
+        base = slugify(self.name)[:240] or 'habit'
+        taken = set(
+            Habit.objects.filter(user_id=self.user_id, slug__startswith=base)
+            .exclude(pk=self.pk)
+            .values_list('slug', flat=True)
+        )
+        slug, number = base, 1
+        while slug in taken:
+            number += 1
+            slug = f'{base}-{number}'
+        return slug
+
+    def pause(self, start=None, end=None):
+        """
+        Pauses tracking from `start` (default today) to `end` included,
+        or until resumed if `end` is None.
+        """
+
+        return Pause.objects.create(habit=self,
+                                    start=start or timezone.localdate(),
+                                    end=end)
+
+    def resume(self, day=None):
+        """
+        Resumes tracking on `day` (default today), ending the open-ended
+        pause the day before, or dropping it if it starts on `day` or later.
+        """
+
+        day = day or timezone.localdate()
+        for pause in self.pauses.filter(end__isnull=True):
+            if pause.start >= day:
+                pause.delete()
+            else:
+                pause.end = day - timedelta(days=1)
+                pause.save()
 
     def get_absolute_url(self):
         """
         Returns the absolute URL of a habit's detail view.
 
         For example:
-            habit = Habit.objects.get(slug='wake-up-early')
+            habit = Habit.objects.get(user=user, slug='wake-up-early')
             habit.get_absolute_url()
 
         Returns:
-            'https://example.com/user/habits/wake-up-early/'
+            'https://example.com/habits/wake-up-early/'
         """
 
-        return reverse('blog:post_detail', args=[self.slug])
+        return reverse('core:habit', args=[self.slug])
 
     def __str__(self):
         return f'Habit: {self.name}'
 
 
+class Pause(models.Model):
+    """
+    A model class that represents an interval during which tracking of
+    a habit was paused. Paused days are shown in gray, and don't count
+    towards the weekly rate (see `StatusEngine`).
+
+    - `end` is included, and None while the pause is ongoing.
+    - Has a many-to-one relationship with the Habit model.
+    """
+
+    habit = models.ForeignKey(Habit,
+                              on_delete=models.CASCADE,
+                              related_name='pauses')
+    start = models.DateField(default=timezone.localdate)
+    end = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['habit', 'start']
+        indexes = [
+            models.Index(fields=['habit', 'start'],
+                         name='core_pause_habit_start_idx'),
+        ]
+        constraints = [
+            # Open-ended, or ending on or after its start
+            models.CheckConstraint(
+                check=models.Q(end__isnull=True) | models.Q(end__gte=models.F('start')),
+                name='core_pause_end_after_start'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Pause: {self.habit.name} - {self.start} to {self.end or "now"}'
+
+
 class Progress(models.Model):
     """
     A model class that represents the completion status of a habit on a date.
@@ -81,16 +171,40 @@ class Progress(models.Model):
       completion status in the DOM (e.g. in calendars, togglers).
     - Has a many-to-one relationship with the Habit model, one instance for
       each day.
+    - On Postgres, the table is partitioned by year of `date` (see
+      `core.db.partitions`), and its primary key is (id, date), since
+      unique constraints must include the partition key. Ids stay unique.
     """
 
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     completed = models.BooleanField(default=False)
 
-    def get_completion_status(self):
+    class Meta:
+        constraints = [
+            # One instance per habit per day. The unique index also serves
+            # every (habit, date) and (habit, date range) lookup, and
+            # carries `completed` so weekly totals are index-only scans.
+            models.UniqueConstraint(fields=['habit', 'date'],
+                                    include=['completed'],
+                                    name='core_progress_habit_date_uniq'),
+        ]
+        indexes = [
+            # Covers the per-user "today" lookup on the homepage,
+            # which filters on a single date across all of a user's habits.
+            models.Index(fields=['date', 'habit'],
+                         include=['completed'],
+                         name='core_progress_date_habit_idx'),
+        ]
+
+    def get_completion_status(self, engine=None):
         """
         Returns a string completion status for the habit on this day.
 
+        The status is resolved by a `StatusEngine`. Progress objects that were
+        bound to an engine (see `StatusEngine.bind()`) share its preloaded
+        weekly totals; otherwise a single-habit, single-week engine is used.
+
         Returns:
         - 'completed_for_day' - Completed for the day.
         - 'completed_for_week' - Completed for the week (weekly rate met).
@@ -99,30 +213,12 @@ class Progress(models.Model):
         - 'paused' - Habit tracking paused on this day.
         """
 
-        # Check if the habit is paused or inactive
-        if self.paused:
-            return 'paused'
-
-        # Calculate the start and end of the week based on the date
-        start_of_week = self.date - timedelta(days=self.date.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
+        from .status import StatusEngine
 
-        # Count the number of completed Progress objects for this week
-        completed_this_week = Progress.objects.filter(
-            habit=self.habit,
-            date__range=(start_of_week, end_of_week),
-            completed=True
-        ).count()
-
-        # Compute the completion status and return it
-        if completed_this_week >= self.habit.weekly_rate:
-            return 'completed_for_week'
-        elif self.completed:
-            return 'completed_for_day'
-        elif self.date < timezone.now():
-            return 'missed'
-        else:
-            return 'incomplete'
+        engine = engine or getattr(self, 'status_engine', None)
+        if engine is None:
+            engine = StatusEngine([self.habit], self.date)
+        return engine.get_status(self.habit_id, self.date)
 
     @property
     def color(self):
@@ -131,17 +227,191 @@ class Progress(models.Model):
         the completion status for this date.
         """
 
-        # Mapping of completion statuses to their corresponding color codes
-        status_color_map = {
-            'completed_for_week': 'gold',
-            'completed_for_day': 'green',
-            'missed': 'red',
-            'incomplete': 'white',
-            'paused': 'gray'
-        }
+        from .status import STATUS_COLOR_MAP
 
         # Retrieve the color using the completion status or default to gray
-        return status_color_map.get(self.get_completion_status(), 'gray')
+        return STATUS_COLOR_MAP.get(self.get_completion_status(), 'gray')
 
     def __str__(self):
         return f'Progress: {self.habit.name} - {self.date}'
+
+
+class ProgressYear(models.Model):
+    """
+    A model class that stores a habit's completion status for a whole year
+    as a compact bitmask, used by `BitmapProgressStore`.
+
+    - Bit n of `mask` is set if the habit was completed on day n of the year
+      (0 = January 1st). 366 bits fit in 46 bytes, little-endian.
+    - Has a many-to-one relationship with the Habit model, one instance for
+      each year.
+    """
+
+    # Number of bytes needed to store one bit per day of a leap year
+    MASK_SIZE = 46
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    year = models.SmallIntegerField()
+    mask = models.BinaryField(default=bytes(MASK_SIZE))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'year'],
+                                    name='core_progressyear_habit_year_uniq'),
+        ]
+
+    @property
+    def bits(self):
+        """
+        A property that returns the mask as an integer, bit 0 = January 1st.
+        """
+
+        return int.from_bytes(self.mask, 'little')
+
+    @bits.setter
+    def bits(self, value):
+        self.mask = value.to_bytes(self.MASK_SIZE, 'little')
+
+    def __str__(self):
+        return f'Progress: {self.habit.name} - {self.year}'
+
+
+class ProgressArchive(models.Model):
+    """
+    A model class that records a year of progress archived by
+    `manage.py archive_progress`.
+
+    - The year's Progress rows were moved into ProgressYear bitmasks, and its
+      Progress partition detached, so `TieredProgressStore` reads the year
+      from the masks.
+    - Years are archived oldest first, so every year before the latest
+      archived year is archived too.
+    """
+
+    year = models.SmallIntegerField(unique=True)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Archived progress: {self.year}'
+
+
+class HabitStats(models.Model):
+    """
+    A model class that stores a habit's statistics, maintained incrementally
+    on every completion change so that reads never scan the habit's history.
+
+    - `run_lengths` is a histogram of the lengths of every streak
+      (run of consecutive completed days), so the longest streak stays exact
+      when a day in the middle of a streak is un-toggled.
+    - `streak_start` and `streak_end` bound the most recent streak.
+    - `recent_mask` holds the last RECENT_DAYS days ending on `recent_end`,
+      one bit per day (bit 0 = `recent_end`), for the rolling completion rate.
+    - Has a one-to-one relationship with the Habit model.
+    """
+
+    # Number of days covered by the rolling completion rate
+    RATE_DAYS = 30
+    # Number of days stored in `recent_mask` (fits a signed 64-bit integer)
+    RECENT_DAYS = 62
+
+    habit = models.OneToOneField(Habit,
+                                 on_delete=models.CASCADE,
+                                 primary_key=True,
+                                 related_name='stats')
+    tracked_since = models.DateField(default=timezone.localdate)
+    completed_days = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    run_lengths = models.JSONField(default=dict)
+    streak_start = models.DateField(null=True, blank=True)
+    streak_end = models.DateField(null=True, blank=True)
+    recent_mask = models.BigIntegerField(default=0)
+    recent_end = models.DateField(null=True, blank=True)
+
+    @property
+    def current_streak(self):
+        """
+        A property that returns the length of the streak ending today or
+        yesterday, or 0 if the most recent streak has been broken.
+        """
+
+        today = timezone.localdate()
+        if self.streak_end is None or (today - self.streak_end).days > 1:
+            return 0
+        return (self.streak_end - self.streak_start).days + 1
+
+    @property
+    def completion_rate(self):
+        """
+        A property that returns the fraction of days completed over the last
+        RATE_DAYS days (or since tracking started, if more recent).
+        """
+
+        today = timezone.localdate()
+        days = min(self.RATE_DAYS, (today - self.tracked_since).days + 1)
+        if days <= 0 or self.recent_end is None:
+            return 0.0
+
+        # Shift the mask so that bit 0 is today, then count the window's bits
+        offset = (today - self.recent_end).days
+        if offset >= days:
+            return 0.0
+        window = (self.recent_mask << offset) & ((1 << days) - 1)
+        return window.bit_count() / days
+
+    def record(self, day, completed, left, right):
+        """
+        Updates the statistics in place after the habit's completion status
+        on `day` changed to `completed`.
+
+        `left` and `right` are the lengths of the streaks immediately before
+        and after `day`, excluding `day` itself.
+        """
+
+        runs = {int(length): count for length, count in self.run_lengths.items()}
+
+        def add_run(length, count):
+            if length:
+                runs[length] = runs.get(length, 0) + count
+                if not runs[length]:
+                    del runs[length]
+
+        # Completing a day merges its neighboring streaks into one,
+        # un-completing it splits its streak in two
+        sign = 1 if completed else -1
+        add_run(left, -sign)
+        add_run(right, -sign)
+        add_run(left + 1 + right, sign)
+        self.run_lengths = {str(length): count for length, count in runs.items()}
+        self.longest_streak = max(runs, default=0)
+        self.completed_days += sign
+        self.tracked_since = min(self.tracked_since, day)
+
+        # Keep track of the most recent streak
+        start = day - timedelta(days=left)
+        end = day + timedelta(days=right)
+        if completed:
+            if self.streak_end is None or end >= self.streak_end:
+                self.streak_start, self.streak_end = start, end
+        elif self.streak_end is not None and self.streak_start <= day <= self.streak_end:
+            if right:
+                self.streak_start, self.streak_end = day + timedelta(days=1), end
+            elif left:
+                self.streak_start, self.streak_end = start, day - timedelta(days=1)
+            else:
+                self.streak_start = self.streak_end = None
+
+        # Slide the recent window forward if needed, then flip the day's bit
+        if self.recent_end is None or day > self.recent_end:
+            shift = (day - self.recent_end).days if self.recent_end else self.RECENT_DAYS
+            self.recent_mask = self.recent_mask << shift if shift < self.RECENT_DAYS else 0
+            self.recent_end = day
+        offset = (self.recent_end - day).days
+        if offset < self.RECENT_DAYS:
+            if completed:
+                self.recent_mask |= 1 << offset
+            else:
+                self.recent_mask &= ~(1 << offset)
+        self.recent_mask &= (1 << self.RECENT_DAYS) - 1
+
+    def __str__(self):
+        return f'Stats: {self.habit.name}'
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.http import Http404
+from .models import Habit
+
+
+class HabitCache:
+    """
+    Habit cache
+
+    A bounded, in-process LRU cache of the habit fields needed to serve
+    toggles, keyed by (user id, slug), so a burst of toggles on the same
+    habit only fetches its row once.
+
+    - Holds at most `max_size` habits, evicting the least recently used.
+    - Entries are dropped as soon as their habit is saved or deleted in this
+      process (see `core.signals`), and expire after `timeout` seconds, which
+      bounds how long other processes can serve a changed habit.
+    """
+
+    # Fields cached per habit, in model field order. Other fields are
+    # deferred, and loaded on first access.
+    FIELDS = ['id', 'user_id', 'slug', 'name', 'weekly_rate']
+
+    def __init__(self, max_size=1024, timeout=60):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        # Keys by habit id, to forget habits whose slug changed
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id, slug):
+        """
+        Returns the cached field values of a user's habit, or None.
+        """
+
+        key = (user_id, slug)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            values, expires = entry
+            if expires < time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return values
+
+    def set(self, values):
+        """
+        Caches the field values of a habit (in FIELDS order).
+        """
+
+        habit_id, user_id, slug = values[:3]
+        key = (user_id, slug)
+        with self.lock:
+            self.forget_locked(habit_id)
+            self.entries[key] = (values, time.monotonic() + self.timeout)
+            self.keys[habit_id] = key
+            while len(self.entries) > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def forget(self, habit_id):
+        """
+        Drops a habit from the cache.
+        """
+
+        with self.lock:
+            self.forget_locked(habit_id)
+
+    def forget_locked(self, habit_id):
+        key = self.keys.get(habit_id)
+        if key is not None:
+            self.remove(key)
+
+    def remove(self, key):
+        values, expires = self.entries.pop(key)
+        self.keys.pop(values[0], None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys.clear()
+
+
+_habit_cache = None
+
+
+def get_habit_cache():
+    """
+    Returns the process-wide habit cache, sized by the `HABIT_CACHE_SIZE`
+    and `HABIT_CACHE_TIMEOUT` settings.
+    """
+
+    global _habit_cache
+    if _habit_cache is None:
+        _habit_cache = HabitCache(
+            getattr(settings, 'HABIT_CACHE_SIZE', 1024),
+            getattr(settings, 'HABIT_CACHE_TIMEOUT', 60)
+        )
+    return _habit_cache
+
+
+def build_habit(values):
+    """
+    Returns a Habit instance from cached field values, as if it had been
+    loaded from the database with `only(*HabitCache.FIELDS)`.
+    """
+
+    return Habit.from_db('default', HabitCache.FIELDS, values)
+
+
+def resolve_habit(user, slug):
+    """
+    Returns the user's habit with this slug, from the habit cache when
+    possible, or raises Http404.
+    """
+
+    cache = get_habit_cache()
+    values = cache.get(user.id, slug)
+    if values is None:
+        values = Habit.objects.filter(user=user, slug=slug).values_list(*HabitCache.FIELDS).first()
+        if values is None:
+            raise Http404('No habit matches the given query.')
+        cache.set(values)
+    return build_habit(values)
+
+
+async def aresolve_habit(user, slug):
+    """
+    Async version of `resolve_habit()`, using the async ORM on cache misses.
+    """
+
+    cache = get_habit_cache()
+    values = cache.get(user.id, slug)
+    if values is None:
+        values = await Habit.objects.filter(user=user, slug=slug).values_list(*HabitCache.FIELDS).afirst()
+        if values is None:
+            raise Http404('No habit matches the given query.')
+        cache.set(values)
+    return build_habit(values)
+
+
+def forget_habit(habit_id):
+    """
+    Drops a habit from this process's habit cache.
+    Called whenever a habit is saved or deleted.
+    """
+
+    get_habit_cache().forget(habit_id)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Habit, Pause, Progress, ProgressYear
+from .resolver import forget_habit
+from .status import get_pauses_cache_key
+from .versions import bump_habit_version, bump_user_version
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def habit_changed(sender, instance, **kwargs):
+    """
+    Bumps the habit's version when its settings (weekly rate, etc.)
+    change, since they affect every rendered status, and its user's version,
+    since the dashboard lists every habit. Also drops the habit from
+    the habit cache.
+    """
+
+    forget_habit(instance.id)
+    bump_habit_version(instance.id)
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=Progress)
+@receiver(post_delete, sender=Progress)
+@receiver(post_save, sender=ProgressYear)
+@receiver(post_delete, sender=ProgressYear)
+def progress_changed(sender, instance, **kwargs):
+    """
+    Bumps the habit's version and its user's version on every write
+    to its progress.
+    """
+
+    # Deleting a habit cascades to its progress, and bumps both versions once
+    origin = kwargs.get('origin')
+    if isinstance(origin, Habit) or getattr(origin, 'model', None) is Habit:
+        return
+
+    bump_habit_version(instance.habit_id)
+    # Writes almost always go through a loaded habit, so this rarely queries
+    if sender.habit.is_cached(instance):
+        user_id = instance.habit.user_id
+    else:
+        user_id = Habit.objects.filter(id=instance.habit_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_user_version(user_id)
+
+
+@receiver(post_save, sender=Pause)
+@receiver(post_delete, sender=Pause)
+def pause_changed(sender, instance, **kwargs):
+    """
+    Drops the habit's cached pause intervals, and bumps the habit's version
+    and its user's version, since pauses change statuses and weekly targets.
+    """
+
+    cache.delete(get_pauses_cache_key(instance.habit_id))
+
+    origin = kwargs.get('origin')
+    if isinstance(origin, Habit) or getattr(origin, 'model', None) is Habit:
+        return
+
+    bump_habit_version(instance.habit_id)
+    user_id = Habit.objects.filter(id=instance.habit_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_user_version(user_id)
@@ -0,0 +1,201 @@
+import gzip
+import mimetypes
+import os
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Precompressed variants, by Content-Encoding, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# Extensions of the files worth compressing (images and fonts already are)
+COMPRESSED_EXTENSIONS = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico'}
+
+# Cache-Control of files with a content hash in their name, which never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Compressed manifest static files storage
+
+    A manifest storage (file names carry a hash of their content) which also
+    writes gzip and, when the `brotli` package is installed, brotli variants
+    of every hashed text file at collectstatic time, next to it, e.g.
+    `css/styles.3f2a9c.css.gz`. Variants that aren't smaller aren't written.
+
+    Before collectstatic has run (development, tests), names are served
+    as is rather than raising for a missing manifest.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if os.path.splitext(name)[1] in COMPRESSED_EXTENSIONS:
+                self.compress(name)
+
+    def compress(self, name):
+        """
+        Writes the compressed variants of a collected file.
+        """
+
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            content = file.read()
+        variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(content)
+        for encoding, compressed in variants.items():
+            if len(compressed) < len(content):
+                with open(path + ENCODINGS[encoding], 'wb') as file:
+                    file.write(compressed)
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+def get_accepted_encodings(header):
+    """
+    Returns the content codings accepted by an `Accept-Encoding` header,
+    leaving out those with `q=0`.
+    """
+
+    accepted = set()
+    for coding in header.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name)
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Static files middleware
+
+    Serves collected static files (`STATIC_ROOT`) under `STATIC_URL`,
+    ahead of sessions, auth and the URL resolver.
+
+    - Picks the brotli or gzip variant written by
+      `CompressedManifestStaticFilesStorage` when the request's
+      `Accept-Encoding` allows it, and varies on `Accept-Encoding`.
+    - Sends far-future, immutable cache headers for hashed file names,
+      and `STATIC_MAX_AGE` seconds for the original names.
+
+    Files are indexed once at startup, since collected files only change on
+    deploy. When there's no `STATIC_ROOT` to serve (e.g. in development,
+    where `runserver` serves static files itself), the middleware
+    removes itself.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        root = getattr(settings, 'STATIC_ROOT', None)
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 300)
+        self.files = self.index(root)
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def index(self, root):
+        """
+        Returns the collected files, by name, as mappings of content coding
+        (None for the original) to path.
+        """
+
+        paths = {}
+        for directory, subdirectories, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                paths[os.path.relpath(path, root).replace(os.sep, '/')] = path
+
+        files = {}
+        for name, path in paths.items():
+            stem, suffix = os.path.splitext(name)
+            # Skip variants, but not e.g. an archive collected as is
+            if suffix in ENCODINGS.values() and stem in paths:
+                continue
+            files[name] = {None: path}
+            for encoding, suffix in ENCODINGS.items():
+                if name + suffix in paths:
+                    files[name][encoding] = paths[name + suffix]
+        return files
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        variants = self.match(request)
+        if variants is None:
+            return self.get_response(request)
+        return self.serve(request, variants)
+
+    async def __acall__(self, request):
+        variants = self.match(request)
+        if variants is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.serve)(request, variants)
+
+    def match(self, request):
+        """
+        Returns the variants of the collected file requested, or None.
+        """
+
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        return self.files.get(request.path_info[len(self.prefix):])
+
+    def serve(self, request, variants):
+        """
+        Returns a response with the best variant of a file for the request.
+        """
+
+        accepted = get_accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next(
+            (encoding for encoding in ENCODINGS
+             if encoding in variants and (encoding in accepted or '*' in accepted)),
+            None
+        )
+        path = variants[encoding]
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        name = request.path_info[len(self.prefix):]
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Length'] = len(content)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        if name in self.immutable:
+            response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response['Cache-Control'] = f'public, max-age={self.max_age}'
+        return response
@@ -0,0 +1,174 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import HabitStats
+from .status import week_start
+from .storage import get_progress_store
+
+
+def get_neighbor_runs(weeks, habit_id, day, window):
+    """
+    Returns the lengths of the streaks immediately before and after `day`
+    (excluding `day` itself), looking at most `window` days each way.
+
+    `weeks` maps (habit id, week start) to weekly completion masks, as
+    returned by `ProgressStore.get_week_masks()`, and must cover the window.
+    Since no streak is longer than the habit's longest streak, a window of
+    `longest_streak + 1` days is always enough, whatever the history size.
+    """
+
+    def is_completed(other):
+        mask = weeks.get((habit_id, week_start(other)), 0)
+        return bool(mask >> other.weekday() & 1)
+
+    def run_length(step):
+        length = 0
+        other = day + timedelta(days=step)
+        while length < window and is_completed(other):
+            length += 1
+            other += timedelta(days=step)
+        return length
+
+    return run_length(-1), run_length(1)
+
+
+def set_completed(weeks, habit_id, day, completed):
+    """
+    Sets or clears a day's bit in a mapping of weekly completion masks.
+    """
+
+    key = (habit_id, week_start(day))
+    mask = weeks.get(key, 0)
+    if completed:
+        mask |= 1 << day.weekday()
+    else:
+        mask &= ~(1 << day.weekday())
+    weeks[key] = mask
+
+
+def compute_habit_stats(habit, store=None, tracked_since=None):
+    """
+    Recomputes a habit's statistics from its full completion history,
+    and returns them as an unsaved HabitStats object.
+    """
+
+    store = store or get_progress_store()
+    stats = HabitStats(habit=habit,
+                       tracked_since=tracked_since or timezone.localdate(),
+                       run_lengths={})
+
+    # Replay the history in date order. Each day extends the previous streak
+    # if it directly follows it, so neighbors never need to be looked up.
+    previous = None
+    left = 0
+    for day in store.iter_completed_dates(habit.id):
+        if previous is not None and day - previous == timedelta(days=1):
+            left += 1
+        else:
+            left = 0
+        stats.record(day, True, left, 0)
+        previous = day
+
+    return stats
+
+
+def get_habit_stats(habit, store=None):
+    """
+    Returns the habit's HabitStats object, building it from the full
+    history the first time it's requested for a habit that predates it.
+    """
+
+    try:
+        return habit.stats
+    except HabitStats.DoesNotExist:
+        stats = compute_habit_stats(habit, store)
+        stats.save()
+        return stats
+
+
+def record_completions(changes, store=None, weeks=None):
+    """
+    Updates the statistics of every habit affected by a list of
+    (habit, day, completed) changes, once they've been written. The changes
+    are replayed in order, and each one must flip the day's status.
+
+    `weeks` are the habits' weekly completion masks, from before or after the
+    changes, if the caller already loaded them. They must cover
+    `longest_streak + 1` days plus one day per change around every changed
+    day. Otherwise they're fetched in one bounded range query.
+
+    Costs a fixed number of queries however many changes there are,
+    and however long the habits' histories are.
+    """
+
+    if not changes:
+        return {}
+
+    store = store or get_progress_store()
+    habits = {habit.id: habit for habit, day, completed in changes}
+
+    with transaction.atomic():
+        stats = HabitStats.objects.select_for_update().in_bulk(list(habits))
+
+        # Habits that predate HabitStats are built from their full history,
+        # which already reflects the changes
+        rebuilt = set()
+        for habit_id, habit in habits.items():
+            if habit_id not in stats:
+                stats[habit_id] = get_habit_stats(habit, store)
+                rebuilt.add(habit_id)
+        changes = [change for change in changes if change[0].id not in rebuilt]
+        if not changes:
+            return stats
+
+        window = max(stats[habit.id].longest_streak for habit, day, completed in changes)
+        window += len(changes) + 1
+        if weeks is None:
+            days = [day for habit, day, completed in changes]
+            weeks = store.get_week_masks(
+                list(habits),
+                week_start(min(days) - timedelta(days=window)),
+                week_start(max(days) + timedelta(days=window)) + timedelta(days=6)
+            )
+
+        # Start from each changed day's status before the changes,
+        # then replay them against the in-memory masks
+        for habit, day, completed in reversed(changes):
+            set_completed(weeks, habit.id, day, not completed)
+        for habit, day, completed in changes:
+            left, right = get_neighbor_runs(weeks, habit.id, day, window)
+            stats[habit.id].record(day, completed, left, right)
+            set_completed(weeks, habit.id, day, completed)
+
+        HabitStats.objects.bulk_update(
+            stats.values(),
+            ['tracked_since', 'completed_days', 'longest_streak', 'run_lengths',
+             'streak_start', 'streak_end', 'recent_mask', 'recent_end']
+        )
+
+    return stats
+
+
+def record_completion(habit, day, completed, store=None):
+    """
+    Updates a habit's statistics after its completion status on `day`
+    changed to `completed`.
+
+    Costs one bounded range query for the neighboring streaks and one update,
+    no matter how long the habit's history is.
+    """
+
+    return record_completions([(habit, day, completed)], store)[habit.id]
+
+
+def toggle_completion(habit, day, store=None):
+    """
+    Flips a habit's completion status on `day` in the progress store and
+    updates its statistics in the same transaction. Returns the new status.
+    """
+
+    store = store or get_progress_store()
+    with transaction.atomic():
+        completed = store.toggle(habit, day)
+        record_completion(habit, day, completed, store)
+    return completed
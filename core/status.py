@@ -0,0 +1,364 @@
+from bisect import bisect_right
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Pause
+from .storage import get_progress_store
+
+
+# Mapping of completion statuses to their corresponding color codes
+STATUS_COLOR_MAP = {
+    'completed_for_week': 'gold',
+    'completed_for_day': 'green',
+    'missed': 'red',
+    'incomplete': 'white',
+    'paused': 'gray'
+}
+
+
+def week_start(day):
+    """
+    Returns the Monday of the ISO week containing `day`.
+    """
+
+    return day - timedelta(days=day.weekday())
+
+
+def get_weekly_target(weekly_rate, paused_days):
+    """
+    Returns the number of completions needed in a week with `paused_days`
+    paused days: the weekly rate, pro-rated to the unpaused days and
+    rounded up, e.g. 2 for a rate of 3 with 3 paused days.
+    """
+
+    return -(-weekly_rate * (7 - paused_days) // 7)
+
+
+def get_pauses_cache_key(habit_id):
+    """
+    Returns the cache key of a habit's pause intervals.
+    """
+
+    return f'pauses:{habit_id}'
+
+
+def group_pauses(habit_ids, rows):
+    """
+    Groups (habit id, start, end) rows into lists of (start, end) intervals,
+    by pauses cache key, with empty lists for habits without pauses.
+    """
+
+    intervals = {get_pauses_cache_key(habit_id): [] for habit_id in habit_ids}
+    for habit_id, start, end in rows:
+        intervals[get_pauses_cache_key(habit_id)].append((start, end))
+    return intervals
+
+
+class PauseIntervals:
+    """
+    Pause intervals
+
+    A habit's pauses, merged into disjoint intervals and sorted by start,
+    so finding whether the habit is paused on a day is a bisection.
+    """
+
+    def __init__(self, intervals):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            # Open-ended pauses last forever, until resumed
+            end = end or date.max
+            # Merge overlapping and adjacent intervals
+            if self.ends and (start - self.ends[-1]).days <= 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __contains__(self, day):
+        index = bisect_right(self.starts, day) - 1
+        return index >= 0 and day <= self.ends[index]
+
+    def __bool__(self):
+        return bool(self.starts)
+
+
+class StatusEngine:
+    """
+    Status engine
+
+    Resolves the completion status of a set of habits over a date range
+    from a single query to the progress store.
+
+    - Completions are grouped by habit and ISO week into a 7-bit mask of
+      which weekdays were completed (bit 0 = Monday). Weekly counts are
+      popcounts of the mask.
+    - The range is padded out to whole weeks, so weekly totals are correct
+      for days at the edges of the range.
+    - Each habit's pauses are loaded once, from the cache or with a single
+      query, into `PauseIntervals`. Paused days are resolved by bisection,
+      and don't count towards the week's total, whose target (the weekly
+      rate) is pro-rated to the week's unpaused days.
+    - Statuses and colors are then resolved from memory, so the number of
+      queries stays fixed no matter how many days or habits are rendered.
+
+    For example:
+        engine = StatusEngine(habits, date(2024, 4, 1), date(2024, 4, 30))
+        engine.get_color(habit, date(2024, 4, 12))
+
+    Returns:
+        'gold'
+    """
+
+    def __init__(self, habits, start, end=None, store=None):
+        self.habits = {habit.id: habit for habit in habits}
+        self.store = store or get_progress_store()
+        self.start = week_start(start)
+        self.end = week_start(end or start) + timedelta(days=6)
+        self.today = timezone.localdate()
+        self._weeks = None
+        self._pauses = None
+        self._pause_masks = {}
+
+    @property
+    def weeks(self):
+        """
+        A mapping of (habit id, week start) to a completion bitmask,
+        loaded on first access.
+        """
+
+        if self._weeks is None:
+            self._weeks = self.load()
+        return self._weeks
+
+    def load(self):
+        """
+        Fetches the weekly completion bitmasks in one query.
+        """
+
+        return self.store.get_week_masks(list(self.habits), self.start, self.end)
+
+    async def aload(self):
+        """
+        Fetches the weekly completion bitmasks in one query with the async ORM,
+        and the habits' pauses, so that statuses can then be resolved in
+        an async context.
+        """
+
+        if self._weeks is None:
+            self._weeks = await self.store.aget_week_masks(list(self.habits),
+                                                           self.start,
+                                                           self.end)
+        await self.aload_pauses()
+        return self._weeks
+
+    @property
+    def pauses(self):
+        """
+        A mapping of habit id to PauseIntervals, for habits with any pauses,
+        loaded on first access.
+        """
+
+        if self._pauses is None:
+            keys = {get_pauses_cache_key(habit_id): habit_id for habit_id in self.habits}
+            cached = cache.get_many(keys)
+            missing = [habit_id for key, habit_id in keys.items() if key not in cached]
+            if missing:
+                fetched = group_pauses(missing, self.get_pauses_queryset(missing))
+                cache.set_many(fetched)
+                cached.update(fetched)
+            self._pauses = self.build_pauses(keys, cached)
+        return self._pauses
+
+    async def aload_pauses(self):
+        """
+        Loads the habits' pauses with the cache's async API and the async ORM,
+        so that statuses can then be resolved in an async context.
+        """
+
+        if self._pauses is None:
+            keys = {get_pauses_cache_key(habit_id): habit_id for habit_id in self.habits}
+            cached = await cache.aget_many(keys)
+            missing = [habit_id for key, habit_id in keys.items() if key not in cached]
+            if missing:
+                rows = [row async for row in self.get_pauses_queryset(missing)]
+                fetched = group_pauses(missing, rows)
+                await cache.aset_many(fetched)
+                cached.update(fetched)
+            self._pauses = self.build_pauses(keys, cached)
+        return self._pauses
+
+    def get_pauses_queryset(self, habit_ids):
+        """
+        Returns the (habit id, start, end) rows of the habits' pauses.
+        """
+
+        return Pause.objects.filter(habit_id__in=habit_ids).values_list('habit_id', 'start', 'end')
+
+    def build_pauses(self, keys, cached):
+        """
+        Builds the PauseIntervals of the habits with any pauses,
+        from their cached intervals.
+        """
+
+        return {
+            habit_id: PauseIntervals(cached[key])
+            for key, habit_id in keys.items()
+            if cached.get(key)
+        }
+
+    def bind(self, progress_objects):
+        """
+        Attaches the engine to Progress objects, so that their `color`
+        property resolves from memory instead of querying the database.
+        """
+
+        for progress in progress_objects:
+            progress.status_engine = self
+        return progress_objects
+
+    def get_mask(self, habit_id, day):
+        """
+        Returns the completion bitmask for the week containing `day`.
+        """
+
+        if not self.start <= day <= self.end:
+            raise ValueError(f'{day} is outside of the loaded range '
+                             f'{self.start} - {self.end}.')
+        return self.weeks.get((habit_id, week_start(day)), 0)
+
+    def is_completed(self, habit_id, day):
+        """
+        Returns True if the habit was completed on `day`.
+        """
+
+        return bool(self.get_mask(habit_id, day) >> day.weekday() & 1)
+
+    def set_completed(self, habit_id, day, completed):
+        """
+        Sets or clears a day's completion in the loaded masks, e.g. after
+        a toggle, so statuses can be resolved again without reloading.
+        """
+
+        mask = self.get_mask(habit_id, day)
+        if completed:
+            mask |= 1 << day.weekday()
+        else:
+            mask &= ~(1 << day.weekday())
+        self.weeks[(habit_id, week_start(day))] = mask
+
+    def get_week_colors(self, habit, day):
+        """
+        Returns a mapping of each day of the week containing `day`
+        to the habit's color on that day.
+        """
+
+        monday = week_start(day)
+        days = [monday + timedelta(days=weekday) for weekday in range(7)]
+        return {other: self.get_color(habit, other) for other in days}
+
+    def get_pause_mask(self, habit_id, day):
+        """
+        Returns a 7-bit mask of the paused days of the week containing `day`
+        (bit 0 = Monday).
+        """
+
+        pauses = self.pauses.get(habit_id)
+        if not pauses:
+            return 0
+        monday = week_start(day)
+        mask = self._pause_masks.get((habit_id, monday))
+        if mask is None:
+            mask = 0
+            for weekday in range(7):
+                if monday + timedelta(days=weekday) in pauses:
+                    mask |= 1 << weekday
+            self._pause_masks[(habit_id, monday)] = mask
+        return mask
+
+    def is_paused(self, habit_id, day):
+        """
+        Returns True if tracking of the habit was paused on `day`.
+        """
+
+        return bool(self.get_pause_mask(habit_id, day) >> day.weekday() & 1)
+
+    def get_week_count(self, habit_id, day):
+        """
+        Returns the number of completed unpaused days in the week
+        containing `day`.
+        """
+
+        return (self.get_mask(habit_id, day) & ~self.get_pause_mask(habit_id, day)).bit_count()
+
+    def get_status(self, habit, day):
+        """
+        Returns a string completion status for the habit on this day.
+        See `Progress.get_completion_status()` for the possible values.
+        """
+
+        habit = self.habits[getattr(habit, 'id', habit)]
+        paused = self.get_pause_mask(habit.id, day)
+        if paused >> day.weekday() & 1:
+            return 'paused'
+        mask = self.get_mask(habit.id, day) & ~paused
+        return self.resolve_status(habit,
+                                   day,
+                                   mask >> day.weekday() & 1,
+                                   mask.bit_count(),
+                                   paused.bit_count())
+
+    def get_statuses(self, habit, days):
+        """
+        Returns a mapping of date to completion status for the given days.
+
+        Each week's completed and paused counts are computed once and shared
+        by all of the week's days, so building the map is a single pass
+        over `days`.
+        """
+
+        habit = self.habits[getattr(habit, 'id', habit)]
+        weeks = {}
+        statuses = {}
+        for day in days:
+            monday = week_start(day)
+            if monday not in weeks:
+                paused = self.get_pause_mask(habit.id, day)
+                mask = self.get_mask(habit.id, day) & ~paused
+                weeks[monday] = (mask, paused, mask.bit_count(), paused.bit_count())
+            mask, paused, count, paused_days = weeks[monday]
+            if paused >> day.weekday() & 1:
+                statuses[day] = 'paused'
+            else:
+                statuses[day] = self.resolve_status(habit,
+                                                    day,
+                                                    mask >> day.weekday() & 1,
+                                                    count,
+                                                    paused_days)
+        return statuses
+
+    def resolve_status(self, habit, day, completed, week_count, paused_days=0):
+        """
+        Computes the completion status of a habit on an unpaused day, given
+        whether the day was completed, the number of completed unpaused days
+        in its week, and the number of paused days in its week, which
+        pro-rate the weekly rate (see `get_weekly_target()`).
+        """
+
+        # Compute the completion status from the week's totals
+        if week_count >= get_weekly_target(habit.weekly_rate, paused_days):
+            return 'completed_for_week'
+        elif completed:
+            return 'completed_for_day'
+        elif day < self.today:
+            return 'missed'
+        else:
+            return 'incomplete'
+
+    def get_color(self, habit, day):
+        """
+        Returns the color value for the habit's completion status on this day,
+        or gray if the status is unknown.
+        """
+
+        return STATUS_COLOR_MAP.get(self.get_status(habit, day), 'gray')
@@ -0,0 +1,551 @@
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+from heapq import merge
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Sum
+from django.db.models.functions import Cast, ExtractIsoWeekDay, Power, TruncWeek
+from django.utils.module_loading import import_string
+from .models import Progress, ProgressArchive, ProgressYear
+from .versions import bump_habits_versions
+
+
+def get_progress_store():
+    """
+    Returns an instance of the progress store configured by the
+    `PROGRESS_STORE` setting, defaulting to `RowProgressStore`.
+    """
+
+    path = getattr(settings, 'PROGRESS_STORE', 'core.storage.RowProgressStore')
+    return import_string(path)()
+
+
+def day_of_year(day):
+    """
+    Returns the 0-based index of `day` within its year (January 1st = 0).
+    """
+
+    return (day - date(day.year, 1, 1)).days
+
+
+def iter_mask_dates(year, mask):
+    """
+    Yields the dates whose bit is set in a year's completion mask,
+    in ascending order.
+    """
+
+    bits = int.from_bytes(mask, 'little')
+    january_1st = date(year, 1, 1)
+    while bits:
+        # Pop the lowest set bit
+        index = (bits & -bits).bit_length() - 1
+        bits &= bits - 1
+        yield january_1st + timedelta(days=index)
+
+
+# Cache key of the first year that isn't archived, and the number of seconds
+# it's cached for. Per-process caches see a new boundary within that time,
+# so `archive_progress` waits that long before removing archived rows.
+ARCHIVED_BEFORE_CACHE_KEY = 'progress:archived-before'
+ARCHIVED_BEFORE_TIMEOUT = 60
+
+
+def get_archived_before():
+    """
+    Returns the first year whose progress isn't archived (see
+    `ProgressArchive`), or None if no year is. Cached for
+    ARCHIVED_BEFORE_TIMEOUT seconds, so reads rarely query it.
+    """
+
+    year = cache.get(ARCHIVED_BEFORE_CACHE_KEY)
+    if year is None:
+        latest = ProgressArchive.objects.aggregate(year=Max('year'))['year']
+        # 0 caches "nothing archived"
+        year = latest + 1 if latest is not None else 0
+        cache.set(ARCHIVED_BEFORE_CACHE_KEY, year, timeout=ARCHIVED_BEFORE_TIMEOUT)
+    return year or None
+
+
+async def aget_archived_before():
+    """
+    Async version of `get_archived_before()`.
+    """
+
+    year = await cache.aget(ARCHIVED_BEFORE_CACHE_KEY)
+    if year is None:
+        latest = (await ProgressArchive.objects.aaggregate(year=Max('year')))['year']
+        year = latest + 1 if latest is not None else 0
+        await cache.aset(ARCHIVED_BEFORE_CACHE_KEY, year, timeout=ARCHIVED_BEFORE_TIMEOUT)
+    return year or None
+
+
+class ProgressStore(ABC):
+    """
+    Progress store
+
+    The storage API for daily completions. Every store provides:
+
+    - `get_week_masks()` - A mapping of (habit id, week start) to a 7-bit
+      mask of the week's completed days (bit 0 = Monday), for a date range
+      starting on a Monday. Weeks without completions are omitted.
+      `aget_week_masks()` is its async version, using the async ORM.
+    - `get_daily_counts()` - A mapping of date to the number of habits
+      completed on it, for a date range, from a single query.
+      Days without completions are omitted. `aget_daily_counts()` is its
+      async version.
+    - `iter_completed_dates()` - Yields every date a habit was completed on,
+      in ascending order.
+    - `iter_progress()` - Yields the (habit id, date, completed) history of
+      any number of habits, ordered by habit and date, from a chunked
+      server-side cursor, so memory stays flat whatever its size.
+    - `toggle()` - Flips a habit's completion status on a date
+      and returns the new status.
+    - `set_many()` - Sets the completion status of any number of
+      (habit, date, completed) cells with a single bulk upsert.
+    """
+
+    @abstractmethod
+    def get_week_masks(self, habit_ids, start, end):
+        pass
+
+    @abstractmethod
+    async def aget_week_masks(self, habit_ids, start, end):
+        pass
+
+    @abstractmethod
+    def get_daily_counts(self, habit_ids, start, end):
+        pass
+
+    @abstractmethod
+    async def aget_daily_counts(self, habit_ids, start, end):
+        pass
+
+    @abstractmethod
+    def iter_completed_dates(self, habit_id):
+        pass
+
+    @abstractmethod
+    def iter_progress(self, habit_ids, chunk_size=2000):
+        pass
+
+    @abstractmethod
+    def toggle(self, habit, day):
+        pass
+
+    @abstractmethod
+    def set_many(self, changes):
+        pass
+
+
+class RowProgressStore(ProgressStore):
+    """
+    Row progress store
+
+    Stores one Progress row per habit per day (the default).
+    """
+
+    def get_queryset(self, habit_ids, start, end):
+        """
+        Returns the aggregate query of completed days for every habit
+        in the range, grouped by habit and ISO week.
+        """
+
+        return (
+            Progress.objects
+            .filter(
+                habit_id__in=habit_ids,
+                date__range=(start, end),
+                completed=True
+            )
+            .annotate(week=TruncWeek('date'))
+            .values('habit_id', 'week')
+            .annotate(
+                count=Count('id'),
+                # Sum of 2^(weekday - 1) over the week's completed days
+                mask=Sum(Cast(
+                    Power(2, ExtractIsoWeekDay('date') - 1),
+                    output_field=IntegerField()
+                ))
+            )
+            .order_by()
+        )
+
+    def get_week_masks(self, habit_ids, start, end):
+        return {
+            (row['habit_id'], row['week']): int(row['mask'])
+            for row in self.get_queryset(habit_ids, start, end)
+        }
+
+    async def aget_week_masks(self, habit_ids, start, end):
+        return {
+            (row['habit_id'], row['week']): int(row['mask'])
+            async for row in self.get_queryset(habit_ids, start, end)
+        }
+
+    def get_daily_counts_queryset(self, habit_ids, start, end):
+        """
+        Returns the aggregate query of the number of completed habits
+        in the range, grouped by date.
+        """
+
+        return (
+            Progress.objects
+            .filter(
+                habit_id__in=habit_ids,
+                date__range=(start, end),
+                completed=True
+            )
+            .values('date')
+            .annotate(count=Count('id'))
+            .values_list('date', 'count')
+            .order_by()
+        )
+
+    def get_daily_counts(self, habit_ids, start, end):
+        return dict(self.get_daily_counts_queryset(habit_ids, start, end))
+
+    async def aget_daily_counts(self, habit_ids, start, end):
+        return {
+            day: count
+            async for day, count in self.get_daily_counts_queryset(habit_ids, start, end)
+        }
+
+    def get_progress_queryset(self, habit_ids):
+        """
+        Returns the query of every Progress row of the habits.
+        """
+
+        return Progress.objects.filter(habit_id__in=habit_ids)
+
+    def iter_completed_dates(self, habit_id):
+        return self.get_progress_queryset([habit_id]).filter(
+            completed=True
+        ).order_by('date').values_list('date', flat=True).iterator()
+
+    def iter_progress(self, habit_ids, chunk_size=2000):
+        return self.get_progress_queryset(habit_ids).order_by(
+            'habit_id', 'date'
+        ).values_list(
+            'habit_id', 'date', 'completed'
+        ).iterator(chunk_size=chunk_size)
+
+    def toggle(self, habit, day):
+        with transaction.atomic():
+            progress, created = Progress.objects.select_for_update().get_or_create(
+                habit=habit,
+                date=day
+            )
+            # Reuse the loaded habit, e.g. for the signal receivers
+            progress.habit = habit
+            progress.completed = not progress.completed
+            progress.save(update_fields=['completed'])
+        return progress.completed
+
+    def set_many(self, changes):
+        Progress.objects.bulk_create(
+            [Progress(habit=habit, date=day, completed=completed)
+             for habit, day, completed in changes],
+            update_conflicts=True,
+            unique_fields=['habit', 'date'],
+            update_fields=['completed']
+        )
+        # Bulk writes don't send model signals
+        bump_habits_versions(habit for habit, day, completed in changes)
+
+
+class BitmapProgressStore(ProgressStore):
+    """
+    Bitmap progress store
+
+    Stores one ProgressYear row per habit per year, holding a 366-bit
+    completion mask.
+
+    - Toggles are bit flips on a single row.
+    - Weekly masks are 7-bit slices of the year's mask, so weekly counts
+      are popcounts.
+    - A month (or any range within a year) is a single row fetch per habit.
+
+    Enable it with:
+        PROGRESS_STORE = 'core.storage.BitmapProgressStore'
+    and convert existing Progress rows with `manage.py backfill_progress_years`.
+    """
+
+    def get_queryset(self, habit_ids, start, end):
+        """
+        Returns the query of the year masks covering the range.
+        """
+
+        return ProgressYear.objects.filter(
+            habit_id__in=habit_ids,
+            year__in=range(start.year, end.year + 1)
+        ).values_list('habit_id', 'year', 'mask')
+
+    def get_week_masks(self, habit_ids, start, end):
+        # Fetch the year masks covering the range in one query
+        years = {
+            (habit_id, year): int.from_bytes(mask, 'little')
+            for habit_id, year, mask in self.get_queryset(habit_ids, start, end)
+        }
+        return self.slice_weeks(years, habit_ids, start, end)
+
+    async def aget_week_masks(self, habit_ids, start, end):
+        years = {
+            (habit_id, year): int.from_bytes(mask, 'little')
+            async for habit_id, year, mask in self.get_queryset(habit_ids, start, end)
+        }
+        return self.slice_weeks(years, habit_ids, start, end)
+
+    def get_daily_counts(self, habit_ids, start, end):
+        # Fetch the year masks covering the range in one query
+        masks = list(self.get_queryset(habit_ids, start, end))
+        return self.count_days(masks, start, end)
+
+    async def aget_daily_counts(self, habit_ids, start, end):
+        masks = [row async for row in self.get_queryset(habit_ids, start, end)]
+        return self.count_days(masks, start, end)
+
+    def count_days(self, masks, start, end):
+        """
+        Counts the set bits of (habit id, year, mask) rows
+        for each day of the range.
+        """
+
+        counts = {}
+        for habit_id, year, mask in masks:
+            bits = int.from_bytes(mask, 'little')
+            day = max(start, date(year, 1, 1))
+            last = min(end, date(year, 12, 31))
+            # Only look at the range's bits
+            bits >>= day_of_year(day)
+            while bits and day <= last:
+                if bits & 1:
+                    counts[day] = counts.get(day, 0) + 1
+                bits >>= 1
+                day += timedelta(days=1)
+        return counts
+
+    def slice_weeks(self, years, habit_ids, start, end):
+        """
+        Slices a mapping of (habit id, year) to year masks
+        into weekly completion masks.
+        """
+
+        weeks = {}
+        for week in range(0, (end - start).days + 1, 7):
+            monday = start + timedelta(days=week)
+            sunday = monday + timedelta(days=6)
+            for habit_id in habit_ids:
+                # Slice 7 bits out of the year's mask, or assemble them
+                # day by day for weeks that straddle new year
+                if monday.year == sunday.year:
+                    bits = years.get((habit_id, monday.year), 0)
+                    mask = bits >> day_of_year(monday) & 0x7F
+                else:
+                    mask = 0
+                    for weekday in range(7):
+                        day = monday + timedelta(days=weekday)
+                        bits = years.get((habit_id, day.year), 0)
+                        mask |= (bits >> day_of_year(day) & 1) << weekday
+                if mask:
+                    weeks[(habit_id, monday)] = mask
+        return weeks
+
+    def iter_completed_dates(self, habit_id):
+        rows = ProgressYear.objects.filter(
+            habit_id=habit_id
+        ).order_by('year').values_list('year', 'mask')
+        for year, mask in rows:
+            yield from iter_mask_dates(year, mask)
+
+    def iter_progress(self, habit_ids, chunk_size=2000):
+        # Only completed days are stored
+        rows = ProgressYear.objects.filter(
+            habit_id__in=habit_ids
+        ).order_by('habit_id', 'year').values_list(
+            'habit_id', 'year', 'mask'
+        ).iterator(chunk_size=chunk_size)
+        for habit_id, year, mask in rows:
+            for day in iter_mask_dates(year, mask):
+                yield habit_id, day, True
+
+    def toggle(self, habit, day):
+        with transaction.atomic():
+            progress_year, created = ProgressYear.objects.select_for_update().get_or_create(
+                habit=habit,
+                year=day.year
+            )
+            progress_year.habit = habit
+            progress_year.bits ^= 1 << day_of_year(day)
+            progress_year.save(update_fields=['mask'])
+        return bool(progress_year.bits >> day_of_year(day) & 1)
+
+    def set_many(self, changes):
+        with transaction.atomic():
+            # Lock the affected year masks in one query
+            years = {
+                (progress_year.habit_id, progress_year.year): progress_year
+                for progress_year in ProgressYear.objects.select_for_update().filter(
+                    habit_id__in={habit.id for habit, day, completed in changes},
+                    year__in={day.year for habit, day, completed in changes}
+                )
+            }
+
+            # Set or clear each day's bit in memory
+            for habit, day, completed in changes:
+                progress_year = years.get((habit.id, day.year))
+                if progress_year is None:
+                    progress_year = years[(habit.id, day.year)] = ProgressYear(
+                        habit=habit,
+                        year=day.year
+                    )
+                bit = 1 << day_of_year(day)
+                progress_year.bits = progress_year.bits | bit if completed else progress_year.bits & ~bit
+
+            ProgressYear.objects.bulk_create(
+                years.values(),
+                update_conflicts=True,
+                unique_fields=['habit', 'year'],
+                update_fields=['mask']
+            )
+        # Bulk writes don't send model signals
+        bump_habits_versions(habit for habit, day, completed in changes)
+
+
+class TieredProgressStore(RowProgressStore):
+    """
+    Tiered progress store
+
+    Stores one Progress row per habit per day, like `RowProgressStore`,
+    except for the years archived by `manage.py archive_progress`, which
+    are read from their ProgressYear bitmasks, like `BitmapProgressStore`.
+    Ranges straddling the archive boundary are read from both, so views
+    don't see the difference.
+
+    Late edits to archived years flip their bits.
+
+    Enable it with:
+        PROGRESS_STORE = 'core.storage.TieredProgressStore'
+    """
+
+    def __init__(self):
+        self.bitmaps = BitmapProgressStore()
+
+    def split(self, start, end, archived_before):
+        """
+        Returns the (archived, live) parts of a date range, as (start, end)
+        pairs, or None when the range has no such part.
+        """
+
+        if archived_before is None or start.year >= archived_before:
+            return None, (start, end)
+        boundary = date(archived_before, 1, 1)
+        if end < boundary:
+            return (start, end), None
+        return (start, boundary - timedelta(days=1)), (boundary, end)
+
+    def merge_week_masks(self, archived, live):
+        """
+        Merges the week masks of both parts of a range, OR-ing the masks of
+        the week straddling the boundary.
+        """
+
+        for key, mask in live.items():
+            archived[key] = archived.get(key, 0) | mask
+        return archived
+
+    def get_week_masks(self, habit_ids, start, end):
+        archived, live = self.split(start, end, get_archived_before())
+        return self.merge_week_masks(
+            self.bitmaps.get_week_masks(habit_ids, *archived) if archived else {},
+            super().get_week_masks(habit_ids, *live) if live else {}
+        )
+
+    async def aget_week_masks(self, habit_ids, start, end):
+        archived, live = self.split(start, end, await aget_archived_before())
+        return self.merge_week_masks(
+            await self.bitmaps.aget_week_masks(habit_ids, *archived) if archived else {},
+            await super().aget_week_masks(habit_ids, *live) if live else {}
+        )
+
+    def get_daily_counts(self, habit_ids, start, end):
+        archived, live = self.split(start, end, get_archived_before())
+        return {
+            **(self.bitmaps.get_daily_counts(habit_ids, *archived) if archived else {}),
+            **(super().get_daily_counts(habit_ids, *live) if live else {}),
+        }
+
+    async def aget_daily_counts(self, habit_ids, start, end):
+        archived, live = self.split(start, end, await aget_archived_before())
+        return {
+            **(await self.bitmaps.aget_daily_counts(habit_ids, *archived) if archived else {}),
+            **(await super().aget_daily_counts(habit_ids, *live) if live else {}),
+        }
+
+    def get_progress_queryset(self, habit_ids, archived_before=None):
+        """
+        Returns the query of the habits' Progress rows of live years only.
+        Archived years are read from their masks, since their rows may
+        still be there until they're dropped.
+        """
+
+        queryset = super().get_progress_queryset(habit_ids)
+        if archived_before is not None:
+            queryset = queryset.filter(date__gte=date(archived_before, 1, 1))
+        return queryset
+
+    def iter_completed_dates(self, habit_id):
+        archived_before = get_archived_before()
+        if archived_before is not None:
+            rows = ProgressYear.objects.filter(
+                habit_id=habit_id,
+                year__lt=archived_before
+            ).order_by('year').values_list('year', 'mask')
+            for year, mask in rows:
+                yield from iter_mask_dates(year, mask)
+        yield from self.get_progress_queryset(
+            [habit_id], archived_before
+        ).filter(completed=True).order_by('date').values_list('date', flat=True).iterator()
+
+    def iter_progress(self, habit_ids, chunk_size=2000):
+        archived_before = get_archived_before()
+        if archived_before is None:
+            return super().iter_progress(habit_ids, chunk_size)
+
+        # Only completed days of archived years are stored
+        rows = ProgressYear.objects.filter(
+            habit_id__in=habit_ids,
+            year__lt=archived_before
+        ).order_by('habit_id', 'year').values_list(
+            'habit_id', 'year', 'mask'
+        ).iterator(chunk_size=chunk_size)
+        archived = (
+            (habit_id, day, True)
+            for habit_id, year, mask in rows
+            for day in iter_mask_dates(year, mask)
+        )
+        live = self.get_progress_queryset(habit_ids, archived_before).order_by(
+            'habit_id', 'date'
+        ).values_list(
+            'habit_id', 'date', 'completed'
+        ).iterator(chunk_size=chunk_size)
+        # Both streams are ordered by habit and date
+        return merge(archived, live, key=lambda row: row[:2])
+
+    def is_archived(self, day, archived_before):
+        return archived_before is not None and day.year < archived_before
+
+    def toggle(self, habit, day):
+        if self.is_archived(day, get_archived_before()):
+            return self.bitmaps.toggle(habit, day)
+        return super().toggle(habit, day)
+
+    def set_many(self, changes):
+        archived_before = get_archived_before()
+        archived = [change for change in changes if self.is_archived(change[1], archived_before)]
+        live = [change for change in changes if not self.is_archived(change[1], archived_before)]
+        with transaction.atomic():
+            if archived:
+                self.bitmaps.set_many(archived)
+            if live:
+                super().set_many(live)
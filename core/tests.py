@@ -1,3 +1,1419 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import hashlib
+import importlib.util
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import Http404, HttpResponse
+from django.template.base import Lexer, TokenType
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from .bench import QUERY_BUDGETS, check_results, run_benchmarks, seed
+from .calendars import HabitHTMLCalendar, MasterHTMLCalendar
+from .checks import check_shared_cache
+from .dashboard import get_dashboard
+from .db.pool import STATUS_IDLE, ConnectionPool, PoolTimeout
+from .db.routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaRoutingMiddleware, use_primary
+from .events import Broker, LocalBroker
+from .export import iter_export
+from .imports import ImportFormatError, import_progress
+from .management.commands.vendor_static import VENDOR_ASSETS
+from .models import Habit, HabitStats, Progress, ProgressArchive
+from .resolver import get_habit_cache, resolve_habit
+from .staticfiles import IMMUTABLE_CACHE_CONTROL, CompressedManifestStaticFilesStorage, brotli
+from .stats import compute_habit_stats, toggle_completion
+from .status import StatusEngine
+from .storage import ProgressStore, RowProgressStore, TieredProgressStore
+from .timing import ServerTimingMiddleware, histograms
+from .versions import bump_habit_version, bump_user_version, get_habit_version
+from .views import TOGGLEBOARD_SIZE
 
-# Create your tests here.
+
+def create_upsert_index():
+    """
+    Creates the (habit, date) unique index bulk upserts conflict on when
+    testing on SQLite, which skips the covering unique constraint
+    (models.W039).
+    """
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS core_progress_habit_date_test_uniq '
+                           'ON core_progress (habit_id, date)')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are Postgres-specific.')
+class ProgressQueryPlanTests(TestCase):
+    """
+    Checks that the hot Progress queries are served by an index.
+
+    Seeds USERS x HABITS_PER_USER x DAYS Progress rows (2,000,000 by default)
+    directly in SQL, analyzes the table, and fails if the planner
+    falls back to a sequential scan on `core_progress` for any of them.
+    """
+
+    USERS = 500
+    HABITS_PER_USER = 10
+    DAYS = 400
+    START = date(2024, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(username=f'user-{i}') for i in range(cls.USERS)
+        )
+        cls.user = User.objects.get(username='user-0')
+        Habit.objects.bulk_create(
+            Habit(user=user, slug=f'{user.username}-habit-{i}', name=f'Habit {i}')
+            for user in User.objects.all()
+            for i in range(cls.HABITS_PER_USER)
+        )
+        cls.habit = Habit.objects.filter(user=cls.user).first()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO core_progress (habit_id, date, completed)
+                SELECT habit.id, day::date, random() < 0.5
+                FROM core_habit habit
+                CROSS JOIN generate_series(%s::date, %s::date, '1 day') day
+                """,
+                [cls.START, cls.START + timedelta(days=cls.DAYS - 1)]
+            )
+            cursor.execute('ANALYZE core_progress')
+            cursor.execute('ANALYZE core_habit')
+
+    def assertNoSeqScan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan on core_progress', plan, plan)
+
+    def test_today_lookup(self):
+        day = self.START + timedelta(days=200)
+        self.assertNoSeqScan(
+            Progress.objects.filter(habit__user=self.user, date=day)
+        )
+
+    def test_toggle_lookup(self):
+        day = self.START + timedelta(days=200)
+        self.assertNoSeqScan(
+            Progress.objects.filter(habit=self.habit, date=day)
+        )
+
+    def test_weekly_status_lookup(self):
+        habit_ids = Habit.objects.filter(user=self.user).values_list('id', flat=True)
+        self.assertNoSeqScan(RowProgressStore().get_queryset(
+            list(habit_ids),
+            date(2024, 5, 27),
+            date(2024, 7, 7)
+        ))
+
+
+class BenchmarkQueryBudgetTests(TestCase):
+    """
+    Runs the `manage.py bench` benchmarks on a small synthetic dataset,
+    and fails if any view goes over its query budget.
+
+    Wall times are only compared against a baseline by the command itself,
+    as they depend on the machine.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed(users=3, habits=9, days=60)
+
+    def test_query_budgets(self):
+        results = run_benchmarks(self.user, repeat=1)
+        self.assertEqual(set(results), set(QUERY_BUDGETS))
+        self.assertEqual(check_results(results), [])
+
+    def test_query_counts_flat_in_history_size(self):
+        # Three times the history costs the same number of queries
+        user = seed(users=1, habits=9, days=180, prefix='large')
+        small = run_benchmarks(self.user, repeat=1)
+        large = run_benchmarks(user, repeat=1)
+        for name in QUERY_BUDGETS:
+            self.assertEqual(small[name]['queries'], large[name]['queries'], name)
+
+    def test_baseline_regression(self):
+        results = {'habit': {'queries': 1, 'time_ms': 20.0}}
+        baseline = {'habit': {'queries': 1, 'time_ms': 10.0}}
+        self.assertEqual(len(check_results(results, baseline, tolerance=0.25)), 1)
+        self.assertEqual(check_results(results, baseline, tolerance=1.5), [])
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Checks that the homepage and habit page answer 304 while the user's
+    and habit's versions are unchanged, and re-render once they change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('conditional', password='password')
+        cls.habit = Habit.objects.create(user=cls.user, name='Read')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertRevalidates(self, url, **params):
+        # Pages are only validated once the client has a CSRF cookie
+        self.assertNotIn('ETag', self.client.get(url, params))
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, params, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_homepage(self):
+        url = reverse('core:homepage')
+        etag = self.assertRevalidates(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('core:toggle_habit', args=[self.habit.slug]))
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_habit(self):
+        url = reverse('core:habit', args=[self.habit.slug])
+        etag = self.assertRevalidates(url)
+        self.habit.description = 'Every night.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.save()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_htmx_requests_validated_separately(self):
+        url = reverse('core:homepage')
+        etag = self.assertRevalidates(url)
+        response = self.client.get(url, headers={'If-None-Match': etag, 'HX-Request': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('HX-Request', response['Vary'])
+
+    def test_cache_control(self):
+        url = reverse('core:homepage')
+        today = date.today()
+        self.assertIn('no-cache', self.client.get(url)['Cache-Control'])
+        response = self.client.get(url, {'year': today.year - 1, 'month': today.month})
+        self.assertIn(f'max-age={settings.PAST_MONTH_MAX_AGE}', response['Cache-Control'])
+
+
+class StaticFilesTests(SimpleTestCase):
+    """
+    Checks that collected text files get compressed variants, and that the
+    best variant for the request's Accept-Encoding is served, with
+    immutable cache headers.
+    """
+
+    CONTENT = b'body { margin: 0; }\n' * 100
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        storage.save('css/site.css', ContentFile(self.CONTENT))
+        list(storage.post_process({'css/site.css': (storage, 'css/site.css')}))
+        self.url = settings.STATIC_URL + storage.stored_name('css/site.css')
+
+    def get(self, accept_encoding):
+        with override_settings(STATIC_ROOT=self.root):
+            return self.client.get(self.url, headers={'Accept-Encoding': accept_encoding})
+
+    def test_gzip(self):
+        response = self.get('gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(gzip.decompress(response.content), self.CONTENT)
+
+    @skipUnless(brotli, 'The brotli package is not installed.')
+    def test_brotli(self):
+        response = self.get('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.CONTENT)
+
+    def test_identity(self):
+        response = self.get('gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content, self.CONTENT)
+
+    def test_template_static_files_exist(self):
+        # Missing files 404, or fail the manifest lookup once collected
+        path = Path(settings.BASE_DIR) / 'templates' / '_base.html'
+        names = [
+            token.split_contents()[1].strip('\'"')
+            for token in Lexer(path.read_text()).tokenize()
+            if token.token_type == TokenType.BLOCK and token.contents.startswith('static ')
+        ]
+        self.assertTrue(names)
+        for name in names:
+            self.assertIsNotNone(finders.find(name), name)
+
+    def test_vendored_files_match_pins(self):
+        for url, filename, integrity in VENDOR_ASSETS:
+            content = Path(finders.find(f'vendor/{filename}')).read_bytes()
+            digest = 'sha384-' + base64.b64encode(hashlib.sha384(content).digest()).decode()
+            self.assertEqual(digest, integrity, filename)
+
+
+class PauseTests(TestCase):
+    """
+    Checks that paused days resolve to 'paused' from a single load of the
+    habit's pause intervals, and that weekly rates are pro-rated.
+    """
+
+    MONDAY = date(2024, 4, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='pauses')
+        cls.habit = Habit.objects.create(user=user, name='Read', weekly_rate=3)
+        Progress.objects.bulk_create(
+            Progress(habit=cls.habit, date=cls.MONDAY + timedelta(days=offset), completed=True)
+            for offset in [0, 1]
+        )
+
+    def setUp(self):
+        # Cached intervals outlive the pauses rolled back after each test
+        cache.clear()
+
+    def get_colors(self):
+        engine = StatusEngine([self.habit], self.MONDAY)
+        return [engine.get_color(self.habit, self.MONDAY + timedelta(days=offset)) for offset in range(7)]
+
+    def test_pro_rated_weekly_rate(self):
+        self.assertEqual(self.get_colors(), ['green', 'green'] + ['red'] * 5)
+        # Two completions meet a rate of 3 pro-rated to 4 unpaused days
+        self.habit.pause(self.MONDAY + timedelta(days=3), self.MONDAY + timedelta(days=5))
+        self.assertEqual(self.get_colors(), ['gold'] * 3 + ['gray'] * 3 + ['gold'])
+
+    def test_pauses_loaded_once(self):
+        self.habit.pause(self.MONDAY + timedelta(days=6))
+        engine = StatusEngine([self.habit], self.MONDAY, self.MONDAY + timedelta(days=60))
+        days = [self.MONDAY + timedelta(days=offset) for offset in range(60)]
+        with self.assertNumQueries(2):
+            statuses = engine.get_statuses(self.habit, days)
+        self.assertEqual(statuses[days[5]], 'missed')
+        self.assertTrue(all(statuses[day] == 'paused' for day in days[6:]))
+
+    def test_resume(self):
+        self.habit.pause(self.MONDAY + timedelta(days=4))
+        self.habit.resume(self.MONDAY + timedelta(days=6))
+        self.assertEqual(self.get_colors()[3:], ['red', 'gray', 'gray', 'red'])
+
+
+class MasterCalendarTests(TestCase):
+    """
+    Checks that the master calendar shades days by the fraction of habits
+    completed, with the same number of queries however many habits
+    there are.
+    """
+
+    APRIL_1ST = date(2024, 4, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='master')
+        Habit.objects.bulk_create(
+            Habit(user=cls.user, slug=f'habit-{i}', name=f'Habit {i}') for i in range(12)
+        )
+        cls.habits = list(Habit.objects.filter(user=cls.user).order_by('id'))
+        # Habit i is completed on the first i days of the month
+        Progress.objects.bulk_create(
+            Progress(habit=habit, date=cls.APRIL_1ST + timedelta(days=day), completed=True)
+            for i, habit in enumerate(cls.habits)
+            for day in range(i)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_queries_flat_in_habits(self):
+        for count in [3, 12]:
+            with self.assertNumQueries(2):
+                MasterHTMLCalendar(self.user, self.habits[:count]).formatmonth(2024, 4)
+            cache.clear()
+
+    def test_heat_levels(self):
+        html = MasterHTMLCalendar(self.user, self.habits).formatmonth(2024, 4)
+        self.assertIn('heat-4" title="11 of 12 habits completed">1<', html)
+        self.assertIn('heat-2" title="6 of 12 habits completed">6<', html)
+        self.assertIn('heat-0" title="0 of 12 habits completed">12<', html)
+
+    def test_paused_completions_not_counted(self):
+        # Habit 11 is completed on the 1st, habit 0 isn't
+        habits = [self.habits[0], self.habits[11]]
+        self.habits[11].pause(self.APRIL_1ST, self.APRIL_1ST)
+        html = MasterHTMLCalendar(self.user, habits).formatmonth(2024, 4)
+        self.assertIn('heat-0" title="0 of 1 habits completed">1<', html)
+        self.assertIn('heat-2" title="1 of 2 habits completed">2<', html)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    """
+    Checks that reads go to the replica, unless the request wrote, its
+    browser wrote recently, or its user's data just changed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = User.objects.create(username='replica')
+
+    def route(self, request, user=None):
+        """
+        Returns the response to a request, and where its view read from.
+        """
+
+        read_from = []
+
+        def view(request):
+            read_from.append(self.router.db_for_read(Habit))
+            return HttpResponse()
+
+        request.user = user or AnonymousUser()
+        response = ReplicaRoutingMiddleware(view)(request)
+        return response, read_from[0]
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Habit), 'replica')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Habit), 'default')
+        self.assertEqual(self.router.db_for_write(Habit), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Habit), 'default')
+
+    def test_write_pins_browser(self):
+        factory = RequestFactory()
+        response, read_from = self.route(factory.post('/'))
+        self.assertEqual(read_from, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        _, read_from = self.route(factory.get('/'))
+        self.assertEqual(read_from, 'replica')
+        factory.cookies[PIN_COOKIE] = '1'
+        response, read_from = self.route(factory.get('/'))
+        self.assertEqual(read_from, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_streamed_import_reads_primary(self):
+        read_from = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            read_from.append(db_for_read(router, model, **hints))
+            # There's no replica database to read from
+            return 'default'
+
+        with use_primary():
+            self.client.force_login(self.user)
+        # The habits are read before the malformed record stops the import
+        upload = ContentFile(b'habit,name,date,completed\nread,Read,someday,true\n', name='progress.csv')
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', record):
+            response = self.client.post(reverse('core:import'), {'file': upload})
+            read_from.clear()
+            content = b''.join(response.streaming_content)
+        self.assertIn(b'Error:', content)
+        self.assertEqual(set(read_from), {'default'})
+
+    def test_recent_change_pins_user(self):
+        request = RequestFactory().get('/')
+        _, read_from = self.route(request, self.user)
+        self.assertEqual(read_from, 'replica')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_user_version(self.user.id)
+        _, read_from = self.route(request, self.user)
+        self.assertEqual(read_from, 'default')
+
+
+class ProgressArchiveTests(TestCase):
+    """
+    Checks that archived years read the same as before from their masks,
+    including weeks straddling the archive boundary.
+    """
+
+    MONDAY = date(2020, 12, 7)
+    SUNDAY = date(2021, 1, 10)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='archive')
+        self.habits = [
+            Habit.objects.create(user=self.user, slug=f'habit-{i}', name=f'Habit {i}')
+            for i in range(2)
+        ]
+        Progress.objects.all().delete()
+        Progress.objects.bulk_create(
+            Progress(habit=habit, date=day, completed=True)
+            for habit in self.habits
+            for day in [date(2020, 3, 1), date(2020, 12, 8), date(2020, 12, 31),
+                        date(2021, 1, 1), date(2021, 1, 3)][habit.id % 2:]
+        )
+
+    def read(self, store):
+        ids = [habit.id for habit in self.habits]
+        return (
+            store.get_week_masks(ids, self.MONDAY, self.SUNDAY),
+            store.get_daily_counts(ids, self.MONDAY, self.SUNDAY),
+            list(store.iter_progress(ids)),
+            list(store.iter_completed_dates(ids[0])),
+        )
+
+    @override_settings(PROGRESS_STORE='core.storage.TieredProgressStore')
+    def test_archived_years_read_the_same(self):
+        expected = self.read(RowProgressStore())
+        call_command('archive_progress', before=2021, drop=True, no_wait=True, stdout=StringIO())
+
+        self.assertEqual(list(ProgressArchive.objects.values_list('year', flat=True)), [2020])
+        self.assertFalse(Progress.objects.filter(date__year=2020).exists())
+        self.assertEqual(self.read(TieredProgressStore()), expected)
+
+        # Edits to archived years flip their bits
+        store = TieredProgressStore()
+        self.assertTrue(store.toggle(self.habits[0], date(2020, 12, 9)))
+        self.assertFalse(Progress.objects.filter(date__year=2020).exists())
+        week = (self.habits[0].id, self.MONDAY)
+        masks = store.get_week_masks([self.habits[0].id], self.MONDAY, self.MONDAY)
+        self.assertEqual(masks[week], expected[0][week] | 0b100)
+
+    @override_settings(PROGRESS_STORE='core.storage.TieredProgressStore')
+    def test_keeps_rows_without_drop(self):
+        expected = self.read(RowProgressStore())
+        call_command('archive_progress', before=2021, no_wait=True, stdout=StringIO())
+        self.assertTrue(ProgressArchive.objects.filter(year=2020).exists())
+        self.assertTrue(Progress.objects.filter(date__year=2020).exists())
+
+        # The kept rows aren't read twice, by exports or stats
+        self.assertEqual(self.read(TieredProgressStore()), expected)
+        records = list(iter_export([self.user], 'jsonl'))
+        self.assertEqual(sum(chunk.count('\n') for chunk in records), len(expected[2]))
+        stats = compute_habit_stats(self.habits[0], TieredProgressStore())
+        self.assertEqual(stats.completed_days, len(expected[3]))
+
+    @override_settings(PROGRESS_STORE='core.storage.TieredProgressStore')
+    def test_import_into_archived_year(self):
+        call_command('archive_progress', before=2021, drop=True, no_wait=True, stdout=StringIO())
+        text = StringIO('habit,name,date,completed\nhabit-0,Habit 0,2020-06-15,true\n')
+        list(import_progress(self.user, text, 'csv'))
+
+        self.assertFalse(Progress.objects.filter(date__year=2020).exists())
+        dates = list(TieredProgressStore().iter_completed_dates(self.habits[0].id))
+        self.assertIn(date(2020, 6, 15), dates)
+
+    def test_requires_tiered_store_and_year(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_progress', before=2021, stdout=StringIO())
+        with override_settings(PROGRESS_STORE='core.storage.TieredProgressStore'):
+            with self.assertRaises(CommandError):
+                call_command('archive_progress', stdout=StringIO())
+
+
+class AdminActionTests(TestCase):
+    """
+    Checks that the bulk admin actions write in bulk, and keep the stats and
+    cached statuses they bypass the signals of up to date.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='admin')
+        self.client.force_login(self.admin)
+        self.habit = Habit.objects.create(user=self.admin, slug='read', name='Read')
+        Progress.objects.bulk_create(
+            Progress(habit=self.habit, date=date(2024, 4, day))
+            for day in range(2, 6)
+        )
+
+    def act(self, model, action, objects):
+        return self.client.post(reverse(f'admin:core_{model}_changelist'), {
+            'action': action,
+            '_selected_action': [obj.pk for obj in objects],
+        })
+
+    def test_mark_completed(self):
+        days = Progress.objects.filter(habit=self.habit, date__year=2024)
+        self.act('progress', 'mark_completed', days)
+        self.assertEqual(days.filter(completed=True).count(), 4)
+        self.habit.stats.refresh_from_db()
+        self.assertEqual(self.habit.stats.completed_days, 4)
+        self.assertEqual(self.habit.stats.longest_streak, 4)
+
+    def test_pause_and_resume(self):
+        self.act('habit', 'pause_habits', [self.habit])
+        self.act('habit', 'pause_habits', [self.habit])
+        self.assertEqual(self.habit.pauses.count(), 1)
+        today = date.today()
+        self.assertTrue(StatusEngine([self.habit], today).is_paused(self.habit.id, today))
+
+        self.act('habit', 'resume_habits', [self.habit])
+        self.assertFalse(self.habit.pauses.exists())
+        self.assertFalse(StatusEngine([self.habit], today).is_paused(self.habit.id, today))
+
+    def test_changelists(self):
+        for model in ['habit', 'progress']:
+            response = self.client.get(reverse(f'admin:core_{model}_changelist'))
+            self.assertEqual(response.status_code, 200)
+
+
+class ExtensionPointTests(SimpleTestCase):
+    """
+    Checks that incomplete progress stores and event brokers fail when
+    they're created, rather than on their first call.
+    """
+
+    def test_incomplete_subclasses(self):
+        class IncompleteStore(ProgressStore):
+            def toggle(self, habit, day):
+                return True
+
+        class IncompleteBroker(Broker):
+            def publish(self, user_id, event, data):
+                pass
+
+        for incomplete in [IncompleteStore, IncompleteBroker]:
+            with self.assertRaises(TypeError):
+                incomplete()
+
+
+class HabitResolverTests(TestCase):
+    """
+    Checks that habit slugs are unique per user, and that the habit cache
+    resolves them per user and forgets renamed and deleted habits.
+    """
+
+    def setUp(self):
+        get_habit_cache().clear()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def test_unique_slugs_per_user(self):
+        slugs = [Habit.objects.create(user=self.alice, name='Read').slug for i in range(3)]
+        self.assertEqual(slugs, ['read', 'read-2', 'read-3'])
+        self.assertEqual(Habit.objects.create(user=self.bob, name='Read').slug, 'read')
+
+    def test_same_slug_under_two_users(self):
+        alice = Habit.objects.create(user=self.alice, name='Read')
+        bob = Habit.objects.create(user=self.bob, name='Read')
+        self.assertEqual(resolve_habit(self.alice, 'read').id, alice.id)
+        self.assertEqual(resolve_habit(self.bob, 'read').id, bob.id)
+        # Both are cached, so resolving them again doesn't query
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_habit(self.alice, 'read').id, alice.id)
+            self.assertEqual(resolve_habit(self.bob, 'read').id, bob.id)
+
+    def test_stale_rate_not_cached_for_fresh_habit(self):
+        cache.clear()
+        habit = Habit.objects.create(user=self.alice, name='Read', weekly_rate=3)
+        Progress.objects.create(habit=habit, date=date(2024, 4, 1), completed=True)
+        stale = resolve_habit(self.alice, 'read')
+
+        # Another process changes the rate, which this process's habit
+        # cache doesn't hear of, and bumps the version
+        Habit.objects.filter(id=habit.id).update(weekly_rate=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_habit_version(habit.id)
+        self.assertEqual(resolve_habit(self.alice, 'read').weekly_rate, 3)
+        HabitHTMLCalendar(stale).formatmonth(2024, 4)
+
+        # Processes with the new rate don't get the month rendered with the old one
+        fresh = Habit.objects.get(id=habit.id)
+        self.assertIn('background-color: gold', HabitHTMLCalendar(fresh).formatmonth(2024, 4))
+
+    def test_forget_on_rename_and_delete(self):
+        habit = Habit.objects.create(user=self.alice, name='Read')
+        resolve_habit(self.alice, 'read')
+
+        habit.slug = 'read-books'
+        habit.save()
+        with self.assertRaises(Http404):
+            resolve_habit(self.alice, 'read')
+        self.assertEqual(resolve_habit(self.alice, 'read-books').id, habit.id)
+
+        habit.delete()
+        with self.assertRaises(Http404):
+            resolve_habit(self.alice, 'read-books')
+
+
+class EventTests(TestCase):
+    """
+    Checks that toggles are published to every open stream of their user
+    only, and that streams are only opened where they can be served.
+    """
+
+    def setUp(self):
+        create_upsert_index()
+        self.user = User.objects.create(username='events')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+
+    async def test_fan_out(self):
+        broker = LocalBroker()
+        streams = [broker.subscribe(1), broker.subscribe(1), broker.subscribe(2, keepalive=0.01)]
+        reads = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        # Let the streams subscribe
+        await asyncio.sleep(0)
+        self.assertTrue(broker.has_subscribers(1))
+
+        broker.publish(1, 'toggle', '<div></div>')
+        results = await asyncio.wait_for(asyncio.gather(*reads), 1)
+        self.assertEqual(results, [('toggle', '<div></div>')] * 2 + [None])
+
+        for stream in streams:
+            await stream.aclose()
+        self.assertFalse(broker.has_subscribers(1))
+        self.assertFalse(broker.has_subscribers(2))
+
+    def test_toggle_publishes(self):
+        published = []
+
+        class RecordingBroker(LocalBroker):
+            def has_subscribers(self, user_id):
+                return True
+
+            def publish(self, user_id, event, data):
+                published.append((user_id, event, data))
+
+        self.client.force_login(self.user)
+        with mock.patch('core.events.get_broker', return_value=RecordingBroker()):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('core:toggle_habit', args=[self.habit.slug]))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('core:toggle_habits'), {'changes': json.dumps([
+                    {'habit': self.habit.slug, 'date': '2024-04-01', 'completed': True},
+                ])})
+        self.assertEqual([(user_id, event) for user_id, event, data in published],
+                         [(self.user.id, 'toggle')] * 2)
+        self.assertIn(f'/toggle-habit/{self.habit.slug}/', published[0][2])
+
+    def test_no_stream_under_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('core:homepage')), 'sse-connect')
+        self.assertEqual(self.client.get(reverse('core:events')).status_code, 204)
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertContains(self.client.get(reverse('core:homepage')), 'sse-connect')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """
+    Checks that deployments with a per-process cache fail the deploy checks.
+    """
+
+    def test_check_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['core.E001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir(),
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class StatusEngineTests(TestCase):
+    """
+    Checks the weekly statuses the StatusEngine resolves, and that they
+    cost the same number of queries however many habits and weeks are
+    resolved, on their own and on the homepage.
+    """
+
+    MONDAY = date(2024, 4, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='statuses')
+        Habit.objects.bulk_create(
+            Habit(user=cls.user, slug=f'habit-{i}', name=f'Habit {i}', weekly_rate=3)
+            for i in range(12)
+        )
+        cls.habits = list(Habit.objects.filter(user=cls.user).order_by('id'))
+        # Every habit meets its rate in the first week, but not the second
+        Progress.objects.bulk_create(
+            Progress(habit=habit, date=cls.MONDAY + timedelta(days=offset), completed=True)
+            for habit in cls.habits
+            for offset in [0, 2, 4, 7]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_weekly_statuses(self):
+        habit = self.habits[0]
+        days = [self.MONDAY + timedelta(days=offset) for offset in range(14)]
+        statuses = StatusEngine([habit], days[0], days[-1]).get_statuses(habit, days)
+        self.assertEqual([statuses[day] for day in days],
+                         ['completed_for_week'] * 7 + ['completed_for_day'] + ['missed'] * 6)
+        # The same statuses as resolving each day on its own
+        for day in days:
+            self.assertEqual(Progress(habit=habit, date=day).get_completion_status(), statuses[day])
+
+    def test_queries_flat_in_habits_and_weeks(self):
+        for habits, weeks in [(self.habits[:1], 1), (self.habits, 52)]:
+            end = self.MONDAY + timedelta(weeks=weeks, days=-1)
+            engine = StatusEngine(habits, self.MONDAY, end)
+            with self.assertNumQueries(2):
+                for habit in habits:
+                    engine.get_statuses(habit, [self.MONDAY, end])
+            cache.clear()
+
+    def test_homepage_queries_flat_in_habits(self):
+        other = User.objects.create(username='one-habit')
+        Habit.objects.create(user=other, name='Read', weekly_rate=3)
+        counts = []
+        for user in [other, self.user]:
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('core:homepage'), {'year': 2024, 'month': 4})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class HabitStatsTests(TestCase):
+    """
+    Checks that stats maintained incrementally on every toggle match stats
+    recomputed from the full history, and that `rebuild_habit_stats --check`
+    catches any drift between them.
+    """
+
+    FIELDS = ['completed_days', 'longest_streak', 'run_lengths', 'current_streak', 'completion_rate']
+
+    def setUp(self):
+        create_upsert_index()
+        self.user = User.objects.create(username='stats')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+
+    def assertStatsMatch(self):
+        stats = HabitStats.objects.get(habit=self.habit)
+        rebuilt = compute_habit_stats(self.habit, tracked_since=stats.tracked_since)
+        for field in self.FIELDS:
+            self.assertEqual(getattr(stats, field), getattr(rebuilt, field), field)
+
+    def test_incremental_matches_rebuild(self):
+        today = date.today()
+        # Build two streaks, join them, then split them elsewhere
+        for offset in [1, 2, 4, 5, 6, 3, 5, 0, 1]:
+            toggle_completion(self.habit, today - timedelta(days=offset))
+            self.assertStatsMatch()
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.completed_days, 5)
+        self.assertEqual(stats.longest_streak, 3)
+
+    def test_check_detects_drift(self):
+        toggle_completion(self.habit, date.today())
+        call_command('rebuild_habit_stats', '--check', stdout=StringIO(), stderr=StringIO())
+
+        HabitStats.objects.filter(habit=self.habit).update(completed_days=7)
+        stderr = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_habit_stats', '--check', stdout=StringIO(), stderr=stderr)
+        self.assertIn('completed_days is 7, expected 1', stderr.getvalue())
+        # --check saves nothing, a rebuild fixes the drift
+        call_command('rebuild_habit_stats', stdout=StringIO(), stderr=StringIO())
+        self.assertStatsMatch()
+
+
+class CalendarCacheTests(TestCase):
+    """
+    Checks that habit calendar months are served from the cache until the
+    habit's version is bumped by a toggle, a pause or its deletion.
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_upsert_index()
+        self.user = User.objects.create(username='calendars')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+
+    def render(self):
+        return HabitHTMLCalendar(self.habit).formatmonth(2024, 4)
+
+    def assertCached(self, cached):
+        with CaptureQueriesContext(connection) as queries:
+            self.render()
+        self.assertEqual(len(queries) == 0, cached)
+
+    def test_served_from_cache(self):
+        html = self.render()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+
+    def test_toggle_invalidates(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_completion(self.habit, date(2024, 4, 2))
+        self.assertCached(False)
+        self.assertCached(True)
+
+    def test_pause_invalidates(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.pause(date(2024, 4, 10))
+        self.assertCached(False)
+        self.assertCached(True)
+
+    def test_bumped_on_commit(self):
+        # Reads during the write's transaction keep the previous version,
+        # so they can't cache data from before the commit under the new one
+        version = get_habit_version(self.habit.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_completion(self.habit, date(2024, 4, 2))
+            self.assertEqual(get_habit_version(self.habit.id), version)
+        self.assertNotEqual(get_habit_version(self.habit.id), version)
+
+    def test_delete_invalidates(self):
+        version = get_habit_version(self.habit.id)
+        self.assertEqual(get_dashboard(self.user, 2024, 4)['habits'], [self.habit])
+        habit_id = self.habit.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.delete()
+        self.assertNotEqual(get_habit_version(habit_id), version)
+        # The user's dashboard snapshot is rebuilt without the habit
+        self.assertEqual(get_dashboard(self.user, 2024, 4)['habits'], [])
+
+
+class BatchToggleTests(TestCase):
+    """
+    Checks that the batch toggle endpoint validates the whole batch before
+    writing, writes it with a fixed number of queries, and keeps the
+    habits' stats up to date.
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_upsert_index()
+        self.user = User.objects.create(username='batch')
+        self.habits = [Habit.objects.create(user=self.user, name=name) for name in ['Read', 'Run']]
+        self.client.force_login(self.user)
+
+    def post(self, changes):
+        return self.client.post(reverse('core:toggle_habits'),
+                                {'changes': json.dumps(changes)})
+
+    def week(self, habit, completed=True):
+        return [
+            {'habit': habit.slug, 'date': date(2024, 4, day).isoformat(), 'completed': completed}
+            for day in range(1, 8)
+        ]
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.client.post(reverse('core:toggle_habits'),
+                                          {'changes': '{'}).status_code, 400)
+        self.assertEqual(self.post([{'habit': 'read'}]).status_code, 400)
+        self.assertEqual(self.post([{'habit': 'read', 'date': 'monday', 'completed': True}]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 204)
+
+        # Another user's habit fails the whole batch, and nothing is written
+        other = Habit.objects.create(user=User.objects.create(username='other'), name='Swim')
+        self.assertEqual(self.post(self.week(self.habits[0]) + self.week(other)).status_code, 404)
+        self.assertFalse(Progress.objects.filter(date__year=2024, completed=True).exists())
+
+    def test_updates_stats(self):
+        response = self.post(self.week(self.habits[0]) + self.week(self.habits[1])[:3])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'hx-swap-oob', count=10)
+        stats = HabitStats.objects.in_bulk([habit.id for habit in self.habits])
+        self.assertEqual([(s.completed_days, s.longest_streak) for s in stats.values()],
+                         [(7, 7), (3, 3)])
+
+        # Unchecking the middle of the week splits the streak
+        self.post([{'habit': 'read', 'date': '2024-04-04', 'completed': False}])
+        stats = HabitStats.objects.get(habit=self.habits[0])
+        self.assertEqual((stats.completed_days, stats.longest_streak), (6, 3))
+
+    def test_queries_flat_in_batch_size(self):
+        counts = []
+        for changes in [self.week(self.habits[0])[:1], self.week(self.habits[1])]:
+            with CaptureQueriesContext(connection) as queries:
+                self.post(changes)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ExportTests(TestCase):
+    """
+    Checks that the export view streams the user's history, and only theirs,
+    in every export format.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='exports')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+        Progress.objects.bulk_create(
+            Progress(habit=self.habit, date=date(2024, 4, day), completed=day % 2 == 1)
+            for day in [1, 2, 3]
+        )
+        other = Habit.objects.create(user=User.objects.create(username='other'), name='Run')
+        Progress.objects.create(habit=other, date=date(2024, 4, 1), completed=True)
+        self.client.force_login(self.user)
+
+    def export(self, format):
+        response = self.client.get(reverse('core:export'), {'format': format})
+        self.assertTrue(response.streaming)
+        self.assertIn(f'.{format}"', response['Content-Disposition'])
+        return b''.join(response.streaming_content).decode()
+
+    def assertRecords(self, records):
+        self.assertEqual(
+            [(record['habit'], record['date'], record['completed']) for record in records
+             if record['date'].startswith('2024')],
+            [('read', '2024-04-01', True), ('read', '2024-04-02', False), ('read', '2024-04-03', True)]
+        )
+        self.assertEqual({record['user'] for record in records}, {'exports'})
+
+    def test_csv(self):
+        records = list(csv.DictReader(StringIO(self.export('csv'))))
+        for record in records:
+            record['completed'] = record['completed'] == 'True'
+        self.assertRecords(records)
+
+    def test_jsonl(self):
+        self.assertRecords([json.loads(line) for line in self.export('jsonl').splitlines()])
+
+    def test_json(self):
+        self.assertRecords(json.loads(self.export('json')))
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('core:export'), {'format': 'xml'}).status_code, 400)
+
+
+class ImportTests(TestCase):
+    """
+    Checks that imports in every format upsert the user's history, so that
+    re-importing a file changes nothing, and stop on the first malformed
+    record with its number.
+    """
+
+    FILES = {
+        'csv': 'habit,name,date,completed\nread,Read,2024-04-01,true\nread,Read,2024-04-02,false\n'
+               'run,Run,2024-04-01,1\n',
+        'jsonl': '{"habit": "read", "name": "Read", "date": "2024-04-01", "completed": true}\n'
+                 '{"habit": "read", "name": "Read", "date": "2024-04-02", "completed": false}\n'
+                 '{"habit": "run", "name": "Run", "date": "2024-04-01", "completed": true}\n',
+        'json': '[{"habit": "read", "name": "Read", "date": "2024-04-01", "completed": true},\n'
+                '{"habit": "read", "name": "Read", "date": "2024-04-02", "completed": false},\n'
+                '{"habit": "run", "name": "Run", "date": "2024-04-01", "completed": true}]\n',
+    }
+
+    MALFORMED = {
+        'csv': 'habit,date,completed\nread,2024-04-01,true\nread,April 2nd,true\n',
+        'jsonl': '{"habit": "read", "date": "2024-04-01", "completed": true}\n{"habit": "read",\n',
+        'json': '[{"habit": "read", "date": "2024-04-01", "completed": true}, {"date": "2024-04-02"}]',
+    }
+
+    def setUp(self):
+        create_upsert_index()
+        self.user = User.objects.create(username='imports')
+        self.client.force_login(self.user)
+
+    def upload(self, format, content):
+        response = self.client.post(reverse('core:import'), {
+            'format': format,
+            'file': ContentFile(content.encode(), name=f'habits.{format}'),
+        })
+        return b''.join(response.streaming_content).decode()
+
+    def get_history(self):
+        return sorted(
+            Progress.objects.filter(habit__user=self.user, date__year=2024)
+            .values_list('habit__slug', 'date', 'completed')
+        )
+
+    def test_import_and_reimport(self):
+        for format, content in self.FILES.items():
+            with self.subTest(format=format):
+                self.upload(format, content)
+                history = self.get_history()
+                self.assertEqual(history, [
+                    ('read', date(2024, 4, 1), True),
+                    ('read', date(2024, 4, 2), False),
+                    ('run', date(2024, 4, 1), True),
+                ])
+                # Every format imports the same history, once
+                self.assertNotIn('Error', self.upload(format, content))
+                self.assertEqual(self.get_history(), history)
+                self.assertEqual(Habit.objects.filter(user=self.user).count(), 2)
+                self.assertEqual(HabitStats.objects.get(habit__slug='read').completed_days, 1)
+
+    def test_partial_import(self):
+        habit = Habit.objects.create(user=self.user, name='Read')
+        html = HabitHTMLCalendar(habit).formatmonth(2024, 4)
+        text = StringIO('habit,date,completed\nread,2024-04-01,true\nread,2024-04-02,true\n'
+                        'read,2024-04-03,true\nread,April 4th,true\n')
+        with self.assertRaises(ImportFormatError), self.captureOnCommitCallbacks(execute=True):
+            list(import_progress(self.user, text, 'csv', batch_size=2))
+
+        # The first batch is kept, and the habit's stats and calendar show it
+        self.assertEqual(Progress.objects.filter(habit=habit, completed=True).count(), 2)
+        self.assertEqual(HabitStats.objects.get(habit=habit).completed_days, 2)
+        self.assertNotEqual(HabitHTMLCalendar(habit).formatmonth(2024, 4), html)
+
+    def test_error_lines(self):
+        errors = {
+            'csv': 'Error: Record 2: invalid ValueError(',
+            'jsonl': 'Error: Record 2: ',
+            'json': "Error: Record 2: invalid KeyError('completed').",
+        }
+        for format, content in self.MALFORMED.items():
+            with self.subTest(format=format):
+                lines = self.upload(format, content).splitlines()
+                self.assertTrue(lines[-1].startswith(errors[format]), lines[-1])
+
+
+class ToggleboardTests(TestCase):
+    """
+    Checks that the toggleboard renders its togglers in one response from
+    the user's dashboard snapshot, which is served from the cache until
+    one of the user's habits changes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_upsert_index()
+        self.user = User.objects.create(username='toggleboard')
+        self.habits = [Habit.objects.create(user=self.user, name=f'Habit {i}') for i in range(12)]
+        self.client.force_login(self.user)
+
+    def test_one_response(self):
+        response = self.client.get(reverse('core:toggleboard'))
+        self.assertContains(response, 'class="habit-toggler"', count=TOGGLEBOARD_SIZE)
+        self.assertContains(response, f'id="toggler-{self.habits[0].slug}-')
+
+    def test_snapshot_served_from_cache(self):
+        today = date.today()
+        get_dashboard(self.user, today.year, today.month)
+        with self.assertNumQueries(0):
+            dashboard = get_dashboard(self.user, today.year, today.month)
+        self.assertEqual(dashboard['progress'][0]['color'], 'white')
+
+        # A toggle bumps the user's version, so the snapshot is rebuilt
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_completion(self.habits[0], today)
+        dashboard = get_dashboard(self.user, today.year, today.month)
+        self.assertEqual(dashboard['progress'][0]['color'], 'green')
+        self.assertContains(self.client.get(reverse('core:toggleboard')),
+                            'background-color: green', count=1)
+
+
+class ToggleChangedCellsTests(TestCase):
+    """
+    Checks that a toggle in the habit calendar sends the other cells of the
+    week whose color changed, e.g. turning gold when the weekly rate is
+    reached, and only those.
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_upsert_index()
+        self.user = User.objects.create(username='cells')
+        self.habit = Habit.objects.create(user=self.user, name='Read', weekly_rate=3)
+        # Monday and Tuesday of two weeks, the second one across two months
+        for day in [date(2024, 4, 1), date(2024, 4, 2), date(2024, 4, 29), date(2024, 4, 30)]:
+            toggle_completion(self.habit, day)
+        self.client.force_login(self.user)
+
+    def toggle(self, day, label=None):
+        data = {} if label == '' else {'label': label or day.day}
+        return self.client.post(reverse('core:toggle_habit', args=[self.habit.slug, day]), data)
+
+    def count_cells(self, response):
+        content = response.content.decode()
+        return content.count('hx-swap-oob'), content.count('background-color: gold')
+
+    def test_week_turns_gold(self):
+        # The rest of the week turns gold, then back
+        self.assertEqual(self.count_cells(self.toggle(date(2024, 4, 3))), (6, 7))
+        self.assertEqual(self.count_cells(self.toggle(date(2024, 4, 3))), (6, 0))
+        # Cells whose color stays the same aren't sent
+        self.assertEqual(self.count_cells(self.toggle(date(2024, 4, 8))), (0, 0))
+
+    def test_only_visible_month(self):
+        # April's days of the week have no cells in May's calendar
+        response = self.toggle(date(2024, 5, 1))
+        self.assertEqual(self.count_cells(response), (4, 5))
+        self.assertNotContains(response, 'cell-read-2024-04-')
+
+    def test_toggleboard_sends_no_cells(self):
+        self.assertEqual(self.count_cells(self.toggle(date(2024, 4, 3), label='')), (0, 1))
+
+
+def load_async_urlconf():
+    """
+    Returns a urlconf routing core's views to their async versions, as
+    `core.urls` does when `ASYNC_VIEWS` is enabled.
+    """
+
+    spec = importlib.util.find_spec('core.urls')
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_VIEWS=True):
+        spec.loader.exec_module(module)
+    return type('AsyncURLConf', (), {
+        'urlpatterns': [path('', include((module.urlpatterns, 'core'), namespace='core'))],
+    })
+
+
+class AsyncViewTests(TestCase):
+    """
+    Checks that the async views answer like the sync ones, with the same
+    number of queries.
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_upsert_index()
+        self.user = User.objects.create(username='async')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+        self.other = Habit.objects.create(user=User.objects.create(username='other'), name='Run')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        self.urlconf = load_async_urlconf()
+
+    def request(self, method, name, *args, client=None, **data):
+        """
+        Requests a view by URL name through the async views, or through the
+        sync ones with `client=self.client`, and returns the response with
+        its streamed content read.
+        """
+
+        if client is self.client:
+            response = getattr(self.client, method)(reverse(f'core:{name}', args=args), data)
+            if response.streaming:
+                response.streamed_content = b''.join(response.streaming_content)
+            return response
+
+        async def request():
+            response = await getattr(self.async_client, method)(url, data)
+            if response.streaming:
+                response.streamed_content = b''.join([chunk async for chunk in response.streaming_content])
+            return response
+
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            url = reverse(f'core:{name}', args=args)
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), name)
+            return async_to_sync(request)()
+
+    def count_queries(self, method, name, args, client=None):
+        cache.clear()
+        get_habit_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.request(method, name, *args, client=client)
+        return len(queries)
+
+    def test_status_codes(self):
+        for name, args in [('homepage', []), ('habit', [self.habit.slug]),
+                           ('toggle_habit', [self.habit.slug]), ('toggleboard', [])]:
+            self.assertEqual(self.request('get', name, *args).status_code, 200, name)
+        self.assertEqual(self.request('get', 'export', format='xml').status_code, 400)
+
+        self.async_client.logout()
+        for name, args in [('habit', [self.habit.slug]), ('toggleboard', []), ('export', [])]:
+            self.assertEqual(self.request('get', name, *args).status_code, 302, name)
+
+    def test_other_users_habit(self):
+        self.assertEqual(self.request('get', 'habit', self.other.slug).status_code, 404)
+        self.assertEqual(self.request('post', 'toggle_habit', self.other.slug).status_code, 404)
+
+    def test_toggle(self):
+        day = date(2024, 4, 1)
+        version = get_habit_version(self.habit.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.request('post', 'toggle_habit', self.habit.slug, day, label='1')
+        self.assertContains(response, 'background-color: green')
+        self.assertTrue(Progress.objects.get(habit=self.habit, date=day).completed)
+        self.assertEqual(HabitStats.objects.get(habit=self.habit).completed_days, 1)
+        self.assertNotEqual(get_habit_version(self.habit.id), version)
+
+    def test_export(self):
+        for format in ['csv', 'jsonl', 'json']:
+            expected = self.request('get', 'export', client=self.client, format=format).streamed_content
+            self.assertEqual(self.request('get', 'export', format=format).streamed_content, expected)
+
+    def test_events(self):
+        with override_settings(ASYNC_VIEWS=True, ROOT_URLCONF=self.urlconf):
+            response = async_to_sync(self.async_client.get)(reverse('core:events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.async_client.logout()
+        with override_settings(ASYNC_VIEWS=True, ROOT_URLCONF=self.urlconf):
+            response = async_to_sync(self.async_client.get)(reverse('core:events'))
+        self.assertEqual(response.status_code, 204)
+
+    def test_query_counts(self):
+        views = [
+            ('get', 'homepage', []),
+            ('get', 'habit', [self.habit.slug]),
+            ('get', 'toggleboard', []),
+            ('get', 'export', []),
+        ]
+        for method, name, args in views:
+            self.assertEqual(self.count_queries(method, name, args, client=self.client),
+                             self.count_queries(method, name, args),
+                             name)
+        # Each toggles a day of its own, from not completed
+        self.assertEqual(
+            self.count_queries('post', 'toggle_habit', [self.habit.slug, date(2024, 4, 1)],
+                               client=self.client),
+            self.count_queries('post', 'toggle_habit', [self.habit.slug, date(2024, 4, 2)])
+        )
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingTests(TestCase):
+    """
+    Checks that timed requests report their SQL, calendar and template
+    times in a Server-Timing header, and in histograms only staff can read.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('timing', password='password')
+        Habit.objects.create(user=self.user, name='Read')
+        self.client.force_login(self.user)
+
+    def test_header(self):
+        response = self.client.get(reverse('core:homepage'))
+        entries = [entry.split(';') for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual([entry[0] for entry in entries],
+                         ['pool', 'sql', 'calendar', 'template', 'total'])
+        for entry in entries:
+            self.assertTrue(entry[1].startswith('dur='), entry)
+        queries = int(entries[1][2].removeprefix('desc="').removesuffix(' queries"'))
+        self.assertGreater(queries, 0)
+        self.assertGreater(histograms.as_dict()['core:homepage']['queries']['count'], 0)
+
+    def test_disabled(self):
+        with override_settings(SERVER_TIMING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ServerTimingMiddleware(lambda request: HttpResponse())
+            self.assertNotIn('Server-Timing', Client().get(reverse('core:homepage')))
+
+    def test_histograms_staff_only(self):
+        url = reverse('core:timings')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('core:timings', response.json())
+
+
+class FakeConnection:
+    """
+    Stand-in for a psycopg connection, with a switch to fail its pings.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.info = mock.Mock(transaction_status=STATUS_IDLE)
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        if not self.healthy:
+            cursor.__enter__.return_value.execute.side_effect = OperationalError
+        return cursor
+
+    def rollback(self):
+        self.info.transaction_status = STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    Checks that the connection pool caps its size, waiting for connections
+    to be returned, expires idle connections down to its minimum size,
+    replaces broken ones, and reports its stats.
+    """
+
+    def setUp(self):
+        self.clock = 1000.0
+        self.connections = []
+
+    def connect(self):
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+    def test_blocks_at_max_size(self):
+        pool = ConnectionPool(self.connect, max_size=2, timeout=5)
+        first, second = pool.getconn(), pool.getconn()
+
+        # A checkout waits for a connection to be returned...
+        returned = threading.Timer(0.05, pool.putconn, [first])
+        returned.start()
+        self.assertIs(pool.getconn(), first)
+        returned.join()
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertEqual(len(self.connections), 2)
+
+        # ...and fails once the timeout passes
+        pool.timeout = 0.05
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_idle_connections_expire(self):
+        # Only the pool's clock is stubbed
+        with mock.patch('core.db.pool.time', mock.Mock(monotonic=lambda: self.clock)):
+            pool = ConnectionPool(self.connect, min_size=1, idle_timeout=60)
+            checked_out = [pool.getconn() for i in range(3)]
+            for conn in checked_out:
+                pool.putconn(conn)
+            self.assertEqual(pool.stats()['size'], 3)
+
+            self.clock += 61
+            self.assertIs(pool.getconn(), checked_out[-1])
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['closed']), (1, 0, 2))
+        self.assertEqual([conn.closed for conn in checked_out], [True, True, False])
+
+    def test_unhealthy_connections_replaced(self):
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.healthy = False
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['opened'], stats['closed']), (1, 2, 1))
+
+    def test_returned_connections(self):
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        conn.info.transaction_status = 2
+        pool.putconn(conn)
+        self.assertEqual(conn.info.transaction_status, STATUS_IDLE)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+        conn = pool.getconn()
+        conn.closed = True
+        pool.putconn(conn)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_stats_hook(self):
+        calls = []
+        pool = ConnectionPool(self.connect, max_size=4,
+                              stats_hook=lambda stats, wait_time: calls.append((stats, wait_time)))
+        pool.getconn()
+        pool.getconn()
+        self.assertEqual(len(calls), 2)
+        stats, wait_time = calls[-1]
+        self.assertEqual((stats['in_use'], stats['saturation'], stats['checkouts']), (2, 0.5, 2))
+        self.assertGreaterEqual(wait_time, 0)
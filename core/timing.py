@@ -0,0 +1,279 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+# Timings of the current request, or None outside of timed requests
+_timings = ContextVar('timings', default=None)
+
+
+class Timings:
+    """
+    Request timings
+
+    Accumulates the durations (in milliseconds) of the timed sections of
+    one request, by name, and the number of times each section ran.
+    Nested sections of the same name are only timed once, at the outermost.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self.active = set()
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+@contextmanager
+def timed(name):
+    """
+    Times a section of the current request under `name`.
+    Does nothing outside of timed requests.
+    """
+
+    timings = _timings.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+        timings.active.discard(name)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing every query of timed requests.
+    """
+
+    with timed('sql'):
+        return execute(sql, params, many, context)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    """
+    Installs `time_query()` on a database connection, once.
+    """
+
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate(Template):
+    """
+    Django template whose renders are timed under "template".
+    """
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Timed Django templates backend
+
+    The standard Django templates backend, except that template renders
+    are timed under "template" for the Server-Timing header. Outside of
+    timed requests, this costs one context variable lookup per render.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Histogram:
+    """
+    Histogram
+
+    Counts durations in fixed, roughly logarithmic buckets (in milliseconds),
+    so that memory stays constant however many requests are recorded.
+    """
+
+    # Upper bounds of the buckets, the last bucket being unbounded
+    BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given percentile,
+        or None if it falls in the unbounded bucket.
+        """
+
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip([*map(str, self.BOUNDS), 'inf'], self.buckets)),
+        }
+
+
+class TimingHistograms:
+    """
+    Timing histograms
+
+    In-process histograms of request timings per URL name and metric.
+    Each process keeps its own, and they're reset on restart.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, url_name, metrics):
+        with self.lock:
+            histograms = self.histograms.setdefault(url_name, {})
+            for metric, value in metrics.items():
+                histograms.setdefault(metric, Histogram()).add(value)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                url_name: {metric: histogram.as_dict() for metric, histogram in histograms.items()}
+                for url_name, histograms in sorted(self.histograms.items())
+            }
+
+
+histograms = TimingHistograms()
+
+
+def record_pool_stats(alias, stats, wait_time):
+    """
+    Connection pool stats hook (see `core.db.pool.ConnectionPool`).
+
+    Adds the checkout's wait to the current request's timings, and records
+    the wait time and the pool's saturation (in percent) in the histograms,
+    under "pool:<alias>".
+    """
+
+    wait = wait_time * 1000
+    timings = _timings.get()
+    if timings is not None:
+        timings.add('pool', wait)
+    histograms.record(f'pool:{alias}', {
+        'wait': wait,
+        'saturation': stats['saturation'] * 100,
+    })
+
+
+class ServerTimingMiddleware:
+    """
+    Server-Timing middleware
+
+    Times every request and reports the time spent waiting for a pooled
+    database connection, in SQL queries, calendar rendering and template
+    rendering, plus the total time, in a `Server-Timing` response header.
+    The timings are also recorded in per URL name histograms, viewable by
+    staff at `core:timings`.
+
+    Enabled by the `SERVER_TIMING` setting. When disabled, the middleware
+    removes itself, and no database wrapper is installed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    # Timed sections reported, in order
+    SECTIONS = ['pool', 'sql', 'calendar', 'template']
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        # Time queries on every current and future connection
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection=connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings = Timings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.report(request, response, timings, started)
+
+    async def __acall__(self, request):
+        # Context variables are carried over to sync_to_async threads,
+        # so queries run from async views are timed too
+        timings = Timings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.report(request, response, timings, started)
+
+    def report(self, request, response, timings, started):
+        """
+        Adds the Server-Timing header to the response,
+        and records the request in the histograms.
+        """
+
+        total = (time.perf_counter() - started) * 1000
+        metrics = {name: timings.durations.get(name, 0) for name in self.SECTIONS}
+        metrics['total'] = total
+
+        entries = []
+        for name, duration in metrics.items():
+            entry = f'{name};dur={duration:.1f}'
+            if name == 'sql':
+                entry += f';desc="{timings.counts.get("sql", 0)} queries"'
+            entries.append(entry)
+        response['Server-Timing'] = ', '.join(entries)
+
+        match = request.resolver_match
+        if match is not None and match.view_name:
+            metrics['queries'] = timings.counts.get('sql', 0)
+            histograms.record(match.view_name, metrics)
+        return response
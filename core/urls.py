@@ -1,13 +1,36 @@
-from django.urls import path
-from . import views
+from django.conf import settings
+from django.urls import path, register_converter
+from . import converters, views
+
+register_converter(converters.DateConverter, 'date')
+
+# Route the hot views to their async versions under ASGI
+if settings.ASYNC_VIEWS:
+    homepage, habit, toggle_habit = views.ahomepage, views.ahabit, views.atoggle_habit
+    export_progress, toggleboard = views.aexport_progress, views.atoggleboard
+else:
+    homepage, habit, toggle_habit = views.homepage, views.habit, views.toggle_habit
+    export_progress, toggleboard = views.export_progress, views.toggleboard
 
 app_name = 'core'
 
 urlpatterns = [
-    path('', views.homepage, name='homepage'),
+    path('', homepage, name='homepage'),
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('register/', views.user_register, name='register'),
     path('add-habit/', views.add_habit, name='add_habit'),
-    path('toggle-habit/', views.toggle_habit, name='toggle_habit'),
+    path('habits/<slug:habit_slug>/', habit, name='habit'),
+    path('toggle-habit/<slug:habit_slug>/',
+         toggle_habit,
+         name='toggle_habit'),
+    path('toggle-habit/<slug:habit_slug>/<date:date>/',
+         toggle_habit,
+         name='toggle_habit'),
+    path('toggle-habits/', views.toggle_habits, name='toggle_habits'),
+    path('toggleboard/', toggleboard, name='toggleboard'),
+    path('export/', export_progress, name='export'),
+    path('import/', views.upload_progress, name='import'),
+    path('events/', views.events, name='events'),
+    path('timings/', views.timings, name='timings'),
 ]
@@ -0,0 +1,213 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_version(key):
+    """
+    Returns the current value of a version counter stored in the cache.
+
+    Missing counters (never set, or evicted) start from the current time
+    in nanoseconds, so a re-created counter can never reuse a version
+    that cached fragments were stored under.
+    """
+
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # Another process may have created the counter in the meantime
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(key):
+    """
+    Async version of `get_version()`, using the cache's async API.
+    """
+
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def get_modified_key(key):
+    """
+    Returns the cache key of the time a version counter was last bumped.
+    """
+
+    return f'{key}:modified'
+
+
+def get_version_modified(key):
+    """
+    Returns the current value of a version counter and the time it was last
+    bumped (a timestamp), read in a single cache round trip.
+
+    A missing time (never bumped, or evicted) starts from the current time,
+    so it's never earlier than the last change.
+    """
+
+    modified_key = get_modified_key(key)
+    cached = cache.get_many([key, modified_key])
+    version = cached.get(key)
+    if version is None:
+        version = get_version(key)
+    modified = cached.get(modified_key)
+    if modified is None:
+        modified = time.time()
+        if not cache.add(modified_key, modified, timeout=None):
+            modified = cache.get(modified_key, modified)
+    return version, modified
+
+
+async def aget_version_modified(key):
+    """
+    Async version of `get_version_modified()`.
+    """
+
+    modified_key = get_modified_key(key)
+    cached = await cache.aget_many([key, modified_key])
+    version = cached.get(key)
+    if version is None:
+        version = await aget_version(key)
+    modified = cached.get(modified_key)
+    if modified is None:
+        modified = time.time()
+        if not await cache.aadd(modified_key, modified, timeout=None):
+            modified = await cache.aget(modified_key, modified)
+    return version, modified
+
+
+def increment_version(key):
+    """
+    Increments a version counter stored in the cache, invalidating everything
+    cached under the previous version, and records the time of the bump.
+    """
+
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+    cache.set(get_modified_key(key), time.time(), timeout=None)
+    return version
+
+
+def bump_version(key):
+    """
+    Increments a version counter once the current transaction commits, or
+    right away outside of one. Bumping before the commit would let a
+    concurrent read render the data from before it and cache it under
+    the new version.
+    """
+
+    transaction.on_commit(lambda: increment_version(key), robust=True)
+
+
+def get_habit_version(habit_id):
+    """
+    Returns the version of a habit's completion data.
+    """
+
+    return get_version(f'version:habit:{habit_id}')
+
+
+async def aget_habit_version(habit_id):
+    """
+    Async version of `get_habit_version()`.
+    """
+
+    return await aget_version(f'version:habit:{habit_id}')
+
+
+def get_habit_version_modified(habit_id):
+    """
+    Returns the version of a habit's completion data, and the time it
+    last changed.
+    """
+
+    return get_version_modified(f'version:habit:{habit_id}')
+
+
+async def aget_habit_version_modified(habit_id):
+    """
+    Async version of `get_habit_version_modified()`.
+    """
+
+    return await aget_version_modified(f'version:habit:{habit_id}')
+
+
+def bump_habit_version(habit_id):
+    """
+    Invalidates everything cached for a habit's completion data.
+    Called on every write to the habit or its progress.
+    """
+
+    bump_version(f'version:habit:{habit_id}')
+
+
+def get_user_version_key(user_id):
+    """
+    Returns the cache key of a user's version counter.
+    """
+
+    return f'version:user:{user_id}'
+
+
+def get_user_version(user_id):
+    """
+    Returns the version of a user's dashboard data (habits and progress).
+    """
+
+    return get_version(get_user_version_key(user_id))
+
+
+async def aget_user_version(user_id):
+    """
+    Async version of `get_user_version()`.
+    """
+
+    return await aget_version(get_user_version_key(user_id))
+
+
+def get_user_version_modified(user_id):
+    """
+    Returns the version of a user's dashboard data, and the time it
+    last changed.
+    """
+
+    return get_version_modified(get_user_version_key(user_id))
+
+
+async def aget_user_version_modified(user_id):
+    """
+    Async version of `get_user_version_modified()`.
+    """
+
+    return await aget_version_modified(get_user_version_key(user_id))
+
+
+def bump_user_version(user_id):
+    """
+    Invalidates everything cached for a user's dashboard.
+    Called on every write to one of the user's habits or their progress.
+    """
+
+    bump_version(get_user_version_key(user_id))
+
+
+def bump_habits_versions(habits):
+    """
+    Bumps the versions of several habits and of their users, once each.
+    Bulk writes don't send model signals, so they call this instead.
+    """
+
+    habits = {habit.id: habit for habit in habits}
+    for habit_id in habits:
+        bump_habit_version(habit_id)
+    for user_id in {habit.user_id for habit in habits.values()}:
+        bump_user_version(user_id)
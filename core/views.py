@@ -1,16 +1,68 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, render
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
 from django.urls import reverse
-from datetime import date, timezone
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from datetime import date
+import io
+import json
 from .models import Habit, Progress
 from .forms import HabitForm
 from .calendars import CustomHTMLCalendar, HabitHTMLCalendar
+from .conditional import conditional_page, get_page_state
+from .dashboard import aget_dashboard, get_dashboard
+from .db.routers import primary, use_primary
+from .events import format_event, get_broker, publish_toggles, streams_events
+from .export import FORMATS, aiter_export, iter_export
+from .imports import ImportFormatError, format_report, import_progress
+from .resolver import aresolve_habit, resolve_habit
+from .stats import get_habit_stats, record_completions, toggle_completion
+from .status import StatusEngine
+from .storage import get_progress_store
+from .timing import histograms
+from .versions import (aget_habit_version_modified, aget_user_version_modified,
+                       get_habit_version_modified, get_user_version_modified)
+
+# Number of habits on the toggleboard (a 3x3 grid)
+TOGGLEBOARD_SIZE = 9
+
+
+def get_homepage_state(request):
+    """
+    Returns the homepage's ETag and Last-Modified time, from the user's
+    version, which is bumped on every write to their habits or progress.
+    """
+
+    if request.user.is_authenticated:
+        version, modified = get_user_version_modified(request.user.id)
+    else:
+        version, modified = None, 0
+    return get_page_state(request, version, modified)
+
+
+async def aget_homepage_state(request):
+    """
+    Async version of `get_homepage_state()`.
+    """
+
+    user = request.user = await request.auser()
+    if user.is_authenticated:
+        version, modified = await aget_user_version_modified(user.id)
+    else:
+        version, modified = None, 0
+    return get_page_state(request, version, modified)
 
 
+@conditional_page(get_homepage_state)
 def homepage(request):
     """
     Homepage view.
@@ -22,34 +74,33 @@ def homepage(request):
 
     Context variables:
     - `habits` - The user's Habit objects.
-    - `progress` - The user's Progress objects for the current day.
-    - `html_calendar` - An instance of CustomHTMLCalendar.
+    - `progress` - Today's status of each habit, as mappings with
+                   `habit`, `date`, `completed` and `color` keys.
+    - `html_calendar` - The month's MasterHTMLCalendar HTML, shaded by
+                        the fraction of habits completed each day.
     - `base_template` - The base template to extend from,
                         depending on whether the request type is htmx or not.
+
+    The habits, statuses and calendar come from a per-user snapshot cache
+    (see `core.dashboard`), so a repeat load costs a single cache read.
+    Unchanged pages get a 304 without rendering (see `core.conditional`).
     """
 
     # Get the current user, year, and month from the request
     user = request.user
-    year = request.GET.get('year', date.today().year)
-    month = request.GET.get('month', date.today().month)
+    year = int(request.GET.get('year', date.today().year))
+    month = int(request.GET.get('month', date.today().month))
 
-    # Check if the user is authenticated
+    # Get the user's dashboard snapshot, usually a single cache read
     if user.is_authenticated:
-        # Get user's habits and progress for the current day
-        habits = Habit.objects.filter(user=user)
-        progress = Progress.objects.filter(
-            habit__user=user,
-            date__year=year,
-            date__month=month,
-            date__day=date.today().day
-        )
+        dashboard = get_dashboard(user, year, month)
     # Otherwise, set habits and progress to empty values
     else:
-        habits = []
-        progress = []
-
-    # Create an instance of CustomHTMLCalendar and format it
-    html_calendar = CustomHTMLCalendar().formatmonth(year, month)
+        dashboard = {
+            'habits': [],
+            'progress': [],
+            'html_calendar': CustomHTMLCalendar().formatmonth(year, month),
+        }
 
     # Determine which base template to extend from based on the request type
     if request.htmx:
@@ -58,9 +109,7 @@ def homepage(request):
         base_template = '_base.html'
 
     context = {
-        'habits': habits,
-        'progress': progress,
-        'html_calendar': html_calendar,
+        **dashboard,
         'base_template': base_template
     }
     return render(
@@ -73,26 +122,83 @@ def homepage(request):
 # Habit views -----------------------------------
 
 
+def get_habit_state(request, habit_slug):
+    """
+    Returns the habit page's ETag and Last-Modified time, from the habit's
+    version, which is bumped on every write to the habit or its progress.
+    """
+
+    habit = resolve_habit(request.user, habit_slug)
+    version, modified = get_habit_version_modified(habit.id)
+    return get_page_state(request, version, modified, habit.id)
+
+
+async def aget_habit_state(request, habit_slug):
+    """
+    Async version of `get_habit_state()`.
+    """
+
+    user = request.user = await request.auser()
+    if not user.is_authenticated:
+        return None
+    habit = await aresolve_habit(user, habit_slug)
+    version, modified = await aget_habit_version_modified(habit.id)
+    return get_page_state(request, version, modified, habit.id)
+
+
+def load_habit_page(habit):
+    """
+    Loads the fields of a resolved habit that only its page shows (the
+    resolver caches the toggle fields) along with its stats, in one query,
+    and returns the stats, building them from its history the first time.
+    """
+
+    page = Habit.objects.select_related('stats').only('description', 'stats').get(id=habit.id)
+    habit.description = page.description
+    if hasattr(page, 'stats'):
+        return page.stats
+    return get_habit_stats(habit)
+
+
+async def aload_habit_page(habit):
+    """
+    Async version of `load_habit_page()`.
+    """
+
+    page = await Habit.objects.select_related('stats').only('description', 'stats').aget(id=habit.id)
+    habit.description = page.description
+    if hasattr(page, 'stats'):
+        return page.stats
+    return await sync_to_async(get_habit_stats)(habit)
+
+
 @login_required
+@conditional_page(get_habit_state)
 def habit(request, habit_slug):
     """
     Habit page view.
 
     Context:
     - `habit` - The Habit object. Contains habit meta data, stats, etc.
+    - `stats` - The habit's HabitStats object (streaks, completion rate),
+                read without scanning the habit's history.
     - `html_calendar` - An instance of HabitHTMLCalendar, reflects
                          the user's progress for this habit over time.
     - `base_template` - The base template to extend from,
                         depending on whether the request type is htmx or not.
+
+    Unchanged pages get a 304 without rendering (see `core.conditional`).
     """
 
-    # Get the habit, year, and month from the request
-    habit = get_object_or_404(Habit, slug=habit_slug)
-    year = request.GET.get('year', date.today().year)
-    month = request.GET.get('month', date.today().month)
+    # Get the habit (already resolved by `get_habit_state`), its page's
+    # fields and its stats, and the year and month from the request
+    habit = resolve_habit(request.user, habit_slug)
+    stats = load_habit_page(habit)
+    year = int(request.GET.get('year', date.today().year))
+    month = int(request.GET.get('month', date.today().month))
 
     # Create an instance of HabitHTMLCalendar and format it
-    html_calendar = HabitHTMLCalendar().formatmonth(year, month)
+    html_calendar = HabitHTMLCalendar(habit).formatmonth(year, month)
 
     # Determine which base template to extend from based on the request type
     if request.htmx:
@@ -102,12 +208,14 @@ def habit(request, habit_slug):
 
     context = {
         'habit': habit,
+        'stats': stats,
         'html_calendar': html_calendar,
         'base_template': base_template,
     }
     return render(request, 'core/habit.html', context)
 
 
+@primary
 @login_required
 def add_habit(request):
     """
@@ -158,43 +266,485 @@ def add_habit(request):
     return render(request, 'core/forms/habit_form.html', context)
 
 
+@primary
 @login_required
 def toggle_habit(request, habit_slug, date=None):
     """
     Toggle habit view.
 
     - Called by clicking a toggler for each habit on a single day.
-    - Updates the habit's completion status in the database.
+    - For POST requests, flips the habit's completion status
+      in the database.
     - Renders a toggler with an updated background color
       based on completion status (white, gray, red, green, or gold).
+    - For calendar cells, also renders the other days of the week whose
+      color changed as out-of-band swaps, and only those.
 
     Context:
     - `habit` - The Habit object. Contains habit meta data, stats, etc.
     - `progress` - Contains data related to the habit's completion status on
                    the provided date, including the color used
                    to render the template background in the DOM.
+    - `label` - The toggler's label, e.g. the day of the month for togglers
+                in the habit calendar. Defaults to the habit's name.
+    - `togglers` - The other cells of the week whose color changed.
+    """
+
+    # Resolved from the in-process habit cache during toggle bursts
+    habit = resolve_habit(request.user, habit_slug)
+    date = date or timezone.localdate()
+    label = request.POST.get('label', request.GET.get('label', ''))
+
+    # Load the week's completions in one query, before any toggle,
+    # so colors before and after it resolve from memory
+    engine = StatusEngine([habit], date)
+    changed = []
+
+    # For POST requests, flip the completion status in the progress store
+    # and update the habit's stats in the same transaction
+    if request.method == 'POST':
+        before = engine.get_week_colors(habit, date)
+        completed = toggle_completion(habit, date)
+        engine.set_completed(habit.id, date, completed)
+        changed = get_changed_days(habit, date, engine, before)
+        # Push the toggled and changed cells to the user's other open tabs
+        # and devices
+        publish_toggles(request.user.id,
+                        [(habit, day) for day in [date, *changed]],
+                        whole_weeks=False)
+
+    context = get_toggle_context(habit, date, label, engine, changed)
+    return render(request, 'core/habit_toggle.html', context)
+
+
+def get_changed_days(habit, date, engine, before):
+    """
+    Returns the other days of the week containing `date` whose color changed
+    since `before` (a mapping of day to color, from
+    `StatusEngine.get_week_colors()`), e.g. turning gold when the weekly rate
+    is reached. At most six days, whatever the size of the month.
     """
 
-    habit = get_object_or_404(Habit, slug=habit_slug)
-    date = date or timezone.now().date()
+    return [
+        day
+        for day, color in engine.get_week_colors(habit, date).items()
+        if day != date and color != before[day]
+    ]
 
-    # Retrieve the Progress object related to the habit and date
+
+def get_toggle_context(habit, date, label, engine, changed=()):
+    """
+    Returns the context of a toggle response: the toggler on `date`, and
+    the `changed` days' cells, to be swapped in out-of-band.
+
+    Changed cells are only sent for calendar cells (`label`), since the
+    toggleboard only shows one day, and only for days of the visible month,
+    i.e. the toggled day's month, since the calendar renders no cells for
+    days of the neighboring months.
+    """
+
+    progress = Progress(habit=habit,
+                        date=date,
+                        completed=engine.is_completed(habit.id, date))
+    engine.bind([progress])
+
+    togglers = []
+    if label:
+        for day in changed:
+            if (day.year, day.month) == (date.year, date.month):
+                togglers.append({
+                    'habit': habit,
+                    'progress': {'date': day, 'color': engine.get_color(habit, day)},
+                    'label': day.day,
+                })
+
+    return {
+        'habit': habit,
+        'progress': progress,
+        'label': label,
+        'togglers': togglers,
+    }
+
+
+@login_required
+def toggleboard(request):
+    """
+    Toggleboard view.
+
+    - Renders the togglers of the user's first TOGGLEBOARD_SIZE habits for
+      today in a single response, from the dashboard snapshot: a single
+      cache read, or one habit query and one batched status query.
+
+    Context:
+    - `togglers` - Today's status of each habit on the board, as mappings
+                   with `habit`, `date`, `completed` and `color` keys.
+    """
+
+    today = date.today()
+    dashboard = get_dashboard(request.user, today.year, today.month)
+    context = {'togglers': dashboard['progress'][:TOGGLEBOARD_SIZE]}
+    return render(request, 'core/habit_toggleboard.html', context)
+
+
+@primary
+@login_required
+@require_POST
+def toggle_habits(request):
+    """
+    Batch toggle habit view.
+
+    - Called to set the completion status of many (habit, date) cells at once,
+      e.g. to back-fill a week of history or check off the whole toggleboard.
+    - Accepts a JSON list of changes, either as the request body
+      (`{"changes": [...]}`) or as a `changes` form field:
+        [{"habit": "wake-up-early", "date": "2024-04-01", "completed": true,
+          "label": "1"}, ...]
+      `label` is optional (see `toggle_habit`).
+    - Checks that the user owns every habit with one query, then writes every
+      change with a single bulk upsert in one transaction, so the number of
+      queries doesn't grow with the size of the batch.
+    - Renders the updated toggler of every affected cell as an
+      out-of-band swap.
+
+    Context:
+    - `togglers` - The habit, progress and label of every affected cell.
+    """
+
+    # Parse the changes, keeping the last change for each cell
     try:
-        progress = habit.Progress.get(date=date)
-    # Or create a new Progress instance if it doesn't exist for this date
-    except Progress.DoesNotExist:
-        progress = Progress.objects.create(habit=habit, date=date)
+        if request.content_type == 'application/json':
+            payload = json.loads(request.body).get('changes', [])
+        else:
+            payload = json.loads(request.POST.get('changes', '[]'))
+        changes = {}
+        for change in payload:
+            cell = (change['habit'], date.fromisoformat(change['date']))
+            changes[cell] = (bool(change['completed']), str(change.get('label', '')))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest('Invalid changes.')
+
+    if not changes:
+        return HttpResponse(status=204)
+
+    # Check that the user owns every habit in the batch with one query
+    slugs = {slug for slug, day in changes}
+    habits = {
+        habit.slug: habit
+        for habit in Habit.objects.filter(user=request.user, slug__in=slugs)
+    }
+    if len(habits) != len(slugs):
+        raise Http404('No Habit matches the given query.')
+
+    days = [day for slug, day in changes]
+    store = get_progress_store()
+
+    with transaction.atomic():
+        # Only write the cells whose status actually changes
+        before = StatusEngine(habits.values(), min(days), max(days))
+        flipped = [
+            (habits[slug], day, completed)
+            for (slug, day), (completed, label) in changes.items()
+            if before.is_completed(habits[slug].id, day) != completed
+        ]
+        if flipped:
+            store.set_many(flipped)
+            record_completions(flipped, store)
+            # Push the changes to the user's other open tabs and devices
+            publish_toggles(request.user.id,
+                            [(habit, day) for habit, day, completed in flipped])
+
+    # Resolve every affected cell's color from the new totals in one query
+    engine = StatusEngine(habits.values(), min(days), max(days))
+    togglers = []
+    for (slug, day), (completed, label) in changes.items():
+        progress = Progress(habit=habits[slug], date=day, completed=completed)
+        engine.bind([progress])
+        togglers.append({
+            'habit': habits[slug],
+            'progress': progress,
+            'label': label,
+        })
+
+    context = {
+        'togglers': togglers,
+    }
+    return render(request, 'core/habit_togglers.html', context)
+
+
+@login_required
+def export_progress(request):
+    """
+    Export view.
+
+    - Streams the user's full progress history as a download, in the format
+      given by the `format` query parameter: `csv` (default), `jsonl`
+      or `json`.
+    - Reads progress through a chunked server-side cursor and sends it as
+      it's read, so memory stays flat whatever the history size, and the
+      first bytes are sent before the query finishes.
+    """
+
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest(f'Unknown export format "{format}".')
+
+    return export_response(iter_export([request.user], format), format)
+
+
+def export_response(chunks, format):
+    """
+    Returns a streaming download response for an export.
+    """
+
+    content_type, extension = FORMATS[format]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="habits-{timezone.localdate().isoformat()}.{extension}"'
+    )
+    return response
+
+
+@primary
+@login_required
+@require_POST
+def upload_progress(request):
+    """
+    Import view.
+
+    - Imports an uploaded progress history file (the `file` field), e.g.
+      from another tracker, in the format given by the `format` field:
+      `csv` (default), `jsonl` or `json`. See `core.imports`.
+    - Streams a plain text progress report line after every batch, and
+      a final one. A malformed record stops the import with an error line;
+      batches written before it are kept, and re-importing the fixed file
+      is safe, since records are upserted on (habit, date).
+    """
+
+    upload = request.FILES.get('file')
+    format = request.POST.get('format', 'csv')
+    if upload is None or format not in FORMATS:
+        return HttpResponseBadRequest('Expected a `file` in csv, jsonl or json `format`.')
+
+    def stream():
+        # Runs after the view returned, and `@primary` with it
+        with use_primary():
+            text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                for report in import_progress(request.user, text, format):
+                    yield format_report(report) + '\n'
+            except ImportFormatError as exc:
+                yield f'Error: {exc}\n'
+
+    return StreamingHttpResponse(stream(), content_type='text/plain')
+
+
+# Async views -----------------------------------
+# Async versions of the hot views, routed instead of the sync ones
+# when `ASYNC_VIEWS` is enabled (the default under ASGI, see asgi.py).
+# Data is read with the async ORM, and calendars are loaded before
+# rendering, so templates never hit the database from the event loop.
+
+
+@conditional_page(aget_homepage_state)
+async def ahomepage(request):
+    """
+    Async version of the homepage view.
+    """
+
+    # Get the current user, year, and month from the request
+    user = request.user = await request.auser()
+    year = int(request.GET.get('year', date.today().year))
+    month = int(request.GET.get('month', date.today().month))
+
+    # Get the user's dashboard snapshot, usually a single cache read
+    if user.is_authenticated:
+        dashboard = await aget_dashboard(user, year, month)
+    # Otherwise, set habits and progress to empty values
+    else:
+        dashboard = {
+            'habits': [],
+            'progress': [],
+            'html_calendar': await CustomHTMLCalendar().aformatmonth(year, month),
+        }
+
+    # Determine which base template to extend from based on the request type
+    if request.htmx:
+        base_template = '_partial.html'
+    else:
+        base_template = '_base.html'
+
+    context = {
+        **dashboard,
+        'base_template': base_template
+    }
+    return render(
+        request,
+        'core/index.html',
+        context
+    )
+
+
+@conditional_page(aget_habit_state)
+async def ahabit(request, habit_slug):
+    """
+    Async version of the habit page view.
+    """
+
+    # Redirect anonymous users to the login page
+    user = request.user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    # Get the habit, its page's fields and its stats, and the year and month
+    # from the request
+    habit = await aresolve_habit(user, habit_slug)
+    stats = await aload_habit_page(habit)
+    year = int(request.GET.get('year', date.today().year))
+    month = int(request.GET.get('month', date.today().month))
+
+    # Create an instance of HabitHTMLCalendar and format it
+    html_calendar = await HabitHTMLCalendar(habit).aformatmonth(year, month)
+
+    # Determine which base template to extend from based on the request type
+    if request.htmx:
+        base_template = '_partial.html'
+    else:
+        base_template = '_base.html'
 
     context = {
         'habit': habit,
-        'progress': progress,
+        'stats': stats,
+        'html_calendar': html_calendar,
+        'base_template': base_template,
     }
-    return render(request, 'core/habit_toggler.html', context)
+    return render(request, 'core/habit.html', context)
+
+
+@primary
+async def atoggle_habit(request, habit_slug, date=None):
+    """
+    Async version of the toggle habit view.
+
+    - The toggle itself runs in a transaction, which the async ORM doesn't
+      support, so it's delegated to a worker thread.
+    """
+
+    # Redirect anonymous users to the login page
+    user = request.user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    habit = await aresolve_habit(user, habit_slug)
+    date = date or timezone.localdate()
+    label = request.POST.get('label', request.GET.get('label', ''))
+
+    # Load the week's completions in one query, before any toggle,
+    # so colors before and after it resolve from memory
+    engine = StatusEngine([habit], date)
+    await engine.aload()
+    changed = []
+
+    # For POST requests, flip the completion status in the progress store
+    # and update the habit's stats in the same transaction
+    if request.method == 'POST':
+        before = engine.get_week_colors(habit, date)
+        completed = await sync_to_async(toggle_completion)(habit, date)
+        engine.set_completed(habit.id, date, completed)
+        changed = get_changed_days(habit, date, engine, before)
+        # Push the toggled and changed cells to the user's other open tabs
+        # and devices
+        await sync_to_async(publish_toggles)(user.id,
+                                             [(habit, day) for day in [date, *changed]],
+                                             whole_weeks=False)
+
+    context = get_toggle_context(habit, date, label, engine, changed)
+    return render(request, 'core/habit_toggle.html', context)
+
+
+async def atoggleboard(request):
+    """
+    Async version of the toggleboard view.
+    """
+
+    user = request.user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    today = date.today()
+    dashboard = await aget_dashboard(user, today.year, today.month)
+    context = {'togglers': dashboard['progress'][:TOGGLEBOARD_SIZE]}
+    return render(request, 'core/habit_toggleboard.html', context)
+
+
+async def aexport_progress(request):
+    """
+    Async version of the export view.
+    """
+
+    user = request.user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest(f'Unknown export format "{format}".')
+
+    # An async iterator, since ASGI would buffer a sync one
+    return export_response(aiter_export([user], format), format)
+
+
+async def events(request):
+    """
+    Event stream view.
+
+    - A server-sent event stream of the user's toggles, made in any of their
+      open tabs or devices, as out-of-band toggler and calendar cell fragments
+      (event `toggle`), swapped in by htmx's SSE extension.
+    - Sends a comment every `EVENTS_KEEPALIVE` seconds to keep idle
+      connections open.
+    - Only served under ASGI, where an idle stream holds no thread. Under
+      WSGI (see `streams_events()`), pages don't open the stream, and
+      requests get a 204.
+    """
+
+    user = await request.auser()
+    # A 204 tells the browser to stop reconnecting
+    if not user.is_authenticated or not streams_events(request):
+        return HttpResponse(status=204)
+
+    keepalive = getattr(settings, 'EVENTS_KEEPALIVE', 15)
+
+    async def stream():
+        async for message in get_broker().subscribe(user.id, keepalive):
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_event(*message)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+def timings(request):
+    """
+    Timings view.
+
+    Staff only. Returns this process's request timing histograms
+    (see `core.timing.ServerTimingMiddleware`) as JSON, per URL name and
+    metric: sql, calendar, template and total times in milliseconds,
+    and query counts.
+    """
+
+    return JsonResponse(histograms.as_dict())
 
 
 # Auth routes -----------------------------------
 
 
+@primary
 def user_login(request):
     """
     Login view.
@@ -229,6 +779,7 @@ def user_login(request):
     return render(request, 'core/forms/login_form.html', context)
 
 
+@primary
 def user_logout(request):
     """
     Logout view.
@@ -244,6 +795,7 @@ def user_logout(request):
     )
 
 
+@primary
 def user_register(request):
     """
     Register view.
@@ -39,20 +39,24 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
+    'core.timing.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'habittracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django templates backend, with renders timed for Server-Timing
+        'BACKEND': 'core.timing.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -61,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.events',
             ],
         },
     },
@@ -68,21 +73,130 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'habittracker.wsgi.application'
 
+# Serve the homepage, habit page and togglers with async views.
+# Enabled by default by the ASGI entry point (see asgi.py).
+ASYNC_VIEWS = bool(os.environ.get('ASYNC_VIEWS'))
+
+
+# Report SQL, calendar, template and total times in a Server-Timing header,
+# and record them in per URL name histograms (see core.timing).
+SERVER_TIMING = bool(os.environ.get('SERVER_TIMING'))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are pooled per process by `core.db.pooled` (for both the WSGI
+# and ASGI entry points), so requests skip the TCP and auth handshake.
+# Set DB_ENGINE=django.db.backends.postgresql to open one per request instead.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': os.environ.get('DB_ENGINE', 'core.db.pooled'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+            # Seconds before idle connections above MIN_SIZE are closed
+            'IDLE_TIMEOUT': int(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+            # Ping idle connections before handing them out
+            'HEALTH_CHECKS': True,
+            # Seconds to wait for a free connection when all are in use
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            # Called with the pool's stats and wait time after every checkout
+            'STATS_HOOK': 'core.timing.record_pool_stats',
+        },
     }
 }
 
+# Read replicas, as comma-separated host:port pairs, e.g.
+# DB_REPLICA_HOSTS=10.0.0.2:5432,10.0.0.3:5432. Each one gets a
+# `replica_<n>` alias with the primary's other settings. To try it locally,
+# run a second server streaming from the first, e.g. on port 5433.
+for number, address in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or '5432',
+        # Tests read the test database through the replica aliases
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Aliases reads are spread over (see core.db.routers)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['core.db.routers.PrimaryReplicaRouter']
+
+# Number of seconds reads stick to the primary after a write, to cover
+# replication lag: for the browser that wrote, and for its user's data.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Cached pages are invalidated by version counters stored in the cache
+# (see core.versions), so every process must share it: the local-memory
+# default only suits a single process, e.g. runserver, and fails
+# `manage.py check --deploy` (core.E001). In production, use Redis:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379
+# or, on a single host, the file-based backend:
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# CACHE_LOCATION=/var/tmp/habittracker_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'habittracker'),
+    }
+}
+
+# Number of seconds rendered calendar months other than the current one
+# are cached for. They're invalidated by version on every progress write.
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+
+# Live updates
+# Broker delivering toggles to every open event stream of a user.
+# `core.events.LocalBroker` only reaches streams served by the same process.
+
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'core.events.LocalBroker')
+
+# Number of seconds between keepalive comments on idle event streams
+EVENTS_KEEPALIVE = 15
+
+
+# Habit cache
+# Size of each process's LRU cache of habits resolved by (user, slug),
+# and the number of seconds entries live. Entries are dropped as soon as
+# a habit is saved or deleted in the same process, and the timeout bounds
+# how long other processes can serve a stale habit.
+
+HABIT_CACHE_SIZE = 1024
+HABIT_CACHE_TIMEOUT = 60
+
+
+# Page caching
+# Number of seconds browsers may reuse the homepage and habit pages of past
+# months (e.g. on history navigation) without revalidating them.
+# Pages of the current month are always revalidated (see core.conditional).
+
+PAST_MONTH_MAX_AGE = 300
+
+
+# Progress storage
+# `core.storage.RowProgressStore` - one Progress row per habit per day.
+# `core.storage.BitmapProgressStore` - one 366-bit mask per habit per year.
+# `core.storage.TieredProgressStore` - rows, except for the years archived
+# by `manage.py archive_progress`, read from masks.
+
+PROGRESS_STORE = os.environ.get('PROGRESS_STORE', 'core.storage.RowProgressStore')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -130,6 +244,24 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# Directory collectstatic writes to, served by core.staticfiles.StaticFilesMiddleware
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Content-hashed file names, with gzip and brotli variants written
+# at collectstatic time
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Number of seconds browsers may cache static files requested by their
+# original name. Hashed names are cached for a year, as immutable.
+STATIC_MAX_AGE = 300
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field